@@ -0,0 +1,111 @@
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+
+from models.gemini_cache import gemini_cache, make_cache_key
+from models.gemini_client import gemini_client
+
+logger = logging.getLogger(__name__)
+
+# Bump when the summary prompt changes so cached summaries are not reused
+SUMMARY_PROMPT_VERSION = 'summary-v1'
+
+
+def _score_category(total_score):
+    # Create a categorization based on total score
+    if total_score >= 8:
+        return "excellent"
+    elif total_score >= 6:
+        return "good"
+    elif total_score >= 4:
+        return "moderate"
+    return "poor"
+
+
+def _summary_prompt(ingredients_list, nutrition_data, ingredients_score, nutrition_score, total_score):
+    """The Gemini prompt for an analysis summary"""
+    # Prepare data for the prompt
+    ingredients_text = ", ".join(ingredients_list) if isinstance(ingredients_list, list) else str(ingredients_list)
+    nutrition_text = json.dumps(nutrition_data, indent=2)
+    category = _score_category(total_score)
+    
+    # Create the prompt for Gemini AI
+    return f"""
+        As a nutritional expert, analyze the following food product based on its ingredients and nutrition facts.
+        
+        Ingredients: {ingredients_text}
+        
+        Nutrition Facts: {nutrition_text}
+        
+        Model Scores:
+        - Ingredients Quality Score: {ingredients_score:.2f}/10
+        - Nutritional Value Score: {nutrition_score:.2f}/10
+        - Overall Health Score: {total_score:.2f}/10
+        - General Category: {category}
+        
+        Generate a 2-3 sentence analysis summary that explains:
+        1. Why this product received its score
+        2. Key concerns or benefits from ingredients
+        3. A brief recommendation based on the nutritional profile
+        
+        Keep the summary concise, factual, and actionable.
+        """
+
+
+def _store_summary(cache_key, summary):
+    # An empty answer is a failure, not a summary: the caller falls back and marks it failed
+    if not summary:
+        raise ValueError('Gemini returned an empty analysis summary')
+
+    gemini_cache.set(cache_key, summary)
+    return summary
+
+
+def generate_analysis_summary(ingredients_list, nutrition_data, ingredients_score, nutrition_score, total_score):
+    """
+    Generate an analysis summary using Gemini AI based on ingredients list, 
+    nutrition data, and scoring from our models.
+    
+    Args:
+        ingredients_list: List of ingredients extracted
+        nutrition_data: Dictionary of nutrition values
+        ingredients_score: Score from ingredients model
+        nutrition_score: Score from nutrition model
+        total_score: Overall calculated score
+        
+    Returns:
+        str: An analysis summary explaining the score and health implications
+
+    Raises:
+        Exception: if no summary could be generated (GeminiUnavailable, the
+        call's own error, an empty answer); callers store a fallback text
+        with summary_status FAILED so the summary is retried later
+    """
+    prompt = _summary_prompt(ingredients_list, nutrition_data, ingredients_score, nutrition_score, total_score)
+    
+    # The prompt holds every input of the summary, so it is the cache key
+    cache_key = make_cache_key(SUMMARY_PROMPT_VERSION, text=prompt)
+    summary = gemini_cache.get(cache_key)
+    if summary is not None:
+        logger.info("Using cached analysis summary")
+        return summary
+    
+    # Generate response from Gemini
+    return _store_summary(cache_key, gemini_client.generate(prompt))
+
+
+async def generate_analysis_summary_async(ingredients_list, nutrition_data, ingredients_score, nutrition_score,
+                                          total_score):
+    """generate_analysis_summary on the async Gemini client; same arguments, result and errors"""
+    prompt = _summary_prompt(ingredients_list, nutrition_data, ingredients_score, nutrition_score, total_score)
+    
+    # The cache is SQLite: its reads and writes run off the event loop
+    cache_key = make_cache_key(SUMMARY_PROMPT_VERSION, text=prompt)
+    summary = await sync_to_async(gemini_cache.get, thread_sensitive=False)(cache_key)
+    if summary is not None:
+        logger.info("Using cached analysis summary")
+        return summary
+    
+    summary = await gemini_client.generate_async(prompt)
+    return await sync_to_async(_store_summary, thread_sensitive=False)(cache_key, summary)
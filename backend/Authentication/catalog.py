@@ -0,0 +1,141 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from models.barcodes import barcode_reader
+from .models import History, ProductCatalogEntry
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogStats:
+    """Counts barcode lookups in the product catalog and the entries added by scans"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.added = 0
+
+    def record_lookup(self, hit):
+        with self._lock:
+            self.lookups += 1
+            self.hits += hit
+
+    def record_added(self):
+        with self._lock:
+            self.added += 1
+
+    def stats(self):
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            'added': self.added,
+            'barcodes': barcode_reader.stats(),
+        }
+
+
+catalog_stats = CatalogStats()
+
+
+def catalog_enabled():
+    return settings.PRODUCT_CATALOG_ENABLED and barcode_reader.available
+
+
+def find_barcode(*labels):
+    """GTIN of the first label image (LabelImage) with a readable product barcode, or None"""
+    for label in labels:
+        barcode = barcode_reader.read(label.decode())
+        if barcode:
+            logger.info(f"Found barcode {barcode} on {label.name}")
+            return barcode
+    return None
+
+
+def lookup_product(barcode):
+    """The catalog entry of a barcode, counted as a hit, or None"""
+    entry = ProductCatalogEntry.objects.select_related('nutrition', 'source_history').filter(barcode=barcode).first()
+    catalog_stats.record_lookup(hit=entry is not None)
+    if entry is not None:
+        ProductCatalogEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1)
+    return entry
+
+
+def catalog_summary(entry):
+    """
+    The entry's analysis summary, copied over from the scan that created it
+    once that scan's background summary has been written; None until then.
+
+    Only a summary Gemini actually wrote (status READY) is copied: a failed
+    one holds the fallback text, and the entry then takes its summary from
+    the next scan of the product instead.
+    """
+    if entry.analysis_summary:
+        return entry.analysis_summary
+    source = entry.source_history
+    if source is not None:
+        source.refresh_from_db(fields=['analysis_summary', 'summary_status'])
+        if source.summary_status == History.SUMMARY_READY and source.analysis_summary:
+            entry.analysis_summary = source.analysis_summary
+            ProductCatalogEntry.objects.filter(pk=entry.pk).update(analysis_summary=entry.analysis_summary)
+            return entry.analysis_summary
+        if source.summary_status == History.SUMMARY_FAILED:
+            entry.source_history = None
+            ProductCatalogEntry.objects.filter(pk=entry.pk).update(source_history=None)
+    return None
+
+
+def refresh_summaries(entries):
+    """
+    Drop the analysis summaries of catalog entries (a queryset); each is
+    taken again from the next scan of its product.
+
+    Returns:
+        int: number of entries updated
+    """
+    return entries.update(analysis_summary=None, source_history=None)
+
+
+def rescore_entry(entry, model_version, ingredients_score, nutrition_score):
+    """Store scores of newer scoring models; the summary explained the old ones, so it is dropped"""
+    entry.ingredients_score = ingredients_score
+    entry.nutrition_score = nutrition_score
+    entry.model_version = model_version
+    entry.analysis_summary = None
+    entry.source_history = None
+    entry.save(update_fields=[
+        'ingredients_score', 'nutrition_score', 'model_version', 'analysis_summary', 'source_history', 'updated_at',
+    ])
+
+
+def add_product(barcode, ingredients_list, nutrition_result, ingredients_score, nutrition_score, model_version,
+                history_id):
+    """
+    Add a product after a successful scan. An entry that already exists, e.g.
+    one added by a concurrent scan of the same product, is left as it is.
+    """
+    try:
+        with transaction.atomic():
+            _, created = ProductCatalogEntry.objects.get_or_create(
+                barcode=barcode,
+                defaults={
+                    'ingredients': ingredients_list,
+                    'nutrition': nutrition_result,
+                    'ingredients_score': ingredients_score,
+                    'nutrition_score': nutrition_score,
+                    'model_version': model_version,
+                    'source_history_id': history_id,
+                },
+            )
+    except IntegrityError:
+        created = False
+    except Exception as e:
+        logger.error(f"Failed to add barcode {barcode} to the product catalog: {str(e)}")
+        return
+    if created:
+        catalog_stats.record_added()
+        logger.info(f"Added barcode {barcode} to the product catalog")
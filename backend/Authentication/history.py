@@ -0,0 +1,106 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import History
+
+# Response field -> History columns it needs
+HISTORY_FIELDS = {
+    'id': ['id'],
+    'created_at': ['created_at'],
+    'scores': ['ingredients_result', 'nutrition_result', 'total_result'],
+    'nutrition_data': ['nutrition_data'],
+    'ingredients_data': ['ingredients_data'],
+    'analysis_summary': ['analysis_summary'],
+    'summary_status': ['summary_status'],
+    'model_version': ['model_version'],
+}
+
+
+class HistoryQueryError(ValueError):
+    """Invalid user-history query parameter; the message is reported to the client"""
+
+
+def parse_fields(fields_param):
+    """
+    Parse the ``fields=`` projection (comma-separated HISTORY_FIELDS keys).
+
+    Returns:
+        list: requested fields in HISTORY_FIELDS order; all fields if none requested
+    """
+    if not fields_param:
+        return list(HISTORY_FIELDS)
+    requested = {field.strip() for field in fields_param.split(',') if field.strip()}
+    unknown = requested - set(HISTORY_FIELDS)
+    if unknown:
+        raise HistoryQueryError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+    return [field for field in HISTORY_FIELDS if field in requested]
+
+
+def encode_cursor(record):
+    """Opaque cursor pointing just after ``record`` in (-created_at, -id) order"""
+    raw = f"{record.created_at.isoformat()}|{record.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, record_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HistoryQueryError('Invalid cursor')
+
+
+def history_page(user, limit, cursor=None, fields=None, start_date=None, end_date=None):
+    """
+    One page of a user's history, most recent first.
+
+    Pages are keyset-paginated on (created_at, id): the cursor carries the
+    last row of the previous page, so every page is an index range scan on
+    (user, created_at, id) however deep it is, instead of an OFFSET scan.
+    Only the columns behind the requested ``fields`` are loaded.
+
+    Returns:
+        tuple: (list of serialized records, next cursor or None)
+    """
+    fields = fields or list(HISTORY_FIELDS)
+    columns = {'id', 'created_at'}
+    for field in fields:
+        columns.update(HISTORY_FIELDS[field])
+
+    query = History.objects.filter(user=user)
+    if start_date:
+        query = query.filter(created_at__gte=start_date)
+    if end_date:
+        query = query.filter(created_at__lte=end_date)
+    if cursor:
+        created_at, record_id = decode_cursor(cursor)
+        # The plain created_at bound lets the database start the index range at the cursor;
+        # the OR alone is evaluated row by row from the top of the index
+        query = query.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(id__lt=record_id)
+        )
+
+    # One extra row tells whether there is a next page
+    records = list(query.order_by('-created_at', '-id').only(*columns)[:limit + 1])
+    next_cursor = encode_cursor(records[limit - 1]) if len(records) > limit else None
+    return [serialize_history(record, fields) for record in records[:limit]], next_cursor
+
+
+def serialize_history(record, fields):
+    data = {}
+    for field in fields:
+        if field == 'created_at':
+            data['created_at'] = record.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        elif field == 'scores':
+            data['scores'] = {
+                'ingredients': record.ingredients_result,
+                'nutrition': record.nutrition_result,
+                'total': record.total_result
+            }
+        else:
+            data[field] = getattr(record, field)
+    return data
@@ -0,0 +1,165 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ScanJob
+from .pipeline import ScanError, run_scan
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_scan(user, ingredients_image, nutrition_image, profile=None):
+    """Store the uploaded images and queue a scan job for the workers"""
+    job = ScanJob.objects.create(
+        user=user,
+        ingredients_image=ingredients_image,
+        nutrition_image=nutrition_image,
+        preprocessing_profile=profile,
+    )
+    logger.info(f"Queued scan job {job.id} for {user.email}")
+    return job
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically move the oldest queued job to running and return it.
+
+    The claim is a conditional UPDATE on ``status``, so when several workers
+    race for the same row exactly one of them gets it, on any database backend.
+
+    Returns:
+        ScanJob or None if the queue is empty
+    """
+    candidates = list(
+        ScanJob.objects.filter(status=ScanJob.STATUS_QUEUED)
+        .order_by('created_at')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        claimed = ScanJob.objects.filter(id=job_id, status=ScanJob.STATUS_QUEUED).update(
+            status=ScanJob.STATUS_RUNNING,
+            worker=worker_id,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ScanJob.objects.select_related('user').get(id=job_id)
+    return None
+
+
+def process_job(job):
+    """Run the scan pipeline for a claimed job and record the outcome"""
+    logger.info(f"Processing scan job {job.id} (attempt {job.attempts})")
+    try:
+        result = run_scan(job.user, job.ingredients_image, job.nutrition_image, job.preprocessing_profile)
+        job.status = ScanJob.STATUS_SUCCEEDED
+        job.result = result
+        job.history_id = result.get('history_id')
+    except ScanError as e:
+        job.status = ScanJob.STATUS_FAILED
+        job.error = e.message
+    except Exception as e:
+        logger.error(f"Scan job {job.id} failed: {str(e)}", exc_info=True)
+        job.status = ScanJob.STATUS_FAILED
+        job.error = f'Unexpected error: {str(e)}'
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'history', 'finished_at'])
+    _discard_images(job)
+    return job
+
+
+def _discard_images(job):
+    """
+    The job's uploads are only needed for the scan: the OCRResult row stores
+    its own copy of the ingredients image if SCAN_UPLOAD_RETENTION keeps it,
+    as in result_api
+    """
+    for field, cleared in (('ingredients_image', ''), ('nutrition_image', None)):
+        image = getattr(job, field)
+        if not image:
+            continue
+        try:
+            image.delete(save=False)
+            ScanJob.objects.filter(id=job.id).update(**{field: cleared})
+        except Exception as e:
+            logger.warning(f"Could not delete {field.replace('_', ' ')} of scan job {job.id}: {str(e)}")
+
+
+def requeue_stale_jobs():
+    """
+    Recover jobs whose worker died mid-scan.
+
+    Jobs running for longer than SCAN_JOB_TIMEOUT seconds are queued again,
+    or failed once they have used up SCAN_JOB_MAX_ATTEMPTS.
+
+    Returns:
+        int: number of jobs recovered
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.SCAN_JOB_TIMEOUT)
+    stale = ScanJob.objects.filter(status=ScanJob.STATUS_RUNNING, started_at__lt=cutoff)
+
+    failed = stale.filter(attempts__gte=settings.SCAN_JOB_MAX_ATTEMPTS).update(
+        status=ScanJob.STATUS_FAILED,
+        error='Scan job timed out',
+        finished_at=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=settings.SCAN_JOB_MAX_ATTEMPTS).update(
+        status=ScanJob.STATUS_QUEUED,
+        worker=None,
+        started_at=None,
+    )
+    if failed or requeued:
+        logger.warning(f"Recovered stale scan jobs: {requeued} requeued, {failed} failed")
+    return failed + requeued
+
+
+def run_worker(worker_id, poll_interval, should_stop, once=False):
+    """
+    Process queued jobs until ``should_stop()`` returns True.
+
+    Args:
+        worker_id: Name recorded on claimed jobs
+        poll_interval: Seconds to sleep when the queue is empty
+        should_stop: Callable checked between jobs
+        once: Exit as soon as the queue is empty
+    """
+    processed = 0
+    last_recovery = 0.0
+    while not should_stop():
+        close_old_connections()
+        if time.monotonic() - last_recovery >= poll_interval * 30:
+            requeue_stale_jobs()
+            last_recovery = time.monotonic()
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        process_job(job)
+        processed += 1
+    close_old_connections()
+    return processed
+
+
+def job_payload(job):
+    """Serialize a job for the status endpoint"""
+    data = {
+        'success': True,
+        'job_id': str(job.id),
+        'status': job.status,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'started_at': job.started_at.strftime('%Y-%m-%d %H:%M:%S') if job.started_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None,
+    }
+    if job.status == ScanJob.STATUS_SUCCEEDED:
+        data['result'] = job.result
+    elif job.status == ScanJob.STATUS_FAILED:
+        data['error'] = job.error
+    return data
@@ -0,0 +1,116 @@
+import csv
+import os
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from models.flat_forest import flatten_forest, parity_rows
+from models.model_store import model_store
+from models.scoring import NUTRITION_FEATURES
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the flattened scoring forests against sklearn's predict, on rows that "
+        "hit the split thresholds and on the dataset's ingredient lists, and compare "
+        "their latency for batch sizes from 1 to 10k rows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parity-rows', type=int, default=2000, help='Rows compared with predict per model')
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000], help='Batch sizes')
+        parser.add_argument('--repeats', type=int, default=100, help='Most batches timed per size (at least 5)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        bundle = model_store.get()
+        rng = np.random.default_rng(options['seed'])
+        failed = False
+        for name, model, forest in (
+            ('ingredients', bundle.ingredients_model, bundle.ingredients_forest),
+            ('nutrition', bundle.nutrition_model, bundle.nutrition_forest),
+        ):
+            if forest is None:
+                started = time.perf_counter()
+                forest = flatten_forest(model)
+                if forest is None:
+                    self.stderr.write(f"{name}: {type(model).__name__} cannot be flattened, skipping")
+                    continue
+                self.stdout.write(f"{name}: flattened in {time.perf_counter() - started:.2f}s (ML_FLAT_FORESTS is off)")
+            self.stdout.write(
+                f"\n{name}: {forest.n_trees} trees, {len(forest)} nodes, max depth {forest.max_depth}, "
+                f"{len(forest.features)} of {forest.n_features_in} features used, {forest.nbytes() / 1048576:.1f} MiB"
+            )
+
+            samples = {'threshold rows': parity_rows(forest, options['parity_rows'], rng)}
+            if name == 'ingredients':
+                samples['dataset rows'] = bundle.vectorizer.transform(self._ingredient_texts(options['parity_rows']))
+            for label, X in samples.items():
+                failed |= not self._parity(model, forest, name, label, X)
+            self._latency(model, forest, name, parity_rows(forest, max(options['sizes']), rng), options)
+
+        if failed:
+            raise CommandError('Flattened forest predictions differ from sklearn')
+
+    def _ingredient_texts(self, count):
+        path = os.path.join(settings.BASE_DIR, 'ml_files', 'dataset', 'Ingredients.csv')
+        with open(path, newline='', encoding='utf-8') as dataset:
+            return [row['Ingredient'] for _, row in zip(range(count), csv.DictReader(dataset))]
+
+    def _inputs(self, name, X):
+        """The batch as ScoringEngine hands it to sklearn and to the flat forest"""
+        if name == 'nutrition':
+            rows = X.toarray()
+            return lambda: pd.DataFrame(rows, columns=NUTRITION_FEATURES), rows
+        return lambda: X, X
+
+    def _parity(self, model, forest, name, label, X):
+        sklearn_input, flat_input = self._inputs(name, X)
+        expected = np.asarray(model.predict(sklearn_input()), dtype=float)
+        found = forest.predict(flat_input)
+        exact = np.all(expected.reshape(len(found), -1) == found.reshape(len(found), -1), axis=1)
+        difference = float(np.max(np.abs(expected - found), initial=0.0))
+        self.stdout.write(
+            f"  parity on {len(found)} {label}: {np.count_nonzero(exact)} identical, max difference {difference:.3g}"
+        )
+        return bool(exact.all())
+
+    def _latency(self, model, forest, name, X, options):
+        self.stdout.write(
+            f"  {'rows':>6} {'sklearn ms':>11} {'p99':>8} {'flat ms':>9} {'p99':>8} {'speedup':>8}"
+        )
+        fastest = None
+        for size in options['sizes']:
+            batch = X[:size]
+            sklearn_input, flat_input = self._inputs(name, batch)
+            repeats = max(5, min(options['repeats'], 10000 // size))
+            timings = {'sklearn': [], 'flat': []}
+            for _ in range(repeats):
+                started = time.perf_counter()
+                model.predict(sklearn_input())
+                timings['sklearn'].append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                forest.predict(flat_input)
+                timings['flat'].append((time.perf_counter() - started) * 1000)
+
+            sklearn_ms, flat_ms = statistics.mean(timings['sklearn']), statistics.mean(timings['flat'])
+            if flat_ms < sklearn_ms:
+                fastest = size
+            self.stdout.write(
+                f"  {size:>6} {sklearn_ms:>11.2f} {_percentile(timings['sklearn'], 0.99):>8.2f} "
+                f"{flat_ms:>9.2f} {_percentile(timings['flat'], 0.99):>8.2f} {sklearn_ms / flat_ms:>7.1f}x"
+            )
+        if fastest is not None:
+            self.stdout.write(
+                f"  flat forest faster up to {fastest} rows of the sizes tried "
+                f"(ML_FLAT_FOREST_MAX_ROWS is {settings.ML_FLAT_FOREST_MAX_ROWS})"
+            )
@@ -0,0 +1,167 @@
+import csv
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rapidfuzz import fuzz, process
+
+from models.ingredient_lexicon import fix_ocr_digits, ingredient_lexicon, normalize_ingredient, split_ingredient_list
+from models.stand_ins import StubIngredientExtractor
+
+# Characters OCR commonly reads as another
+CONFUSIONS = {
+    'l': ['1', 'i', 'I'], 'i': ['l', '1'], 'o': ['0', 'c'], 'e': ['c', 'o'], 'a': ['o', 'e'], 'c': ['e', 'o'],
+    's': ['5'], 'h': ['b', 'n'], 'n': ['h', 'r'], 'u': ['v', 'n'], 'r': ['n'], 't': ['f', 'l'], 'g': ['q', '9'],
+}
+
+
+def ocr_noise(text, rng, rate):
+    """``text`` with OCR-like errors: confused, dropped and doubled characters, split and merged words"""
+    noisy = []
+    for character in text:
+        if rng.random() >= rate:
+            noisy.append(character)
+            continue
+        if character == ' ':
+            # Merge with the next word
+            continue
+        error = rng.random()
+        if error < 0.5 and character in CONFUSIONS:
+            noisy.append(rng.choice(CONFUSIONS[character]))
+        elif error < 0.7:
+            pass
+        elif error < 0.85:
+            noisy.append(character * 2)
+        else:
+            noisy.append(character + ' ')
+    return ''.join(noisy)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the ingredient lexicon on OCR-like corruptions of the dataset's "
+        "ingredient lists: per-item correction accuracy and latency against a "
+        "brute-force RapidFuzz match over every ingredient name, and per-label "
+        "agreement with the clean text and the share of labels that skip Gemini"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=5000, help='Corrupted ingredients to resolve')
+        parser.add_argument('--labels', type=int, default=1000, help='Corrupted ingredient lists to clean')
+        parser.add_argument('--error-rate', type=float, default=0.05, help='Chance of an OCR error per character')
+        parser.add_argument('--brute-force', type=int, default=500, help='Items also matched against every name')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['items'] < 1 or options['labels'] < 1:
+            raise CommandError('--items and --labels must be positive')
+        started = time.perf_counter()
+        lexicon = ingredient_lexicon.get()
+        if lexicon is None:
+            raise CommandError(f"Ingredient lexicon not available: {ingredient_lexicon.last_error or 'disabled'}")
+        self.stdout.write(
+            f"Lexicon: {len(lexicon.names)} ingredient names, {len(lexicon.words)} words, "
+            f"built in {time.perf_counter() - started:.2f}s"
+        )
+
+        with open(ingredient_lexicon.config['PATH'], newline='', encoding='utf-8') as dataset:
+            rows = [row.get('Ingredient') or '' for row in csv.DictReader(dataset)]
+        rng = random.Random(options['seed'])
+        self._benchmark_items(lexicon, rows, rng, options)
+        self._benchmark_labels(rows, rng, options)
+
+    def _benchmark_items(self, lexicon, rows, rng, options):
+        # Names drawn as often as they appear in the dataset, so common ingredients weigh more
+        known = set(lexicon.names)
+        occurrences = [item for row in rows for item in split_ingredient_list(row) if item in known]
+        originals = [rng.choice(occurrences) for _ in range(options['items'])]
+        noisy = [ocr_noise(original, rng, options['error_rate']) for original in originals]
+
+        timings, restored, wrong, unresolved, untouched = [], 0, 0, 0, 0
+        for original, text in zip(originals, noisy):
+            started = time.perf_counter()
+            item, resolved = lexicon.resolve(text)
+            timings.append((time.perf_counter() - started) * 1e6)
+            untouched += normalize_ingredient(text) == original
+            if item == original:
+                restored += 1
+            elif resolved:
+                wrong += 1
+            else:
+                unresolved += 1
+
+        count = len(originals)
+        self.stdout.write(
+            f"\n{count} ingredients, {options['error_rate']:.0%} character error rate: "
+            f"{untouched / count:.1%} still correct after OCR"
+        )
+        self.stdout.write(
+            f"lexicon: {restored / count:.1%} restored, {wrong / count:.1%} mapped to another name, "
+            f"{unresolved / count:.1%} left unresolved"
+        )
+        self._timing_table('lexicon', timings, count)
+
+        sample = min(options['brute_force'], count)
+        if sample:
+            timings, restored = [], 0
+            for original, text in zip(originals[:sample], noisy[:sample]):
+                started = time.perf_counter()
+                match = process.extractOne(
+                    normalize_ingredient(text), lexicon.names, scorer=fuzz.ratio, score_cutoff=lexicon.min_similarity,
+                )
+                timings.append((time.perf_counter() - started) * 1e6)
+                restored += match is not None and match[0] == original
+            self.stdout.write(f"brute force over every name: {restored / sample:.1%} restored")
+            self._timing_table('brute force', timings, sample)
+
+    def _timing_table(self, name, timings, count):
+        self.stdout.write(
+            f"  {name:<12} {count / (sum(timings) / 1e6):>10.0f} items/s  mean {statistics.mean(timings):.1f} us  "
+            f"p50 {_percentile(timings, 0.5):.1f} us  p99 {_percentile(timings, 0.99):.1f} us"
+        )
+
+    def _benchmark_labels(self, rows, rng, options):
+        extractor = StubIngredientExtractor()
+        labels = [row for row in rng.sample(rows, min(options['labels'], len(rows))) if row.strip()]
+
+        timings, identical, matching_items, total_items, skipped = [], 0, 0, 0, 0
+        # Item recovery of the labels that would skip Gemini, i.e. what users get without it
+        skipped_matching = skipped_items = 0
+        for row in labels:
+            expected, _ = ingredient_lexicon.clean(extractor.parse_ingredients(f"INGREDIENTS: {row}"))
+            text = f"INGREDIENTS: {ocr_noise(row, rng, options['error_rate'])}"
+            # What IngredientExtractor.ingredients_from_lexicon does, keeping the result either way
+            started = time.perf_counter()
+            cleaned, confident = ingredient_lexicon.clean(extractor.parse_ingredients(fix_ocr_digits(text)))
+            timings.append((time.perf_counter() - started) * 1000)
+
+            identical += cleaned == expected
+            remaining = list(expected)
+            matching = 0
+            for item in cleaned:
+                if item in remaining:
+                    remaining.remove(item)
+                    matching += 1
+            matching_items += matching
+            total_items += len(expected)
+            if confident:
+                skipped += 1
+                skipped_matching += matching
+                skipped_items += len(expected)
+
+        count = len(labels)
+        self.stdout.write(
+            f"\n{count} ingredient lists: {skipped / count:.1%} would skip Gemini, {identical / count:.1%} "
+            f"cleaned exactly as their clean text, {matching_items / max(total_items, 1):.1%} of items recovered "
+            f"({skipped_matching / max(skipped_items, 1):.1%} on the lists that skip Gemini)"
+        )
+        self.stdout.write(
+            f"  parse + clean: mean {statistics.mean(timings):.2f} ms  p50 {_percentile(timings, 0.5):.2f} ms  "
+            f"p99 {_percentile(timings, 0.99):.2f} ms"
+        )
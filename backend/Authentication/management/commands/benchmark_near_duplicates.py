@@ -0,0 +1,119 @@
+import statistics
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from Authentication.near_duplicates import near_duplicate_config
+from models.perceptual_hash import HASH_BITS, HASH_METHODS, HammingIndex, _popcount, image_hash
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def _variants(image):
+    """Edits a second photo of the same label, or a re-upload, typically goes through"""
+    height, width = image.shape[:2]
+    jpeg = lambda quality: cv2.imdecode(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1], cv2.IMREAD_COLOR)
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), 2, 1.0)
+    return {
+        'jpeg q60': jpeg(60),
+        'half size': cv2.resize(image, (width // 2, height // 2), interpolation=cv2.INTER_AREA),
+        'brighter': cv2.convertScaleAbs(image, alpha=1.1, beta=20),
+        'crop 5%': image[height // 20:height - height // 20, width // 20:width - width // 20],
+        'rotate 2deg': cv2.warpAffine(image, rotation, (width, height), borderMode=cv2.BORDER_REPLICATE),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the near-duplicate perceptual hash index: lookup latency and hit "
+        "rate at --size stored hashes against a brute-force scan, and optionally the "
+        "hash distance of label images under typical re-photo edits"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1_000_000, help='Stored hashes')
+        parser.add_argument('--queries', type=int, default=2000, help='Timed lookups')
+        parser.add_argument('--max-distance', type=int, help='Defaults to NEAR_DUPLICATE_SCANS MAX_DISTANCE')
+        parser.add_argument(
+            '--near-fraction', type=float, default=0.5,
+            help='Share of queries derived from a stored hash (0 to 2x max-distance bits flipped); the rest are random',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--images', nargs='*', default=[], help='Label images to measure hash robustness on')
+
+    def handle(self, *args, **options):
+        max_distance = options['max_distance']
+        if max_distance is None:
+            max_distance = near_duplicate_config()['MAX_DISTANCE']
+        if options['size'] < 1 or options['queries'] < 1:
+            raise CommandError('--size and --queries must be positive')
+
+        self._benchmark_index(options['size'], options['queries'], max_distance, options['near_fraction'], options['seed'])
+        if options['images']:
+            self._robustness(options['images'], max_distance)
+
+    def _benchmark_index(self, size, query_count, max_distance, near_fraction, seed):
+        rng = np.random.default_rng(seed)
+        values = rng.integers(0, np.iinfo(np.uint64).max, size, dtype=np.uint64, endpoint=True)
+
+        index = HammingIndex(max_distance)
+        started = time.perf_counter()
+        index.extend(np.arange(size), values)
+        build_seconds = time.perf_counter() - started
+
+        queries = []
+        for _ in range(query_count):
+            if rng.random() < near_fraction:
+                value = int(values[rng.integers(size)])
+                for bit in rng.choice(HASH_BITS, size=rng.integers(0, 2 * max_distance + 1), replace=False):
+                    value ^= 1 << int(bit)
+            else:
+                value = int(rng.integers(0, np.iinfo(np.uint64).max, dtype=np.uint64, endpoint=True))
+            queries.append(value)
+
+        index_ms, scan_ms = [], []
+        hits = mismatches = 0
+        for value in queries:
+            started = time.perf_counter()
+            found = index.search(value)
+            index_ms.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            expected = np.flatnonzero(_popcount(values ^ np.uint64(value)) <= max_distance)
+            scan_ms.append((time.perf_counter() - started) * 1000)
+
+            hits += bool(found)
+            mismatches += sorted(key for _, key in found) != expected.tolist()
+
+        self.stdout.write(
+            f"{size} hashes, max distance {max_distance} ({max_distance + 1} blocks): "
+            f"built in {build_seconds:.2f}s, {index.nbytes() / 1048576:.0f} MiB"
+        )
+        self.stdout.write(
+            f"{query_count} lookups, {near_fraction:.0%} near a stored hash: hit rate {hits / query_count:.1%}, "
+            f"{mismatches} result(s) differing from the brute-force scan"
+        )
+        self.stdout.write(f"\n{'lookup':<12} {'mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+        for name, timings in (('index', index_ms), ('full scan', scan_ms)):
+            self.stdout.write(
+                f"{name:<12} {statistics.mean(timings):>9.3f} {_percentile(timings, 0.5):>9.3f} "
+                f"{_percentile(timings, 0.9):>9.3f} {_percentile(timings, 0.99):>9.3f}"
+            )
+
+    def _robustness(self, paths, max_distance):
+        self.stdout.write(f"\nHamming distance to the original (matches at <= {max_distance})")
+        self.stdout.write(f"{'image':<24} {'edit':<12} " + ' '.join(f"{method:>6}" for method in HASH_METHODS))
+        for path in paths:
+            image = cv2.imread(path)
+            if image is None:
+                self.stderr.write(f"Skipping unreadable image {path}")
+                continue
+            originals = {method: image_hash(image, method) for method in HASH_METHODS}
+            for edit, variant in _variants(image).items():
+                distances = [(image_hash(variant, method) ^ originals[method]).bit_count() for method in HASH_METHODS]
+                self.stdout.write(f"{path[-24:]:<24} {edit:<12} " + ' '.join(f"{distance:>6}" for distance in distances))
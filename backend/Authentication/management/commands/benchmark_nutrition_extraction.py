@@ -0,0 +1,154 @@
+import logging
+import os
+import random
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from models.nutrition_text import CALORIES_FALLBACK_PATTERN, NUTRITION_PATTERNS, NutritionTextExtractor
+
+# FoodLabelOCR.NUTRITION_PATTERNS as they were written before the single-scan extractor
+LEGACY_PATTERNS = {
+    'calories': r'(?:calories|energy|cal\.?|calorie content|kcal|nutritional value)[\s:]*(\d+[\.,]?\d*)\s*(?:kcal|cal|kj|calories|$)',
+    'protein': r'(?:protein|proteins|prot\.?|proteines?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
+    'fats': r'(?:total fat|fats?|lipids|fat content|total lipids?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
+    'carbohydrates': r'(?:carbohydrates?|carbs?|total carbs?|glucides|total carbohydrates?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
+    'sugar': r'(?:sugars?|total sugars?|of which sugars?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
+    'sodium': r'(?:sodium|salt|na|salt content)[\s:]*(\d+[\.,]?\d*)\s*(?:mg|g|milligrams?|grams?|$)',
+    'saturated_fat_100g': r'(?:saturated fat|saturates|sat\.?\s*fat|saturated)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
+    'trans_fat_100g': r'(?:trans\s*fat|trans-fat|trans\s*fatty acids?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
+    'cholesterol_100g': r'(?:cholesterol|chol\.?)[\s:]*(\d+[\.,]?\d*)\s*(?:mg|milligrams?|g|$)',
+}
+
+# Vocabulary for synthetic OCR texts: label words, units, OCR debris and punctuation
+SYNTHETIC_TOKENS = [
+    'nutrition', 'facts', 'per', '100g', 'serving', 'size', 'calories', 'energy', 'cal', 'cal.', 'kcal',
+    'kj', 'calorie content', 'nutritional value', 'protein', 'proteins', 'prot.', 'proteine', 'total fat',
+    'fat', 'fats', 'lipids', 'fat content', 'carbohydrate', 'carbohydrates', 'carbs', 'glucides',
+    'sugar', 'sugars', 'of which sugars', 'sodium', 'salt', 'na', 'saturated fat', 'saturates', 'sat fat',
+    'trans fat', 'trans-fat', 'trans fatty acids', 'cholesterol', 'chol.', 'g', 'mg', 'gr', 'grams',
+    'milligrams', ':', ',', '.', '(', ')', '%', '-', '/', '*', '\n', '\t', '  ', '\xa0', 'Énergie', 'İ', 'dv',
+]
+
+
+def legacy_extract_nutrition_info(text, patterns=LEGACY_PATTERNS):
+    """The extract_nutrition_info implementation before the single-scan extractor (logging removed)"""
+    nutrition_data = {}
+
+    text = text.lower()
+    text = re.sub(r'\s+', ' ', text)
+    text = text.replace('\n', ' ').replace('\r', ' ')
+    text = text.replace(',', '.')
+    text = re.sub(r'[^\w\s.:]', ' ', text)
+    text = re.sub(r'\(.*?\)', '', text)
+
+    calories_matches = list(re.finditer(patterns['calories'], text))
+    if not calories_matches:
+        fallback_match = re.search(CALORIES_FALLBACK_PATTERN, text)
+        if fallback_match:
+            try:
+                nutrition_data['calories'] = float(fallback_match.group(1))
+            except (ValueError, IndexError):
+                pass
+
+    for nutrient, pattern in patterns.items():
+        matches = list(re.finditer(pattern, text))
+        if matches:
+            values = []
+            for match in matches:
+                try:
+                    value = float(match.group(1).replace(',', '.'))
+                    if 0 <= value <= 1000:
+                        values.append(value)
+                except (ValueError, IndexError):
+                    continue
+            if values:
+                nutrition_data[nutrient] = round(sorted(values)[len(values)//2], 2)
+
+    return nutrition_data
+
+
+def synthetic_texts(count, seed):
+    """Random label-like OCR texts mixing nutrient words, numbers, units and noise"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        tokens = []
+        for _ in range(rng.randint(10, 120)):
+            roll = rng.random()
+            if roll < 0.35:
+                number = str(rng.randint(0, 1500))
+                if rng.random() < 0.4:
+                    number += rng.choice(['.', ',']) + str(rng.randint(0, 99))
+                tokens.append(number)
+            else:
+                tokens.append(rng.choice(SYNTHETIC_TOKENS))
+        separator = rng.choice([' ', '', '\n'])
+        texts.append(' '.join(token + (separator if rng.random() < 0.2 else '') for token in tokens))
+    return texts
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark the regex nutrition extraction (the Gemini fallback) against "
+        "the previous multi-pass implementation, checking both return the same values"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help='Directory of OCR text files (*.txt) to use besides the synthetic texts')
+        parser.add_argument('--synthetic', type=int, default=2000, help='Number of generated OCR texts')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed passes over the corpus')
+
+    def handle(self, *args, **options):
+        texts = synthetic_texts(options['synthetic'], options['seed'])
+        if options['corpus']:
+            if not os.path.isdir(options['corpus']):
+                raise CommandError(f"Corpus directory not found: {options['corpus']}")
+            for file_name in sorted(os.listdir(options['corpus'])):
+                if file_name.endswith('.txt'):
+                    with open(os.path.join(options['corpus'], file_name), encoding='utf-8') as f:
+                        texts.append(f.read())
+        if not texts:
+            raise CommandError("Empty corpus")
+
+        if NUTRITION_PATTERNS != LEGACY_PATTERNS:
+            raise CommandError("NUTRITION_PATTERNS no longer match the legacy patterns; update LEGACY_PATTERNS")
+
+        extractor = NutritionTextExtractor()
+        # Keep the extractor's logging out of the timings
+        logging.getLogger('models.nutrition_text').setLevel(logging.ERROR)
+
+        mismatches = 0
+        for text in texts:
+            expected = legacy_extract_nutrition_info(text)
+            got = extractor.extract(text)
+            if got != expected:
+                mismatches += 1
+                if mismatches <= 5:
+                    self.stderr.write(f"Mismatch for {text[:80]!r}: legacy={expected} compiled={got}")
+
+        timings = {'legacy': [], 'compiled': []}
+        for _ in range(max(options['repeat'], 1)):
+            started = time.perf_counter()
+            for text in texts:
+                legacy_extract_nutrition_info(text)
+            timings['legacy'].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for text in texts:
+                extractor.extract(text)
+            timings['compiled'].append(time.perf_counter() - started)
+
+        total_chars = sum(len(text) for text in texts)
+        self.stdout.write(f"{len(texts)} texts, {total_chars / len(texts):.0f} chars on average\n")
+        legacy_us = statistics.median(timings['legacy']) / len(texts) * 1e6
+        for name, runs in timings.items():
+            per_text_us = statistics.median(runs) / len(texts) * 1e6
+            self.stdout.write(f"{name:<9} {per_text_us:>9.1f} us/text  {legacy_us / per_text_us:>5.2f}x")
+
+        if mismatches:
+            raise CommandError(f"{mismatches} of {len(texts)} texts extracted differently from the legacy implementation")
+        self.stdout.write(self.style.SUCCESS("Identical results on every text"))
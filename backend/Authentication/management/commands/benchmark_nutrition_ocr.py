@@ -0,0 +1,143 @@
+import json
+import os
+import statistics
+import time
+
+import cv2
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Rendered labels with the values printed on them, checked in so the modes can be compared anywhere
+DEFAULT_FIXTURES_DIR = os.path.join(settings.BASE_DIR, 'Authentication', 'test_data', 'nutrition_labels')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+NUTRITION_FIELDS = [
+    'calories', 'protein', 'fats', 'carbohydrates', 'sugar', 'sodium',
+    'saturated_fat_100g', 'trans_fat_100g', 'cholesterol_100g',
+]
+
+
+def load_fixtures(fixtures_dir):
+    """
+    Collect fixture images and their expected values.
+
+    Each image may have a ``<name>.json`` next to it holding the expected
+    nutrition values, e.g. {"calories": 120, "sugar": 10}.
+    """
+    fixtures = []
+    for file_name in sorted(os.listdir(fixtures_dir)):
+        stem, extension = os.path.splitext(file_name)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        expected = None
+        expected_path = os.path.join(fixtures_dir, f"{stem}.json")
+        if os.path.exists(expected_path):
+            with open(expected_path) as f:
+                expected = json.load(f)
+        fixtures.append((file_name, os.path.join(fixtures_dir, file_name), expected))
+    return fixtures
+
+
+def matching_fields(extracted, expected, tolerance=0.01):
+    """Number of expected fields the extraction got right (within a relative tolerance)"""
+    matched = 0
+    for field, value in expected.items():
+        got = extracted.get(field)
+        if got is not None and abs(float(got) - float(value)) <= max(abs(float(value)) * tolerance, 0.05):
+            matched += 1
+    return matched
+
+
+def compare_modes(ocr, fixtures, modes, repeat=1, skip=None):
+    """
+    OCR every fixture image in each mode and extract its nutrition values with the regexes.
+
+    Args:
+        ocr: FoodLabelOCR
+        fixtures: (name, path, expected) tuples from load_fixtures
+        modes: OCR modes; the first is the baseline the others are compared to
+        repeat: Timed runs per image and mode, after an untimed warm-up run
+        skip: Called with the name of an unreadable image
+
+    Returns:
+        dict: mode -> {'latencies', 'lines', 'matched', 'expected', 'agree'}; latencies and
+        lines have one entry per image, agree counts images extracted like the baseline
+    """
+    baseline_mode = modes[0]
+    report = {mode: {'latencies': [], 'lines': [], 'matched': 0, 'expected': 0, 'agree': 0} for mode in modes}
+    for name, path, expected in fixtures:
+        image = cv2.imread(path)
+        if image is None:
+            if skip is not None:
+                skip(name)
+            continue
+
+        extractions = {}
+        for mode in modes:
+            ocr.ocr_text(image, mode=mode)  # warm-up run, not timed
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                text, lines = ocr.ocr_text(image, mode=mode)
+                timings.append(time.perf_counter() - started)
+
+            extracted = ocr.extract_nutrition_info(text)
+            extractions[mode] = extracted
+            report[mode]['latencies'].append(statistics.median(timings))
+            report[mode]['lines'].append(len(lines))
+            if expected:
+                report[mode]['matched'] += matching_fields(extracted, expected)
+                report[mode]['expected'] += len(expected)
+
+        for mode in modes:
+            same = all(
+                extractions[mode].get(field) == extractions[baseline_mode].get(field)
+                for field in NUTRITION_FIELDS
+            )
+            report[mode]['agree'] += same
+    return report
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark single-pass against two-pass nutrition OCR on a fixture set: "
+        "OCR latency, lines read and regex extraction accuracy (no Gemini calls)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', default=DEFAULT_FIXTURES_DIR,
+                            help='Directory of label images (+ optional .json expectations); defaults to the checked-in set')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per image and mode')
+        parser.add_argument('--modes', nargs='+', default=['two_pass', 'single'], help='OCR modes to compare')
+
+    def handle(self, *args, **options):
+        from models.engines import engine_registry
+
+        if not os.path.isdir(options['fixtures']):
+            raise CommandError(f"Fixture directory not found: {options['fixtures']}")
+        fixtures = load_fixtures(options['fixtures'])
+        if not fixtures:
+            raise CommandError("No fixture images found")
+
+        ocr = engine_registry.get('nutrition')
+        modes = options['modes']
+        repeat = max(options['repeat'], 1)
+        baseline_mode = modes[0]
+
+        report = compare_modes(
+            ocr, fixtures, modes, repeat, skip=lambda name: self.stderr.write(f"Skipping unreadable image {name}"),
+        )
+
+        images = len(report[baseline_mode]['latencies'])
+        baseline_ms = statistics.mean(report[baseline_mode]['latencies']) * 1000
+        self.stdout.write(f"{images} image(s), {repeat} timed run(s) each\n")
+        self.stdout.write(f"{'mode':<10} {'mean ms':>9} {'p50 ms':>9} {'saved':>7} {'lines':>6} {'accuracy':>9} {'same as ' + baseline_mode:>16}")
+        for mode in modes:
+            data = report[mode]
+            mean_ms = statistics.mean(data['latencies']) * 1000
+            p50_ms = statistics.median(data['latencies']) * 1000
+            saved = (1 - mean_ms / baseline_ms) * 100 if baseline_ms else 0.0
+            accuracy = f"{data['matched'] / data['expected'] * 100:.1f}%" if data['expected'] else 'n/a'
+            self.stdout.write(
+                f"{mode:<10} {mean_ms:>9.1f} {p50_ms:>9.1f} {saved:>6.1f}% "
+                f"{statistics.mean(data['lines']):>6.1f} {accuracy:>9} {data['agree']:>9}/{images}"
+            )
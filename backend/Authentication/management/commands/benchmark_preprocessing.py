@@ -0,0 +1,87 @@
+import os
+import statistics
+import time
+
+import cv2
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark_nutrition_ocr import load_fixtures, matching_fields
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the image preprocessing profiles on a fixture set: per-stage "
+        "latency, end-to-end OCR latency and regex extraction accuracy (no Gemini calls)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', required=True, help='Directory of label images (+ optional .json expectations)')
+        parser.add_argument('--profiles', nargs='+', default=['quality', 'fast'], help='Preprocessing profiles to compare')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per image and profile')
+        parser.add_argument('--no-normalize', action='store_true', help='Skip resolution normalization before preprocessing')
+
+    def handle(self, *args, **options):
+        from models.engines import engine_registry
+        from models.image_utils import normalize_resolution
+        from models.preprocessing import get_pipeline
+
+        if not os.path.isdir(options['fixtures']):
+            raise CommandError(f"Fixture directory not found: {options['fixtures']}")
+        fixtures = load_fixtures(options['fixtures'])
+        if not fixtures:
+            raise CommandError("No fixture images found")
+
+        try:
+            pipelines = [get_pipeline(profile) for profile in options['profiles']]
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        ocr = engine_registry.get('nutrition')
+        repeat = max(options['repeat'], 1)
+        report = {
+            pipeline.name: {'stages': {}, 'preprocess': [], 'ocr': [], 'matched': 0, 'expected': 0}
+            for pipeline in pipelines
+        }
+
+        for name, path, expected in fixtures:
+            image = cv2.imread(path)
+            if image is None:
+                self.stderr.write(f"Skipping unreadable image {name}")
+                continue
+            if not options['no_normalize']:
+                image, _ = normalize_resolution(image)
+
+            for pipeline in pipelines:
+                data = report[pipeline.name]
+                ocr.ocr_text(image, profile=pipeline.name)  # warm-up run, not timed
+
+                stage_runs = []
+                ocr_runs = []
+                for _ in range(repeat):
+                    _, timings = pipeline.run(image)
+                    stage_runs.append(timings)
+                    started = time.perf_counter()
+                    text, _ = ocr.ocr_text(image, profile=pipeline.name)
+                    ocr_runs.append((time.perf_counter() - started) * 1000)
+
+                for stage in stage_runs[0]:
+                    data['stages'].setdefault(stage, []).append(statistics.median(run[stage] for run in stage_runs))
+                data['preprocess'].append(statistics.median(sum(run.values()) for run in stage_runs))
+                data['ocr'].append(statistics.median(ocr_runs))
+
+                if expected:
+                    data['matched'] += matching_fields(ocr.extract_nutrition_info(text), expected)
+                    data['expected'] += len(expected)
+
+        images = len(report[pipelines[0].name]['ocr'])
+        self.stdout.write(f"{images} image(s), {repeat} timed run(s) each\n")
+        self.stdout.write(f"{'profile':<12} {'preprocess ms':>14} {'ocr total ms':>13} {'accuracy':>9}")
+        for pipeline in pipelines:
+            data = report[pipeline.name]
+            accuracy = f"{data['matched'] / data['expected'] * 100:.1f}%" if data['expected'] else 'n/a'
+            self.stdout.write(
+                f"{pipeline.name:<12} {statistics.mean(data['preprocess']):>14.1f} "
+                f"{statistics.mean(data['ocr']):>13.1f} {accuracy:>9}"
+            )
+            for stage, timings in data['stages'].items():
+                self.stdout.write(f"    {stage:<16} {statistics.mean(timings):>9.1f} ms")
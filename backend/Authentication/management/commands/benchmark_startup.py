@@ -0,0 +1,146 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Libraries that take seconds and tens to hundreds of MB to import. They are only
+# needed once something is scanned or scored: neither `manage.py check` nor
+# importing the URLconf may load them
+LAZY_MODULES = [
+    'numpy', 'cv2', 'rapidfuzz', 'pandas', 'scipy', 'joblib', 'sklearn', 'google.generativeai',
+    'easyocr', 'torch', 'paddleocr', 'paddle', 'spacy',
+]
+
+RESULT_PREFIX = 'BENCHMARK_STARTUP '
+
+# Run in a fresh interpreter per phase; reports each step's seconds, peak RSS and newly imported LAZY_MODULES
+CHILD = r'''
+import json, os, sys, time
+started = time.perf_counter()
+try:
+    import resource
+except ImportError:
+    resource = None
+
+LAZY_MODULES = {lazy_modules!r}
+steps = []
+
+
+def record(name):
+    global started
+    loaded = [module for module in LAZY_MODULES if module in sys.modules]
+    seen = [module for step in steps for module in step['loaded']]
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak /= 1048576 if sys.platform == 'darwin' else 1024
+    steps.append({{
+        'step': name, 'seconds': time.perf_counter() - started, 'peak_rss_mb': peak,
+        'loaded': loaded, 'new': [module for module in loaded if module not in seen],
+    }})
+    started = time.perf_counter()
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+phase = {phase!r}
+if phase == 'check':
+    from django.core.management import execute_from_command_line
+    execute_from_command_line(['manage.py', 'check'])
+    record('manage.py check')
+else:
+    from backend.wsgi import application
+    record('import backend.wsgi')
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    record('import URLconf')
+
+    import uuid
+    from django.test import Client
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from Authentication.models import User
+    from Authentication.summaries import drain_summaries
+    from models.gemini_client import gemini_client
+
+    # No Gemini model: the background summary fails at once instead of calling the API
+    gemini_client.model = None
+    user = User.objects.create_user(
+        email=f'startup-{{uuid.uuid4().hex[:8]}}@benchmark.example.com', password=None, full_name='Startup Benchmark',
+    )
+    try:
+        client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {{RefreshToken.for_user(user).access_token}}')
+        response = client.get('/user-history/')
+        assert response.status_code == 200, response.status_code
+        record('first request (history)')
+        response = client.post('/manual-entry/', data={{
+            'ingredients_text': 'oats, sugar, salt, palm oil',
+            'nutrition_data': {{
+                'calories': 380, 'protein': 9, 'fats': 12, 'carbohydrates': 60, 'sugar': 21, 'sodium': 300,
+                'saturated_fat': 4, 'trans_fat': 0, 'cholesterol': 0,
+            }},
+        }}, content_type='application/json')
+        assert response.status_code == 200 and response.json().get('success'), response.content
+        record('first scored request (manual entry)')
+        drain_summaries(timeout=30)
+    finally:
+        user.delete()
+print({prefix!r} + json.dumps(steps))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure process startup in fresh interpreters: the time, peak RSS and heavy "
+        "libraries loaded by `manage.py check`, by importing the WSGI application, "
+        "and by the first plain and first scored requests. Fails if `manage.py check` "
+        "or importing the URLconf loads a library that should only load on first use"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeats', type=int, default=3, help='Fresh interpreters per phase')
+        parser.add_argument('--warm-up', action='store_true',
+                            help='Keep OCR_WARM_UP_ON_STARTUP, i.e. load engines and models when the WSGI module is imported')
+
+    def handle(self, *args, **options):
+        if options['repeats'] < 1:
+            raise CommandError('--repeats must be positive')
+        env = dict(os.environ)
+        if not options['warm_up']:
+            env['OCR_WARM_UP_ON_STARTUP'] = '0'
+
+        # With --warm-up the WSGI module loads the engines on purpose, before the URLconf
+        lazy_steps = ['manage.py check'] if options['warm_up'] else ['manage.py check', 'import URLconf']
+        eager = {}
+        for phase in ('check', 'request'):
+            runs = [self._run(phase, env) for _ in range(options['repeats'])]
+            self.stdout.write(f"\n{phase}: {options['repeats']} fresh interpreter(s), median of each step")
+            self.stdout.write(f"  {'step':<38} {'seconds':>8} {'peak RSS MB':>12}  newly imported")
+            for index, step in enumerate(runs[0]):
+                seconds = statistics.median(run[index]['seconds'] for run in runs)
+                peaks = [run[index]['peak_rss_mb'] for run in runs if run[index]['peak_rss_mb'] is not None]
+                peak = f"{statistics.median(peaks):>12.0f}" if peaks else f"{'n/a':>12}"
+                self.stdout.write(f"  {step['step']:<38} {seconds:>8.2f} {peak}  {', '.join(step['new']) or '-'}")
+            total = statistics.median(sum(step['seconds'] for step in run) for run in runs)
+            self.stdout.write(f"  {'total':<38} {total:>8.2f}")
+
+            for step in runs[0]:
+                if step['step'] in lazy_steps and step['loaded']:
+                    eager[step['step']] = step['loaded']
+
+        if eager:
+            raise CommandError('; '.join(
+                f"`{step}` imported {', '.join(modules)}" for step, modules in eager.items()
+            ) + '; import them where they are used')
+
+    def _run(self, phase, env):
+        code = CHILD.format(lazy_modules=LAZY_MODULES, phase=phase, prefix=RESULT_PREFIX)
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        for line in reversed(result.stdout.splitlines()):
+            if line.startswith(RESULT_PREFIX):
+                return json.loads(line[len(RESULT_PREFIX):])
+        raise CommandError(f"{phase} run failed (exit code {result.returncode}):\n{result.stderr[-2000:]}")
@@ -0,0 +1,140 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from Authentication.history import encode_cursor, history_page, parse_fields
+from Authentication.models import History, User
+
+BENCHMARK_EMAIL = 'history-benchmark@example.com'
+
+INGREDIENTS = ['sugar', 'salt', 'wheat flour', 'palm oil', 'water', 'milk powder', 'cocoa', 'e330', 'yeast', 'soy lecithin']
+
+
+def offset_page(user, limit, offset):
+    """The previous user-history query: OFFSET paging with every column serialized"""
+    records = History.objects.filter(user=user).order_by('-created_at')[offset:offset + limit]
+    return [
+        {
+            'id': record.id,
+            'created_at': record.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'scores': {
+                'ingredients': record.ingredients_result,
+                'nutrition': record.nutrition_result,
+                'total': record.total_result
+            },
+            'nutrition_data': record.nutrition_data,
+            'ingredients_data': record.ingredients_data,
+            'analysis_summary': record.analysis_summary,
+            'model_version': record.model_version
+        }
+        for record in records
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark user-history paging on one user with many rows: OFFSET paging "
+        "with full rows against keyset (cursor) paging with and without a field projection"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='History rows for the benchmark user')
+        parser.add_argument('--limit', type=int, default=20, help='Page size')
+        parser.add_argument('--depths', type=int, nargs='+', default=[0, 1000, 10000, 50000, 99000],
+                            help='Row offsets at which to time a page')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark user and rows afterwards')
+
+    def handle(self, *args, **options):
+        user = self._benchmark_user(options['rows'])
+        limit = options['limit']
+        repeat = max(options['repeat'], 1)
+        try:
+            self._report_plan(user, limit)
+
+            ordered_ids = list(History.objects.filter(user=user).order_by('-created_at', '-id').values_list('id', flat=True))
+            light_fields = parse_fields('id,created_at,scores')
+
+            self.stdout.write(f"\n{'depth':>7} {'offset+full ms':>15} {'cursor+full ms':>15} {'cursor+light ms':>16}")
+            for depth in options['depths']:
+                if depth >= len(ordered_ids):
+                    continue
+                cursor = None
+                if depth:
+                    # Cursor of the row just before this depth, as the previous page would return it
+                    cursor = encode_cursor(History.objects.only('id', 'created_at').get(id=ordered_ids[depth - 1]))
+
+                timings = {'offset': [], 'full': [], 'light': []}
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    offset_page(user, limit, depth)
+                    timings['offset'].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    history_page(user, limit, cursor=cursor)
+                    timings['full'].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    history_page(user, limit, cursor=cursor, fields=light_fields)
+                    timings['light'].append(time.perf_counter() - started)
+
+                self.stdout.write(
+                    f"{depth:>7} "
+                    + " ".join(f"{statistics.median(timings[key]) * 1000:>15.2f}" for key in ('offset', 'full'))
+                    + f" {statistics.median(timings['light']) * 1000:>16.2f}"
+                )
+        finally:
+            if not options['keep']:
+                user.delete()
+
+    def _benchmark_user(self, rows):
+        user, _ = User.objects.get_or_create(email=BENCHMARK_EMAIL, defaults={'full_name': 'History Benchmark'})
+        existing = History.objects.filter(user=user).count()
+        if existing >= rows:
+            return user
+
+        self.stdout.write(f"Creating {rows - existing} history rows...")
+        rng = random.Random(0)
+        now = timezone.now()
+        batch = []
+        for index in range(existing, rows):
+            batch.append(History(
+                user=user,
+                ingredients_result=rng.uniform(0, 10),
+                nutrition_result=rng.uniform(0, 10),
+                total_result=rng.uniform(0, 15),
+                analysis_summary='This product is moderately healthy. ' * 12,
+                nutrition_data={key: rng.randint(0, 500) for key in (
+                    'calories', 'protein', 'fats', 'carbohydrates', 'sugar', 'sodium',
+                    'saturated_fat', 'trans_fat', 'cholesterol')},
+                ingredients_data={'raw_data': rng.sample(INGREDIENTS, 6)},
+            ))
+            if len(batch) == 5000:
+                History.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            History.objects.bulk_create(batch)
+
+        # auto_now_add stamps every row with the same instant; spread them over time
+        ids = list(History.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+        updates = [History(id=history_id, created_at=now - timedelta(minutes=len(ids) - position))
+                   for position, history_id in enumerate(ids)]
+        History.objects.bulk_update(updates, ['created_at'], batch_size=5000)
+        return user
+
+    def _report_plan(self, user, limit):
+        """Show whether the keyset query is served from the (user, created_at, id) index"""
+        query = History.objects.filter(user=user).order_by('-created_at', '-id').only('id', 'created_at')[:limit]
+        sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+            cursor.execute(explain + sql, params)
+            plan = [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+        self.stdout.write("Query plan for a history page:")
+        for line in plan:
+            self.stdout.write(f"  {line}")
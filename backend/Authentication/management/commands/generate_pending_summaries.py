@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Authentication.models import History
+from Authentication.summaries import generate_history_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate analysis summaries left pending, e.g. by a process that exited "
+        "before its background summary worker got to them, and retry the ones "
+        "that failed, e.g. during a Gemini outage"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=300,
+            help='Only pick up summaries of rows created at least this many seconds ago',
+        )
+        parser.add_argument('--limit', type=int, help='Stop after this many summaries')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['older_than'])
+        pending = History.objects.filter(
+            summary_status__in=[History.SUMMARY_PENDING, History.SUMMARY_FAILED], created_at__lt=cutoff
+        ).order_by('id').values_list('id', flat=True)
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        generated = failed = 0
+        for history_id in pending:
+            if generate_history_summary(history_id) is None:
+                continue
+            if History.objects.filter(id=history_id, summary_status=History.SUMMARY_FAILED).exists():
+                failed += 1
+            else:
+                generated += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated {generated} summary(ies), {failed} failed again"))
@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from Authentication.models import NutritionResult, OCRResult, User
+from Authentication.summaries import drain_summaries
+from models.engines import engine_registry
+from models.gemini_cache import gemini_cache
+from models.gemini_client import gemini_client
+from models.stand_ins import SimulatedGeminiModel, StubFoodLabelOCR, StubIngredientExtractor
+
+LOAD_TEST_DOMAIN = 'load-test.example.com'
+LOAD_TEST_PASSWORD = 'load-test-password'
+
+# Endpoint -> (WSGI path, ASGI path); scans and manual entries have native async views
+ENDPOINTS = {
+    'register': ('/register/', '/register/'),
+    'login': ('/login/', '/login/'),
+    'scan': ('/result_api/', '/result_api/async/'),
+    'manual': ('/manual-entry/', '/manual-entry/async/'),
+    'history': ('/user-history/', '/user-history/'),
+}
+
+DEFAULT_MIX = 'scan=2,manual=3,history=4,login=1'
+
+
+def parse_mix(mix):
+    """'scan=2,history=1' -> {'scan': 2.0, 'history': 1.0}"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS or name == 'register':
+            raise CommandError(f"Unknown endpoint '{name}' in --mix, expected scan, manual, history or login")
+        try:
+            weights[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for '{name}' in --mix")
+    if not any(weights.values()):
+        raise CommandError('--mix needs at least one positive weight')
+    return weights
+
+
+class Results:
+    """Latencies and outcomes per endpoint, filled from worker threads or tasks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(Counter)
+
+    def record(self, endpoint, latency, outcome):
+        with self._lock:
+            self.outcomes[endpoint][outcome] += 1
+            if outcome == 'ok':
+                self.latencies[endpoint].append(latency)
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline load test of the API on the real Django stack: Gemini is replaced by a local "
+        "stand-in with configurable latency, error rate and canned answers, and the OCR engines "
+        "optionally by stubs. Virtual users register, then scans, manual entries, "
+        "history pages and logins are sent at a fixed rate; latencies are measured from each "
+        "request's scheduled send time, so a saturated server shows up as queueing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rps', type=float, default=10.0, help='Requests per second after setup')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds of load after setup')
+        parser.add_argument('--users', type=int, default=10, help='Virtual users registered at setup')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Endpoint weights (default {DEFAULT_MIX})')
+        parser.add_argument('--handler', choices=['wsgi', 'asgi'], default='wsgi',
+                            help='Drive the WSGI views from a thread pool or the ASGI/async views from one event loop')
+        parser.add_argument('--workers', type=int, default=32, help='Client threads for --handler wsgi')
+        parser.add_argument('--gemini-latency', type=float, default=0.8, help='Seconds per simulated Gemini call')
+        parser.add_argument('--gemini-error-rate', type=float, default=0.0, help='Fraction of Gemini calls that fail')
+        parser.add_argument('--gemini-answers', help='JSON file overriding the canned ingredients / nutrition / summary answers')
+        parser.add_argument('--stub-ocr', action='store_true', help='Replace EasyOCR / PaddleOCR with canned label text')
+        parser.add_argument('--ocr-latency', type=float, default=0.2, help='Seconds per stub OCR call')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the load-test users, their history and their scans')
+
+    def handle(self, *args, **options):
+        if options['rps'] <= 0 or options['duration'] <= 0 or options['users'] <= 0:
+            raise CommandError('--rps, --duration and --users must be positive')
+        weights = parse_mix(options['mix'])
+        answers = None
+        if options['gemini_answers']:
+            with open(options['gemini_answers']) as f:
+                answers = json.load(f)
+
+        self.random = random.Random(options['seed'])
+        self.asgi = options['handler'] == 'asgi'
+        self.run_id = uuid.uuid4().hex[:8]
+        self.results = Results()
+        # SHA-256 of every uploaded image: OCRResult and NutritionResult rows have no user to be deleted with
+        self.upload_hashes = set()
+
+        model = SimulatedGeminiModel(
+            latency=options['gemini_latency'], error_rate=options['gemini_error_rate'],
+            answers=answers, seed=options['seed'],
+        )
+        saved_model = gemini_client.model
+        saved_cache_config = gemini_cache.config
+        gemini_client.model = model
+        # Cached answers would hide the simulated latency
+        gemini_cache._config = dict(saved_cache_config, ENABLED=False)
+        if options['stub_ocr']:
+            engine_registry.shutdown()
+            engine_registry.register('ingredients', StubIngredientExtractor, latency=options['ocr_latency'])
+            engine_registry.register('nutrition', StubFoodLabelOCR, latency=options['ocr_latency'])
+
+        plan = self._plan(weights, options['rps'], options['duration'])
+        self.started = time.perf_counter()
+        try:
+            # A repeated seed repeats the uploads of an earlier run, which would be reused
+            with override_settings(SCAN_DEDUP_ENABLED=False, ALLOWED_HOSTS=['*']):
+                if self.asgi:
+                    asyncio.run(self._run_asgi(options['users'], plan, options['rps']))
+                else:
+                    self._run_wsgi(options['users'], plan, options['rps'], options['workers'])
+            # Summaries of the last scans are still being written in the background
+            drain_summaries(timeout=60)
+        finally:
+            gemini_client.model = saved_model
+            gemini_cache._config = saved_cache_config
+            if options['stub_ocr']:
+                engine_registry.shutdown()
+                engine_registry.configure()
+            if not options['keep']:
+                User.objects.filter(email__endswith=f'@{self.run_id}.{LOAD_TEST_DOMAIN}').delete()
+                self._delete_scans()
+
+        self._report(plan, model, options)
+
+    def _plan(self, weights, rps, duration):
+        """Endpoint of each request of the load phase, in send order"""
+        names = list(weights)
+        return self.random.choices(names, weights=[weights[name] for name in names], k=max(int(rps * duration), 1))
+
+    def _email(self, index):
+        return f'user{index}@{self.run_id}.{LOAD_TEST_DOMAIN}'
+
+    def _label_image(self):
+        # Random pixels, so the JPEG is not trivially small
+        pixels = np.random.default_rng(self.random.getrandbits(32)).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+        data = cv2.imencode('.jpg', pixels)[1].tobytes()
+        self.upload_hashes.add(hashlib.sha256(data).hexdigest())
+        return SimpleUploadedFile('label.jpg', data, content_type='image/jpeg')
+
+    def _delete_scans(self):
+        """Delete the OCRResult / NutritionResult rows of this run's uploads and the images kept with them"""
+        hashes = list(self.upload_hashes)
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            ocr_results = OCRResult.objects.filter(content_hash__in=chunk)
+            for ocr_result in ocr_results.exclude(image=''):
+                ocr_result.image.delete(save=False)
+            nutrition_results = NutritionResult.objects.filter(content_hash__in=chunk)
+            for path in nutrition_results.exclude(image_path=None).values_list('image_path', flat=True):
+                if os.path.isfile(path):
+                    os.remove(path)
+            ocr_results.delete()
+            nutrition_results.delete()
+
+    def _request(self, endpoint, user):
+        """(method, path, keyword arguments) of one request by ``user`` (email, access token)"""
+        path = ENDPOINTS[endpoint][self.asgi]
+        email, token = user
+        if endpoint in ('register', 'login'):
+            data = {'email': email, 'password': LOAD_TEST_PASSWORD}
+            if endpoint == 'register':
+                data['full_name'] = 'Load Test'
+            return 'post', path, {'data': data, 'content_type': 'application/json'}
+
+        headers = {'Authorization': f'Bearer {token}'}
+        if endpoint == 'scan':
+            return 'post', path, {
+                'data': {'ingredients_image': self._label_image(), 'nutrition_image': self._label_image()},
+                'headers': headers,
+            }
+        if endpoint == 'manual':
+            rng = self.random
+            return 'post', path, {
+                'data': {
+                    'ingredients_text': ', '.join(rng.sample(['sugar', 'salt', 'oats', 'milk', 'cocoa', 'palm oil', 'water'], 4)),
+                    'nutrition_data': {
+                        'calories': rng.randint(50, 600), 'protein': rng.randint(0, 30), 'fats': rng.randint(0, 40),
+                        'carbohydrates': rng.randint(0, 90), 'sugar': rng.randint(0, 50), 'sodium': rng.randint(0, 900),
+                        'saturated_fat': rng.randint(0, 20), 'trans_fat': 0, 'cholesterol': rng.randint(0, 60),
+                    },
+                },
+                'content_type': 'application/json',
+                'headers': headers,
+            }
+        return 'get', path, {'data': {'limit': 20, 'fields': 'id,created_at,scores'}, 'headers': headers}
+
+    def _outcome(self, endpoint, response):
+        expected = 201 if endpoint == 'register' else 200
+        return 'ok' if response.status_code == expected else f'HTTP {response.status_code}'
+
+    def _registered(self, email, response, started):
+        """Record a setup registration; the virtual user (email, access token) or None"""
+        outcome = self._outcome('register', response)
+        self.results.record('register', time.perf_counter() - started, outcome)
+        return (email, response.json()['access']) if outcome == 'ok' else None
+
+    def _register_wsgi(self, index):
+        email = self._email(index)
+        method, path, kwargs = self._request('register', (email, None))
+        started = time.perf_counter()
+        return self._registered(email, getattr(Client(), method)(path, **kwargs), started)
+
+    def _run_wsgi(self, user_count, plan, rps, workers):
+        local = threading.local()
+
+        def send(endpoint, user, scheduled):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            method, path, kwargs = self._request(endpoint, user)
+            try:
+                response = getattr(local.client, method)(path, **kwargs)
+                outcome = self._outcome(endpoint, response)
+            except Exception as e:
+                outcome = type(e).__name__
+            self.results.record(endpoint, time.perf_counter() - scheduled, outcome)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            users = [user for user in pool.map(self._register_wsgi, range(user_count)) if user]
+            self.setup_elapsed = time.perf_counter() - self.started
+            if not users:
+                raise CommandError('No load-test user could register and log in')
+            self.load_started = time.perf_counter()
+            for position, endpoint in enumerate(plan):
+                scheduled = self.load_started + position / rps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(send, endpoint, users[position % len(users)], scheduled)
+        self.load_elapsed = time.perf_counter() - self.load_started
+
+    async def _register_asgi(self, client, index):
+        email = self._email(index)
+        method, path, kwargs = self._request('register', (email, None))
+        started = time.perf_counter()
+        return self._registered(email, await getattr(client, method)(path, **kwargs), started)
+
+    async def _run_asgi(self, user_count, plan, rps):
+        client = AsyncClient()
+        users = [user for user in await asyncio.gather(
+            *(self._register_asgi(client, index) for index in range(user_count))
+        ) if user]
+        self.setup_elapsed = time.perf_counter() - self.started
+        if not users:
+            raise CommandError('No load-test user could register and log in')
+
+        async def send(endpoint, user, scheduled):
+            method, path, kwargs = self._request(endpoint, user)
+            try:
+                response = await getattr(client, method)(path, **kwargs)
+                outcome = self._outcome(endpoint, response)
+            except Exception as e:
+                outcome = type(e).__name__
+            self.results.record(endpoint, time.perf_counter() - scheduled, outcome)
+
+        self.load_started = time.perf_counter()
+        tasks = []
+        for position, endpoint in enumerate(plan):
+            scheduled = self.load_started + position / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(send(endpoint, users[position % len(users)], scheduled)))
+        await asyncio.gather(*tasks)
+        self.load_elapsed = time.perf_counter() - self.load_started
+
+    def _report(self, plan, model, options):
+        self.stdout.write(
+            f"{options['handler'].upper()}: {options['users']} user(s) registered in {self.setup_elapsed:.1f}s, "
+            f"then {len(plan)} requests at {options['rps']:g} req/s over {self.load_elapsed:.1f}s"
+        )
+        self.stdout.write(
+            f"Gemini stand-in: {options['gemini_latency']:g}s per call, {model.calls} call(s), "
+            f"{model.errors} simulated error(s); OCR: "
+            + (f"stub, {options['ocr_latency']:g}s per call" if options['stub_ocr'] else 'real engines')
+        )
+        self.stdout.write(
+            f"\n{'endpoint':>9} {'sent':>6} {'ok':>6} {'ok/s':>7} {'p50 ms':>8} {'p90 ms':>8} "
+            f"{'p99 ms':>8} {'max ms':>8}  errors"
+        )
+        for endpoint in ENDPOINTS:
+            outcomes = self.results.outcomes.get(endpoint)
+            if not outcomes:
+                continue
+            latencies = sorted(self.results.latencies[endpoint])
+            errors = ', '.join(f'{outcome} x{count}' for outcome, count in outcomes.most_common() if outcome != 'ok')
+            if latencies:
+                cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+                timing = ' '.join(f'{value * 1000:>8.0f}' for value in (cuts[49], cuts[89], cuts[98], latencies[-1]))
+            else:
+                timing = ' '.join(f"{'-':>8}" for _ in range(4))
+            window = self.setup_elapsed if endpoint == 'register' else self.load_elapsed
+            self.stdout.write(
+                f"{endpoint:>9} {sum(outcomes.values()):>6} {len(latencies):>6} {len(latencies) / window:>7.2f} "
+                f"{timing}  {errors or '-'}"
+            )
+
+        stats = gemini_client.stats()
+        self.stdout.write(
+            f"\nGemini client: circuit {stats['circuit']} after {stats['circuit_trips']} trip(s), "
+            f"rejected calls {stats['rejected']}"
+        )
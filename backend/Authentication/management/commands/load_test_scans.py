@@ -0,0 +1,120 @@
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Authentication.models import User
+from Authentication.summaries import drain_summaries
+from models.gemini_cache import gemini_cache
+from models.gemini_client import gemini_client
+from models.stand_ins import SimulatedGeminiModel
+
+LOAD_TEST_EMAIL = 'scan-load-test@example.com'
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the scan API with Gemini replaced by a fixed-latency stand-in: "
+        "result_api on the WSGI handler with one thread per concurrent request "
+        "against result_api/async/ on the ASGI handler with one event loop"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('ingredients_image', help='Ingredients label image')
+        parser.add_argument('nutrition_image', help='Nutrition label image')
+        parser.add_argument('--requests', type=int, default=40, help='Scans per run')
+        parser.add_argument('--concurrency', type=int, default=20, help='Scans in flight at a time')
+        parser.add_argument('--gemini-latency', type=float, default=1.0, help='Seconds per simulated Gemini call')
+        parser.add_argument('--only', choices=['wsgi', 'asgi'], help='Run a single handler')
+
+    def handle(self, *args, **options):
+        for path in (options['ingredients_image'], options['nutrition_image']):
+            if not os.path.isfile(path):
+                raise CommandError(f"No such image: {path}")
+
+        self.images = (options['ingredients_image'], options['nutrition_image'])
+        user, _ = User.objects.get_or_create(email=LOAD_TEST_EMAIL, defaults={'full_name': 'Scan Load Test'})
+        self.authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+
+        saved_model = gemini_client.model
+        saved_cache_config = gemini_cache.config
+        gemini_client.model = SimulatedGeminiModel(latency=options['gemini_latency'])
+        # Every call has to pay the simulated latency, and every upload has to be extracted
+        gemini_cache._config = dict(saved_cache_config, ENABLED=False)
+
+        try:
+            with override_settings(SCAN_DEDUP_ENABLED=False, ALLOWED_HOSTS=['*']):
+                self.stdout.write(
+                    f"{options['requests']} scans, {options['concurrency']} concurrent, "
+                    f"{options['gemini_latency']:.2f}s per Gemini call, "
+                    f"at most {gemini_client.config['MAX_CONCURRENCY']} Gemini calls in flight"
+                )
+                self.stdout.write(f"\n{'handler':>8} {'ok':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+                if options['only'] != 'asgi':
+                    self._report('wsgi', *self._run_wsgi(options['requests'], options['concurrency']))
+                if options['only'] != 'wsgi':
+                    self._report('asgi', *asyncio.run(self._run_asgi(options['requests'], options['concurrency'])))
+                # Let the background summaries finish before their rows are deleted
+                drain_summaries(timeout=60)
+        finally:
+            gemini_client.model = saved_model
+            gemini_cache._config = saved_cache_config
+            user.delete()
+
+    def _report(self, handler, elapsed, results):
+        latencies = [latency for ok, latency in results if ok]
+        ok = len(latencies)
+        if not latencies:
+            self.stdout.write(f"{handler:>8} {ok:>5} {'-':>8} {'-':>9} {'-':>9} {'-':>9}")
+            return
+        self.stdout.write(
+            f"{handler:>8} {ok:>5} {ok / elapsed:>8.2f} {statistics.median(latencies) * 1000:>9.0f} "
+            f"{_percentile(latencies, 0.95) * 1000:>9.0f} {max(latencies) * 1000:>9.0f}"
+        )
+
+    def _run_wsgi(self, requests, concurrency):
+        def scan(_):
+            client = Client()
+            with open(self.images[0], 'rb') as ingredients, open(self.images[1], 'rb') as nutrition:
+                started = time.perf_counter()
+                response = client.post(
+                    '/result_api/',
+                    {'ingredients_image': ingredients, 'nutrition_image': nutrition},
+                    headers={'Authorization': self.authorization},
+                )
+            return response.status_code == 200, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(scan, range(requests)))
+        return time.perf_counter() - started, results
+
+    async def _run_asgi(self, requests, concurrency):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def scan():
+            async with limit:
+                with open(self.images[0], 'rb') as ingredients, open(self.images[1], 'rb') as nutrition:
+                    started = time.perf_counter()
+                    response = await client.post(
+                        '/result_api/async/',
+                        {'ingredients_image': ingredients, 'nutrition_image': nutrition},
+                        headers={'Authorization': self.authorization},
+                    )
+                return response.status_code == 200, time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(scan() for _ in range(requests)))
+        return time.perf_counter() - started, results
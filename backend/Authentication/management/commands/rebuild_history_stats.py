@@ -0,0 +1,99 @@
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Authentication.models import History, User, UserDailyStats, UserHistoryStats, UserMetricStats
+from Authentication.rollups import HISTORY_ROLLUP_FIELDS, apply_deltas, collect_deltas, reset_user_stats
+
+
+def _close(a, b):
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-user history rollups (user-stats/) from the History table, "
+        "e.g. to backfill rows written before the rollups existed. With --check, "
+        "only compare the stored rollups with a fresh computation"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email of a single user to rebuild')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='History rows read per batch')
+        parser.add_argument('--check', action='store_true', help='Report users whose rollups differ; write nothing')
+
+    def handle(self, *args, **options):
+        rows = History.objects.all()
+        user_ids = None
+        if options['user']:
+            user = User.objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+            user_ids = [user.pk]
+            rows = rows.filter(user_id=user.pk)
+
+        started = time.perf_counter()
+        deltas = collect_deltas(
+            rows.only(*HISTORY_ROLLUP_FIELDS).order_by('id').iterator(chunk_size=options['chunk_size'])
+        )
+        scans = sum(delta.scans for delta in deltas.values())
+        self.stdout.write(
+            f"Aggregated {scans} history row(s) of {len(deltas)} user(s) in {time.perf_counter() - started:.1f}s"
+        )
+
+        if options['check']:
+            mismatched = [user_id for user_id, delta in deltas.items() if not self._matches(user_id, delta)]
+            # Users with rollups but no history left
+            orphaned = UserHistoryStats.objects.exclude(user_id__in=list(deltas))
+            if user_ids is not None:
+                orphaned = orphaned.filter(user_id__in=user_ids)
+            mismatched += list(orphaned.filter(scan_count__gt=0).values_list('user_id', flat=True))
+            for user_id in mismatched:
+                self.stderr.write(f"Rollups differ for user {user_id}")
+            if mismatched:
+                raise CommandError(f"{len(mismatched)} user(s) with stale rollups")
+            self.stdout.write(self.style.SUCCESS("All rollups match the history"))
+            return
+
+        with transaction.atomic():
+            reset_user_stats(user_ids)
+            apply_deltas(deltas)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups of {len(deltas)} user(s) in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def _matches(self, user_id, delta):
+        totals = UserHistoryStats.objects.filter(user_id=user_id).first()
+        if totals is None or totals.scan_count != delta.scans:
+            return False
+        if totals.first_scan_at != delta.first_scan_at or totals.last_scan_at != delta.last_scan_at:
+            return False
+
+        stored = {stats.metric: stats for stats in UserMetricStats.objects.filter(user_id=user_id, count__gt=0)}
+        if set(stored) != set(delta.metrics):
+            return False
+        for metric, (count, value_sum, min_value, max_value) in delta.metrics.items():
+            stats = stored[metric]
+            if stats.count != count or not _close(stats.value_sum, value_sum):
+                return False
+            if not _close(stats.min_value, min_value) or not _close(stats.max_value, max_value):
+                return False
+
+        stored_days = {bucket.day: bucket for bucket in UserDailyStats.objects.filter(user_id=user_id, scan_count__gt=0)}
+        if set(stored_days) != set(delta.days):
+            return False
+        for day, (count, ingredients, nutrition, total) in delta.days.items():
+            bucket = stored_days[day]
+            if bucket.scan_count != count:
+                return False
+            if not all(_close(a, b) for a, b in (
+                (bucket.ingredients_score_sum, ingredients),
+                (bucket.nutrition_score_sum, nutrition),
+                (bucket.total_score_sum, total),
+            )):
+                return False
+        return True
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Authentication.catalog import refresh_summaries
+from Authentication.models import ProductCatalogEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh product catalog entries: drop their analysis summaries, which are "
+        "then taken from the next scan of the product, or with --remove delete the "
+        "entries so the next scan extracts and scores the product again"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('barcodes', nargs='*', help='Barcodes of the entries to refresh')
+        parser.add_argument('--all', action='store_true', help='Refresh every entry')
+        parser.add_argument('--remove', action='store_true', help='Delete the entries instead')
+
+    def handle(self, *args, **options):
+        barcodes = options['barcodes']
+        if options['all'] == bool(barcodes):
+            raise CommandError('Give either barcodes or --all')
+
+        entries = ProductCatalogEntry.objects.all()
+        if barcodes:
+            entries = entries.filter(barcode__in=barcodes)
+            missing = set(barcodes) - set(entries.values_list('barcode', flat=True))
+            for barcode in sorted(missing):
+                self.stderr.write(f"Barcode {barcode} is not in the product catalog")
+
+        if options['remove']:
+            removed, _ = entries.delete()
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} catalog entry(ies)"))
+        else:
+            refreshed = refresh_summaries(entries)
+            self.stdout.write(self.style.SUCCESS(f"Dropped the summary of {refreshed} catalog entry(ies)"))
@@ -0,0 +1,127 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Authentication.models import History
+from Authentication.rollups import SCORE_METRICS, record_rescores
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the scores of History rows with the currently deployed models. "
+        "Rows already scored by this model version are skipped, so an interrupted "
+        "run can simply be started again"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.HISTORY_RESCORE_CHUNK_SIZE,
+            help='Rows read, scored and written per batch',
+        )
+        parser.add_argument('--after-id', type=int, default=0, help='Only rescore rows with a larger id')
+        parser.add_argument('--limit', type=int, help='Stop after this many rows')
+        parser.add_argument('--force', action='store_true', help='Also rescore rows already at the current model version')
+        parser.add_argument('--dry-run', action='store_true', help='Score but do not write anything')
+
+    def handle(self, *args, **options):
+        from models.model_store import model_store
+        from models.scoring import ScoringEngine, ingredients_text_from_history, nutrition_features_from_history
+
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        try:
+            scoring_engine = ScoringEngine(model_store.get())
+        except Exception as e:
+            raise CommandError(f"Could not load the scoring models: {str(e)}")
+        version = scoring_engine.version
+
+        rows = History.objects.filter(id__gt=options['after_id'])
+        if not options['force']:
+            rows = rows.exclude(model_version=version)
+        rows = rows.order_by('id')
+        if options['limit']:
+            rows = rows[:options['limit']]
+
+        total = rows.count()
+        self.stdout.write(f"Rescoring {total} history row(s) with model version {version}")
+        if not total:
+            return
+
+        started = time.perf_counter()
+        processed = 0
+        skipped = 0
+        last_id = options['after_id']
+
+        def flush(chunk):
+            """Score one chunk in a single predict per model and write it back"""
+            nonlocal processed, skipped
+            texts = []
+            features = []
+            updates = []
+            previous = []
+            for history_id, ingredients_data, nutrition_data, user_id, created_at, *old_scores in chunk:
+                try:
+                    features.append(nutrition_features_from_history(nutrition_data or {}))
+                except (TypeError, ValueError, AttributeError):
+                    self.stderr.write(f"Skipping history {history_id}: unreadable nutrition_data")
+                    skipped += 1
+                    continue
+                texts.append(ingredients_text_from_history(ingredients_data))
+                updates.append(History(id=history_id))
+                previous.append((user_id, created_at, dict(zip(SCORE_METRICS, old_scores))))
+
+            for history, score in zip(updates, scoring_engine.score(texts, features)):
+                history.ingredients_result = score['ingredients_score']
+                history.nutrition_result = score['nutrition_score']
+                history.total_result = score['total_score']
+                history.model_version = version
+
+            if updates and not options['dry_run']:
+                with transaction.atomic():
+                    History.objects.bulk_update(
+                        updates,
+                        ['ingredients_result', 'nutrition_result', 'total_result', 'model_version'],
+                        batch_size=chunk_size,
+                    )
+                    # Keep the per-user score rollups in step with the new scores
+                    record_rescores(
+                        (user_id, created_at, old_scores, {
+                            'ingredients': history.ingredients_result,
+                            'nutrition': history.nutrition_result,
+                            'total': history.total_result,
+                        })
+                        for history, (user_id, created_at, old_scores) in zip(updates, previous)
+                    )
+            processed += len(chunk)
+
+            elapsed = time.perf_counter() - started
+            rate = processed / elapsed if elapsed else 0.0
+            remaining = (total - processed) / rate if rate else 0.0
+            self.stdout.write(
+                f"{processed}/{total} ({processed / total:.1%}) up to id {chunk[-1][0]}, "
+                f"{rate:.0f} rows/s, ~{remaining:.0f}s left"
+            )
+
+        # Stream only the columns needed to rebuild the model inputs and update the rollups
+        chunk = []
+        stream = rows.values_list(
+            'id', 'ingredients_data', 'nutrition_data', 'user_id', 'created_at', *SCORE_METRICS.values()
+        ).iterator(chunk_size=chunk_size)
+        for row in stream:
+            chunk.append(row)
+            last_id = row[0]
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Scored' if options['dry_run'] else 'Rescored'} {processed - skipped} row(s) in {elapsed:.1f}s "
+            f"({processed / elapsed if elapsed else 0:.0f} rows/s), {skipped} skipped; last id {last_id}"
+        ))
@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+import signal
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker_process(index, poll_interval, once):
+    """Entry point of one worker process"""
+    import django
+
+    django.setup()
+
+    from Authentication.jobs import run_worker
+    from Authentication.summaries import drain_summaries
+    from models.engines import engine_registry
+    from models.model_store import model_store
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Load the OCR engines and models once for every job this process will run
+    engine_registry.warm_up()
+    model_store.warm_up()
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    run_worker(worker_id, poll_interval, should_stop=lambda: bool(stopping), once=once)
+    # Worker processes end with os._exit, which would drop queued summaries
+    drain_summaries()
+
+
+class Command(BaseCommand):
+    help = "Run local worker processes that process queued scan jobs (see scan-jobs/)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.SCAN_JOB_WORKERS,
+            help='Number of worker processes',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.SCAN_JOB_POLL_INTERVAL,
+            help='Seconds to wait between polls of an empty queue',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is empty instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        poll_interval = options['poll_interval']
+        once = options['once']
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+
+        processes = []
+        for index in range(workers):
+            process = multiprocessing.Process(
+                target=_worker_process,
+                args=(index, poll_interval, once),
+                name=f'scan-worker-{index}',
+            )
+            process.start()
+            processes.append(process)
+        self.stdout.write(f"Started {workers} scan worker(s): {', '.join(str(p.pid) for p in processes)}")
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping scan workers after their current job...")
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS("Scan workers stopped"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0008_remove_user_username'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='history',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0010_scanjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nutritionresult',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='ocrresult',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
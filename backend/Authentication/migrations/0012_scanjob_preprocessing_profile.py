@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0011_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanjob',
+            name='preprocessing_profile',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0012_scanjob_preprocessing_profile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='history_user_created_idx'),
+        ),
+    ]
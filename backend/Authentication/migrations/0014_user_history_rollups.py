@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0013_history_user_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserHistoryStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='history_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('scan_count', models.PositiveIntegerField(default=0)),
+                ('first_scan_at', models.DateTimeField(blank=True, null=True)),
+                ('last_scan_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('scan_count', models.PositiveIntegerField(default=0)),
+                ('ingredients_score_sum', models.FloatField(default=0)),
+                ('nutrition_score_sum', models.FloatField(default=0)),
+                ('total_score_sum', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_user_daily_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserMetricStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=32)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('value_sum', models.FloatField(default=0)),
+                ('min_value', models.FloatField(blank=True, null=True)),
+                ('max_value', models.FloatField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'metric'), name='unique_user_metric_stats')],
+            },
+        ),
+    ]
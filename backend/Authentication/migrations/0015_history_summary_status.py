@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0014_user_history_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='history',
+            name='summary_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=10, null=True),
+        ),
+    ]
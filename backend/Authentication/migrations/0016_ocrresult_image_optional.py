@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0015_history_summary_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ocrresult',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='ocr_uploads/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0016_ocrresult_image_optional'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nutritionresult',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='ocrresult',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
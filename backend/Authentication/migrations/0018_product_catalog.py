@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Authentication', '0017_perceptual_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCatalogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=14, unique=True)),
+                ('ingredients', models.JSONField(default=list)),
+                ('ingredients_score', models.FloatField()),
+                ('nutrition_score', models.FloatField()),
+                ('model_version', models.CharField(blank=True, max_length=32, null=True)),
+                ('analysis_summary', models.TextField(blank=True, null=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('nutrition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Authentication.nutritionresult')),
+                ('source_history', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Authentication.history')),
+            ],
+        ),
+    ]
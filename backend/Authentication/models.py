@@ -69,18 +69,39 @@ class NutritionResult(models.Model):
     vitamin_a_100g = models.FloatField(blank=True, null=True)    
     vitamin_c_100g = models.FloatField(blank=True, null=True)    
     cholesterol_100g = models.FloatField(blank=True, null=True)    
+
+    # SHA-256 of the uploaded image, used to skip OCR for byte-identical uploads
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    # "<method>:<64-bit hex>" perceptual hash, used to reuse the extraction of near-duplicate uploads
+    perceptual_hash = models.CharField(max_length=32, blank=True, null=True)
+
     def __str__(self):
         return f"Nutrition Result for {self.image_name or 'Unknown'}"
     
 class OCRResult(models.Model):
-    image = models.ImageField(upload_to='ocr_uploads/')
+    # Empty unless settings.SCAN_UPLOAD_RETENTION keeps ingredients uploads
+    image = models.ImageField(upload_to='ocr_uploads/', blank=True)
     extracted_data = models.JSONField()  
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # SHA-256 of the uploaded image, used to skip OCR for byte-identical uploads
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    # "<method>:<64-bit hex>" perceptual hash, used to reuse the extraction of near-duplicate uploads
+    perceptual_hash = models.CharField(max_length=32, blank=True, null=True)
+
     def __str__(self):
         return f"OCRResult {self.id} - {self.created_at}"
 
 class History(models.Model):
+    SUMMARY_PENDING = 'pending'
+    SUMMARY_READY = 'ready'
+    SUMMARY_FAILED = 'failed'
+    SUMMARY_STATUS_CHOICES = [
+        (SUMMARY_PENDING, 'Pending'),
+        (SUMMARY_READY, 'Ready'),
+        (SUMMARY_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='results')
     
     # Simple score fields
@@ -89,6 +110,12 @@ class History(models.Model):
     total_result = models.FloatField(blank=True, null=True)
 
     analysis_summary = models.TextField(blank=True, null=True)
+
+    # analysis_summary is generated in the background after the scores are returned
+    summary_status = models.CharField(max_length=10, choices=SUMMARY_STATUS_CHOICES, blank=True, null=True)
+
+    # Version of the scoring models that produced the results above
+    model_version = models.CharField(max_length=32, blank=True, null=True)
     
     # Structured data fields
     nutrition_data = models.JSONField(default=dict, blank=True)
@@ -96,5 +123,136 @@ class History(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # user-history pages: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='history_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"Result {self.id} - {self.created_at}"
+
+
+class UserHistoryStats(models.Model):
+    """Running totals over a user's History rows, kept up to date by Authentication.rollups"""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='history_stats')
+    scan_count = models.PositiveIntegerField(default=0)
+    first_scan_at = models.DateTimeField(blank=True, null=True)
+    last_scan_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"History stats for {self.user_id}"
+
+
+class UserMetricStats(models.Model):
+    """Count / sum / min / max of one score ('score.total') or nutrient ('nutrient.sugar') for a user"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='metric_stats')
+    metric = models.CharField(max_length=32)
+    count = models.PositiveIntegerField(default=0)
+    value_sum = models.FloatField(default=0)
+    min_value = models.FloatField(blank=True, null=True)
+    max_value = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'metric'], name='unique_user_metric_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} stats for {self.user_id}"
+
+
+class UserDailyStats(models.Model):
+    """Scans and score sums of one user on one (UTC) day"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    scan_count = models.PositiveIntegerField(default=0)
+    ingredients_score_sum = models.FloatField(default=0)
+    nutrition_score_sum = models.FloatField(default=0)
+    total_score_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_user_daily_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} stats for {self.user_id}"
+
+
+class ScanJob(models.Model):
+    """A queued result_api scan, processed by the run_scan_workers command"""
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scan_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+
+    ingredients_image = models.ImageField(upload_to='scan_jobs/')
+    nutrition_image = models.ImageField(upload_to='scan_jobs/', blank=True, null=True)
+    # Preprocessing profile requested for the nutrition OCR (None = deployment default)
+    preprocessing_profile = models.CharField(max_length=50, blank=True, null=True)
+
+    # Same payload result_api returns, or the error it would have returned
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    history = models.ForeignKey(History, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+
+    attempts = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"ScanJob {self.id} - {self.status}"
+
+
+class ProductCatalogEntry(models.Model):
+    """
+    Canonical scan result of a product, keyed by its barcode. Filled in by the
+    first successful scan of the product; later scans that find the barcode
+    are answered from here without OCR, Gemini or scoring.
+    """
+
+    # GTIN: EAN-8, EAN-13 (UPC-A is stored in its 13-digit form) or GTIN-14
+    barcode = models.CharField(max_length=14, unique=True)
+
+    ingredients = models.JSONField(default=list)
+    nutrition = models.ForeignKey(NutritionResult, on_delete=models.CASCADE, related_name='+')
+
+    ingredients_score = models.FloatField()
+    nutrition_score = models.FloatField()
+    # Version of the scoring models that produced the scores; rescored when it changes
+    model_version = models.CharField(max_length=32, blank=True, null=True)
+
+    # Copied from source_history once its background summary has been written
+    analysis_summary = models.TextField(blank=True, null=True)
+    source_history = models.ForeignKey(History, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"ProductCatalogEntry {self.barcode}"
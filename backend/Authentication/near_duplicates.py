@@ -0,0 +1,200 @@
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from .models import NutritionResult, OCRResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NEAR_DUPLICATE_SCANS = {
+    'ENABLED': True,
+    # 'phash' (DCT) or 'dhash' (gradient); hashes of the other method are ignored
+    'METHOD': 'phash',
+    # Most differing bits (of 64) for two uploads to count as the same label
+    'MAX_DISTANCE': 6,
+    # OCR a downscaled copy and compare it with the earlier result before reusing it
+    'SPOT_CHECK': True,
+    'SPOT_CHECK_DIMENSION': 800,
+    'SPOT_CHECK_MIN_OVERLAP': 0.6,
+    # Rows saved by other workers are picked up at most this often
+    'REFRESH_SECONDS': 5.0,
+}
+
+# Nutrition values compared by the spot check
+SPOT_CHECK_NUTRIENTS = ['calories', 'protein', 'fats', 'carbohydrates', 'sugar', 'sodium']
+
+_WORD = re.compile(r'[a-z]{3,}')
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def near_duplicate_config():
+    config = dict(DEFAULT_NEAR_DUPLICATE_SCANS)
+    config.update(getattr(settings, 'NEAR_DUPLICATE_SCANS', {}))
+    return config
+
+
+def near_duplicates_enabled():
+    """Near-duplicate matching is a second tier of the exact upload deduplication"""
+    return settings.SCAN_DEDUP_ENABLED and near_duplicate_config()['ENABLED']
+
+
+def word_tokens(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def number_tokens(text):
+    return {f"{float(number.replace(',', '.')):g}" for number in _NUMBER.findall(text)}
+
+
+def nutrition_tokens(nutrition_result):
+    """The non-zero SPOT_CHECK_NUTRIENTS of a NutritionResult, formatted like number_tokens"""
+    values = (getattr(nutrition_result, field) for field in SPOT_CHECK_NUTRIENTS)
+    return {f"{value:g}" for value in values if value}
+
+
+def token_overlap(expected, found):
+    """Fraction of the ``expected`` tokens present in ``found``; 0 if nothing is expected"""
+    if not expected:
+        return 0.0
+    return len(expected & found) / len(expected)
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual hashes of the past uploads of one scan leg, in a HammingIndex
+    per worker process.
+
+    Built from the database on first use. Rows saved since, by any worker,
+    are read at most every REFRESH_SECONDS; each refresh starts from the
+    checkpoint before the last one, because a row can be created a moment
+    before its hash is written.
+    """
+
+    def __init__(self, leg, model):
+        self.leg = leg
+        self.model = model
+        self._lock = threading.Lock()
+        self._index = None
+        self._method = None
+        self._refreshed_at = 0.0
+        # Highest row id seen by the last refresh and by the one before it
+        self._checkpoint = 0
+        self._previous_checkpoint = 0
+        # Indexed ids above _previous_checkpoint, so re-read rows are not added twice
+        self._recent_ids = set()
+
+        self._stats_lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.spot_check_rejections = 0
+        self.lookup_seconds = 0.0
+
+    def _load(self, config):
+        """The index for ``config``, (re)built or refreshed from the database as needed; call with _lock held"""
+        if self._index is None or self._method != config['METHOD'] or self._index.max_distance != config['MAX_DISTANCE']:
+            # numpy and cv2 are only loaded by a process that looks up uploads
+            from models.perceptual_hash import HammingIndex
+            started = time.perf_counter()
+            self._index = HammingIndex(config['MAX_DISTANCE'])
+            self._method = config['METHOD']
+            self._recent_ids = set()
+            keys, values = [], []
+            for row_id, value in self._hash_rows(0):
+                keys.append(row_id)
+                values.append(value)
+            self._index.extend(keys, values)
+            self._checkpoint = self._previous_checkpoint = max(keys, default=0)
+            self._refreshed_at = time.monotonic()
+            logger.info(
+                f"Loaded {len(keys)} {self.leg} perceptual hashes in {(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+        elif time.monotonic() - self._refreshed_at >= config['REFRESH_SECONDS']:
+            checkpoint = self._checkpoint
+            for row_id, value in self._hash_rows(self._previous_checkpoint):
+                checkpoint = max(checkpoint, row_id)
+                if row_id not in self._recent_ids:
+                    self._recent_ids.add(row_id)
+                    self._index.add(row_id, value)
+            self._previous_checkpoint, self._checkpoint = self._checkpoint, checkpoint
+            self._recent_ids = {row_id for row_id in self._recent_ids if row_id > self._previous_checkpoint}
+            self._refreshed_at = time.monotonic()
+        return self._index
+
+    def _hash_rows(self, after_id):
+        prefix = f"{self._method}:"
+        rows = self.model.objects.filter(id__gt=after_id, perceptual_hash__startswith=prefix)
+        for row_id, perceptual_hash in rows.values_list('id', 'perceptual_hash').iterator(chunk_size=10000):
+            yield row_id, int(perceptual_hash[len(prefix):], 16)
+
+    def find(self, image, usable, confirm=None):
+        """
+        Look up an upload among the earlier ones.
+
+        Args:
+            image: Decoded upload (BGR array)
+            usable: Whether a candidate row has an extraction worth reusing
+            confirm: Optional spot check of the nearest usable row
+
+        Returns:
+            tuple: (perceptual hash to store with the upload, row to reuse or None)
+        """
+        from models.perceptual_hash import image_hash
+        config = near_duplicate_config()
+        started = time.perf_counter()
+        value = image_hash(image, config['METHOD'])
+        with self._lock:
+            matches = self._load(config).search(value)
+
+        row = None
+        if matches:
+            rows = self.model.objects.in_bulk([row_id for _, row_id in matches])
+            for distance, row_id in matches:
+                candidate = rows.get(row_id)
+                if candidate is not None and usable(candidate):
+                    logger.info(f"{self.leg}: upload is {distance} bit(s) from {self.model.__name__} {row_id}")
+                    row = candidate
+                    break
+        elapsed = time.perf_counter() - started
+
+        rejected = row is not None and confirm is not None and not confirm(row)
+        with self._stats_lock:
+            self.lookups += 1
+            self.lookup_seconds += elapsed
+            self.spot_check_rejections += rejected
+            self.hits += row is not None and not rejected
+        return f"{config['METHOD']}:{value:016x}", None if rejected else row
+
+    def add(self, row_id, perceptual_hash):
+        """Index a row saved by this worker straight away rather than at the next refresh"""
+        method, _, value = perceptual_hash.partition(':')
+        with self._lock:
+            if self._index is None or method != self._method:
+                return
+            if row_id > self._previous_checkpoint:
+                if row_id in self._recent_ids:
+                    return
+                self._recent_ids.add(row_id)
+            self._index.add(row_id, int(value, 16))
+
+    def stats(self):
+        return {
+            'indexed': len(self._index) if self._index is not None else 0,
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            'spot_check_rejections': self.spot_check_rejections,
+            'avg_lookup_ms': round(self.lookup_seconds / self.lookups * 1000, 3) if self.lookups else 0.0,
+        }
+
+
+near_duplicate_indexes = {
+    'ingredients': NearDuplicateIndex('ingredients', OCRResult),
+    'nutrition': NearDuplicateIndex('nutrition', NutritionResult),
+}
+
+
+def near_duplicate_stats():
+    return {leg: index.stats() for leg, index in near_duplicate_indexes.items()}
@@ -0,0 +1,1081 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from models.engines import engine_registry
+from models.image_utils import LabelImage
+from models.model_store import model_store
+from models.scoring import (
+    NUTRITION_INPUT_KEYS, ScoringEngine, combined_score, nutrition_features_from_input,
+    nutrition_features_from_result,
+)
+from .analysis import generate_analysis_summary
+from .catalog import add_product, catalog_enabled, catalog_summary, find_barcode, lookup_product, rescore_entry
+from .models import History, NutritionResult, OCRResult, ProductCatalogEntry
+from .near_duplicates import (
+    near_duplicate_config, near_duplicate_indexes, near_duplicates_enabled, nutrition_tokens, number_tokens,
+    token_overlap, word_tokens,
+)
+from .rollups import record_histories
+from .summaries import queue_summary, wait_for_summary_async
+
+logger = logging.getLogger(__name__)
+
+# The two legs of a scan use different OCR engines, so they can run side by
+# side; each engine is still used by one thread at a time (see engine_registry).
+_leg_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'SCAN_LEG_WORKERS', 4),
+    thread_name_prefix='scan-leg',
+)
+
+
+NO_INGREDIENTS_DETECTED = ["No ingredients detected"]
+
+
+class DedupStats:
+    """Counts uploads that were served from an earlier extraction of identical bytes"""
+
+    LEGS = ('ingredients', 'nutrition')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lookups = dict.fromkeys(self.LEGS, 0)
+        self.hits = dict.fromkeys(self.LEGS, 0)
+
+    def record(self, leg, hit):
+        with self._lock:
+            self.lookups[leg] += 1
+            self.hits[leg] += hit
+
+    def stats(self):
+        return {
+            leg: {
+                'lookups': self.lookups[leg],
+                'hits': self.hits[leg],
+                'hit_rate': round(self.hits[leg] / self.lookups[leg], 4) if self.lookups[leg] else 0.0,
+            }
+            for leg in self.LEGS
+        }
+
+
+dedup_stats = DedupStats()
+
+
+class ScanError(Exception):
+    """A scan stage failed; ``message`` is the error reported to the client"""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _in_worker_thread(func, *args):
+    """Run a leg on a pool thread with its own, properly recycled DB connection"""
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args):
+    """Run blocking work (OCR, model predict) on the leg executor from async code"""
+    return await asyncio.get_running_loop().run_in_executor(_leg_executor, _in_worker_thread, func, *args)
+
+
+def _upload_label(upload):
+    """LabelImage of an upload, which may already have been read (see read_scan_uploads)"""
+    return upload if isinstance(upload, LabelImage) else LabelImage.from_upload(upload)
+
+
+def read_scan_uploads(ingredients_image, nutrition_image):
+    """
+    Read both uploads of a scan and look for a product barcode on them,
+    ingredients label first. The legs reuse the images, decoded array included.
+
+    Returns:
+        tuple: (ingredients LabelImage, nutrition LabelImage, barcode or None)
+    """
+    ingredients_label = _upload_label(ingredients_image)
+    nutrition_label = _upload_label(nutrition_image)
+    barcode = find_barcode(ingredients_label, nutrition_label) if catalog_enabled() else None
+    return ingredients_label, nutrition_label, barcode
+
+
+def _store_ingredients_upload(ingredients_image):
+    """
+    Read and hash an ingredients upload and create its OCRResult, unless an
+    identical one was already extracted. The image is only written to disk
+    (OCRResult.image) if SCAN_UPLOAD_RETENTION keeps ingredients uploads.
+
+    Returns:
+        tuple: (ingredients reused from the identical upload or None, OCRResult to fill in, LabelImage)
+    """
+    label = _upload_label(ingredients_image)
+    content_hash = label.content_hash
+    previous = None
+    if settings.SCAN_DEDUP_ENABLED:
+        previous = OCRResult.objects.filter(content_hash=content_hash).order_by('-id').first()
+        reusable = previous is not None and _reusable_ingredients(previous)
+        dedup_stats.record('ingredients', hit=reusable)
+        if reusable:
+            logger.info(f"Reusing ingredients of OCRResult {previous.id} for an identical upload")
+            return previous.extracted_data, None, label
+
+    # An identical upload whose extraction failed is retried and its OCRResult filled in
+    ocr_result = previous or OCRResult.objects.create(
+        image=ContentFile(label.data, name=label.name) if settings.SCAN_UPLOAD_RETENTION['INGREDIENTS'] else '',
+        extracted_data={},
+        content_hash=content_hash
+    )
+
+    logger.info(f"Processing ingredients image {label.name} ({len(label.data)} bytes) for OCRResult {ocr_result.id}")
+    return None, ocr_result, label
+
+
+def _reusable_ingredients(ocr_result):
+    return bool(ocr_result.extracted_data) and ocr_result.extracted_data != NO_INGREDIENTS_DETECTED
+
+
+def _spot_check(leg, label, read, expected, tokens):
+    """
+    OCR a downscaled copy of an upload and compare it with an earlier result.
+
+    Args:
+        read: (engine, image) -> OCR text
+        expected: Tokens of the earlier result
+        tokens: OCR text -> tokens comparable with ``expected``
+    """
+    config = near_duplicate_config()
+    thumbnail = label.thumbnail(config['SPOT_CHECK_DIMENSION'])
+    with engine_registry.lease(leg) as engine:
+        text = read(engine, thumbnail) or ''
+    overlap = token_overlap(expected, tokens(text))
+    logger.info(f"{leg}: spot check found {overlap:.0%} of the earlier result")
+    return overlap >= config['SPOT_CHECK_MIN_OVERLAP']
+
+
+def _near_duplicate_ingredients(ocr_result, label):
+    """
+    Ingredients of an earlier upload that looks like this one, or None; the
+    upload's perceptual hash is saved and indexed either way.
+    """
+    if not near_duplicates_enabled():
+        return None
+    image = label.decode()
+    if image is None:
+        return None
+
+    def confirm(row):
+        return _spot_check(
+            'ingredients', label, lambda extractor, thumbnail: extractor.extract_from_image(thumbnail),
+            word_tokens(' '.join(str(item) for item in row.extracted_data)), word_tokens,
+        )
+
+    index = near_duplicate_indexes['ingredients']
+    perceptual_hash, row = index.find(
+        image,
+        usable=lambda row: row.id != ocr_result.id and _reusable_ingredients(row),
+        confirm=confirm if near_duplicate_config()['SPOT_CHECK'] else None,
+    )
+    ocr_result.perceptual_hash = perceptual_hash
+    OCRResult.objects.filter(pk=ocr_result.pk).update(perceptual_hash=perceptual_hash)
+    index.add(ocr_result.id, perceptual_hash)
+
+    if row is None:
+        return None
+    logger.info(f"Reusing ingredients of OCRResult {row.id} for a near-duplicate upload")
+    return row.extracted_data
+
+
+def _save_ingredients(ocr_result, ingredients_list):
+    logger.info(f"Extracted ingredients: {ingredients_list}")
+
+    # Use a default value if extraction fails
+    if not ingredients_list:
+        logger.warning("Ingredients extraction returned empty list. Using default value.")
+        ingredients_list = NO_INGREDIENTS_DETECTED
+
+    # Save extracted data to OCR result
+    ocr_result.extracted_data = ingredients_list
+    ocr_result.save()
+    return ingredients_list
+
+
+def _ocr_ingredients(label):
+    with engine_registry.lease('ingredients') as extractor:
+        return extractor.extract_from_image(label)
+
+
+def extract_ingredients(ingredients_image):
+    """
+    Ingredients leg: store the upload, OCR it and return the ingredients list.
+
+    Raises:
+        ScanError: if OCR or ingredient extraction fails
+    """
+    try:
+        reused, ocr_result, label = _store_ingredients_upload(ingredients_image)
+        if reused is not None:
+            return reused
+
+        reused = _near_duplicate_ingredients(ocr_result, label)
+        if reused is not None:
+            return _save_ingredients(ocr_result, reused)
+
+        # The engine is only leased for OCR, so Gemini latency does not hold up other scans' OCR
+        ocr_text = _ocr_ingredients(label)
+        ingredients_list = engine_registry.get('ingredients').ingredients_from_text(ocr_text, label)
+        return _save_ingredients(ocr_result, ingredients_list)
+
+    except Exception as e:
+        logger.error(f"Ingredients extraction error details: {str(e)}", exc_info=True)
+        raise ScanError(f'Ingredients extraction error: {str(e)}')
+
+
+async def extract_ingredients_async(ingredients_image):
+    """
+    extract_ingredients for async views.
+
+    The OCR engine is only leased for OCR, on the leg executor; the Gemini
+    call is awaited without it, so other scans can OCR in the meantime.
+    """
+    try:
+        reused, ocr_result, label = await sync_to_async(_store_ingredients_upload)(ingredients_image)
+        if reused is not None:
+            return reused
+
+        reused = await run_blocking(_near_duplicate_ingredients, ocr_result, label)
+        if reused is not None:
+            return await sync_to_async(_save_ingredients)(ocr_result, reused)
+
+        ocr_text = await run_blocking(_ocr_ingredients, label)
+        extractor = engine_registry.get('ingredients')
+        ingredients_list = await extractor.ingredients_from_text_async(ocr_text, label)
+        return await sync_to_async(_save_ingredients)(ocr_result, ingredients_list)
+
+    except Exception as e:
+        logger.error(f"Ingredients extraction error details: {str(e)}", exc_info=True)
+        raise ScanError(f'Ingredients extraction error: {str(e)}')
+
+
+def _store_nutrition_upload(nutrition_image):
+    """
+    Read and hash a nutrition upload, unless an identical one was already
+    extracted. The image is only written to disk (MEDIA_ROOT/nutrition_uploads/,
+    recorded in NutritionResult.image_path) if SCAN_UPLOAD_RETENTION keeps
+    nutrition uploads.
+
+    Returns:
+        tuple: (NutritionResult of the identical upload or None, LabelImage)
+    """
+    label = _upload_label(nutrition_image)
+    if settings.SCAN_DEDUP_ENABLED:
+        previous = NutritionResult.objects.filter(content_hash=label.content_hash).order_by('-id').first()
+        dedup_stats.record('nutrition', hit=previous is not None)
+        if previous is not None:
+            logger.info(f"Reusing NutritionResult {previous.id} for an identical upload")
+            return previous, label
+
+    if settings.SCAN_UPLOAD_RETENTION['NUTRITION']:
+        label.save(os.path.join(settings.MEDIA_ROOT, "nutrition_uploads"))
+    return None, label
+
+
+def _near_duplicate_nutrition(label, profile):
+    """
+    Look the upload up among earlier nutrition uploads.
+
+    Returns:
+        tuple: (perceptual hash to save with the new result or None, NutritionResult to reuse or None)
+    """
+    if not near_duplicates_enabled():
+        return None, None
+    image = label.decode()
+    if image is None:
+        return None, None
+
+    def confirm(row):
+        return _spot_check(
+            'nutrition', label, lambda ocr_processor, thumbnail: ocr_processor.read_label(thumbnail, profile),
+            nutrition_tokens(row), number_tokens,
+        )
+
+    perceptual_hash, row = near_duplicate_indexes['nutrition'].find(
+        image, usable=lambda row: True, confirm=confirm if near_duplicate_config()['SPOT_CHECK'] else None,
+    )
+    if row is not None:
+        logger.info(f"Reusing NutritionResult {row.id} for a near-duplicate upload")
+    return perceptual_hash, row
+
+
+def _save_nutrition_hash(nutrition_result, content_hash, perceptual_hash=None):
+    nutrition_result.content_hash = content_hash
+    nutrition_result.perceptual_hash = perceptual_hash
+    nutrition_result.save(update_fields=['content_hash', 'perceptual_hash'])
+    if perceptual_hash:
+        near_duplicate_indexes['nutrition'].add(nutrition_result.id, perceptual_hash)
+
+
+def _read_nutrition_label(label, profile):
+    with engine_registry.lease('nutrition') as ocr_processor:
+        return ocr_processor.read_label(label, profile)
+
+
+def extract_nutrition(nutrition_image, profile=None):
+    """
+    Nutrition leg: OCR the nutrition label and return the saved NutritionResult.
+
+    Args:
+        nutrition_image: Uploaded label image
+        profile: Preprocessing profile, defaults to settings.PREPROCESSING_PROFILE
+
+    Raises:
+        ScanError: if OCR fails or no nutrition information could be extracted
+    """
+    try:
+        previous, label = _store_nutrition_upload(nutrition_image)
+        if previous is not None:
+            return previous
+
+        perceptual_hash, previous = _near_duplicate_nutrition(label, profile)
+        if previous is not None:
+            return previous
+
+        # process_image without holding the engine lease during the Gemini call
+        nutrition_result = None
+        try:
+            text = _read_nutrition_label(label, profile)
+            if text is not None:
+                ocr_processor = engine_registry.get('nutrition')
+                nutrition_info = ocr_processor.extract_nutrition_with_gemini(text, label)
+                if nutrition_info:
+                    nutrition_result = ocr_processor.save_to_database(label, text, nutrition_info)
+        except Exception as e:
+            # Same outcome as process_image, which logs and returns no result
+            logger.error(f"Error processing image: {str(e)}")
+
+        if nutrition_result:
+            _save_nutrition_hash(nutrition_result, label.content_hash, perceptual_hash)
+
+    except Exception as e:
+        raise ScanError(f'Nutrition extraction error: {str(e)}')
+
+    if not nutrition_result:
+        raise ScanError('Failed to extract nutrition information')
+    return nutrition_result
+
+
+async def extract_nutrition_async(nutrition_image, profile=None):
+    """
+    extract_nutrition for async views: the label OCR runs on the leg executor
+    under the engine lease, the Gemini extraction is awaited without it.
+    """
+    try:
+        previous, label = await sync_to_async(_store_nutrition_upload)(nutrition_image)
+        if previous is not None:
+            return previous
+
+        perceptual_hash, previous = await run_blocking(_near_duplicate_nutrition, label, profile)
+        if previous is not None:
+            return previous
+
+        nutrition_result = None
+        try:
+            text = await run_blocking(_read_nutrition_label, label, profile)
+            if text is not None:
+                ocr_processor = engine_registry.get('nutrition')
+                nutrition_info = await ocr_processor.extract_nutrition_with_gemini_async(text, label)
+                if nutrition_info:
+                    nutrition_result = await sync_to_async(ocr_processor.save_to_database)(
+                        label, text, nutrition_info
+                    )
+        except Exception as e:
+            # Same outcome as process_image, which logs and returns no result
+            logger.error(f"Error processing image: {str(e)}")
+
+        if nutrition_result:
+            await sync_to_async(_save_nutrition_hash)(nutrition_result, label.content_hash, perceptual_hash)
+
+    except Exception as e:
+        raise ScanError(f'Nutrition extraction error: {str(e)}')
+
+    if not nutrition_result:
+        raise ScanError('Failed to extract nutrition information')
+    return nutrition_result
+
+
+def run_extraction_legs(ingredients_image, nutrition_image, profile=None):
+    """
+    Run the ingredients and nutrition legs concurrently.
+
+    Both legs always run to completion. If both fail, the ingredients error is
+    raised, matching the order in which the legs used to run.
+
+    Returns:
+        tuple: (ingredients_list, nutrition_result)
+
+    Raises:
+        ScanError: the error of the first failing leg
+    """
+    ingredients_future = _leg_executor.submit(_in_worker_thread, extract_ingredients, ingredients_image)
+    nutrition_future = _leg_executor.submit(_in_worker_thread, extract_nutrition, nutrition_image, profile)
+
+    ingredients_error = ingredients_future.exception()
+    nutrition_error = nutrition_future.exception()
+    if ingredients_error is not None:
+        raise ingredients_error
+    if nutrition_error is not None:
+        raise nutrition_error
+    return ingredients_future.result(), nutrition_future.result()
+
+
+def load_scoring_engine():
+    """
+    Raises:
+        ScanError: if the models cannot be loaded
+    """
+    try:
+        return ScoringEngine(model_store.get())
+    except Exception as e:
+        raise ScanError(f'Model loading error: {str(e)}')
+
+
+def score_ingredients_list(scoring_engine, ingredients_list):
+    """
+    Ingredients score of an extracted ingredients list.
+
+    Raises:
+        ScanError: if scoring fails
+    """
+    try:
+        # Convert ingredients list to a single string
+        ingredients_text = " ".join(str(ingredient) for ingredient in ingredients_list) if ingredients_list else ""
+        logger.info(f"Processing ingredients: {ingredients_text[:100]}...")  # Log first 100 chars
+
+        ingredients_score = float(scoring_engine.score_ingredients([ingredients_text])[0])
+        logger.info(f"Ingredients score: {ingredients_score}")
+        return ingredients_score
+    except Exception as e:
+        raise ScanError(f'Ingredients processing error: {str(e)}')
+
+
+def score_nutrition_result(scoring_engine, nutrition_result):
+    """
+    Nutrition score of an extracted NutritionResult.
+
+    Raises:
+        ScanError: if scoring fails
+    """
+    try:
+        # Features in the format expected by chirag_patil.pkl model
+        nutrition_features = nutrition_features_from_result(nutrition_result)
+        logger.info(f"Nutrition data for model: {nutrition_features}")
+
+        nutrition_score = float(scoring_engine.score_nutrition([nutrition_features])[0])
+        logger.info(f"Nutrition score: {nutrition_score}")
+        return nutrition_score
+
+    except Exception as e:
+        logger.error(f"Exception type: {type(e).__name__}")
+        logger.error(f"Exception details: {str(e)}")
+        logger.error(f"Model type: {type(scoring_engine.bundle.nutrition_model).__name__}")
+        raise ScanError(f'Nutrition processing error: {str(e)}')
+
+
+def format_nutrition(nutrition_result):
+    """Nutrition values of a NutritionResult as labelled in the response"""
+    return {
+        "Calories": nutrition_result.calories,
+        "Protein (g)": nutrition_result.protein,
+        "Fats (g)": nutrition_result.fats,
+        "Carbohydrates (g)": nutrition_result.carbohydrates,
+        "Sugars (g)": nutrition_result.sugar,
+        "Sodium (mg)": nutrition_result.sodium,
+        "Saturated Fat (g)": nutrition_result.saturated_fat_100g,
+        "Trans Fat (g)": nutrition_result.trans_fat_100g,
+        "Cholesterol (mg)": nutrition_result.cholesterol_100g,
+    }
+
+
+def save_scan_history(user, scoring_engine, ingredients_list, nutrition_result, ingredients_score, nutrition_score,
+                      analysis_summary=None):
+    """
+    Save a scored scan to history and queue its analysis summary, unless one
+    is passed in (a catalog product's summary).
+
+    Returns:
+        int or None: the History id, None if the row could not be saved
+    """
+    # Prepare data structures for storage
+    nutrition_data = {
+        "calories": nutrition_result.calories,
+        "protein": nutrition_result.protein,
+        "fats": nutrition_result.fats,
+        "carbohydrates": nutrition_result.carbohydrates,
+        "sugar": nutrition_result.sugar,
+        "sodium": nutrition_result.sodium,
+        "saturated_fat": nutrition_result.saturated_fat_100g,
+        "trans_fat": nutrition_result.trans_fat_100g,
+        "cholesterol": nutrition_result.cholesterol_100g,
+    }
+
+    ingredients_data = {
+        "raw_data": ingredients_list
+    }
+
+    # Save to history with all structured data
+    try:
+        with transaction.atomic():
+            history = History.objects.create(
+                user=user,
+                ingredients_result=ingredients_score,
+                nutrition_result=nutrition_score,
+                total_result=combined_score(ingredients_score, nutrition_score),
+                nutrition_data=nutrition_data,
+                ingredients_data=ingredients_data,
+                model_version=scoring_engine.version,
+                analysis_summary=analysis_summary,
+                summary_status=History.SUMMARY_READY if analysis_summary else History.SUMMARY_PENDING,
+            )
+            record_histories([history])
+            if not analysis_summary:
+                # The summary is written to the row after the response has gone out
+                queue_summary(history)
+        return history.id
+    except Exception as history_error:
+        logger.error(f"Failed to save to history: {str(history_error)}")
+        return None
+
+
+def unsaved_scan_summary(ingredients_list, nutrition_result, ingredients_score, nutrition_score):
+    """
+    Summary of a scan whose history row could not be saved: with nowhere to
+    store a background summary, the response has to carry it.
+
+    Returns:
+        tuple: (analysis_summary, summary_status)
+    """
+    total_score = combined_score(ingredients_score, nutrition_score)
+    try:
+        analysis_summary = generate_analysis_summary(
+            ingredients_list=ingredients_list,
+            nutrition_data=format_nutrition(nutrition_result),
+            ingredients_score=ingredients_score,
+            nutrition_score=nutrition_score,
+            total_score=total_score
+        )
+        return analysis_summary, History.SUMMARY_READY
+    except Exception as summary_error:
+        logger.error(f"Failed to generate analysis summary: {str(summary_error)}")
+        return f"This product received a score of {total_score:.1f}/10.", History.SUMMARY_FAILED
+
+
+def scan_payload(scoring_engine, history_id, ingredients_list, nutrition_result, ingredients_score,
+                 nutrition_score, analysis_summary, summary_status):
+    """The result_api response payload"""
+    return {
+        'success': True,
+        'history_id': history_id,
+        'ingredients': {
+            'raw_data': ingredients_list,
+            'score': ingredients_score
+        },
+        'nutrition': {
+            'data': format_nutrition(nutrition_result),
+            'score': nutrition_score
+        },
+        'total_score': combined_score(ingredients_score, nutrition_score),
+        'analysis_summary': analysis_summary,
+        'summary_status': summary_status,
+        'model_version': scoring_engine.version,
+        'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def score_scan(user, ingredients_list, nutrition_result):
+    """
+    Score extracted ingredients and nutrition and save them to history.
+
+    The analysis summary is queued for the background summary worker and
+    returned as pending; clients read it from history/<id>/summary/.
+
+    Args:
+        user: Owner of the history record
+        ingredients_list: Ingredients returned by the ingredients leg
+        nutrition_result: NutritionResult returned by the nutrition leg
+
+    Returns:
+        dict: The result_api response payload
+
+    Raises:
+        ScanError: if the models cannot be loaded or scoring fails
+    """
+    scoring_engine = load_scoring_engine()
+    ingredients_score = score_ingredients_list(scoring_engine, ingredients_list)
+    nutrition_score = score_nutrition_result(scoring_engine, nutrition_result)
+
+    history_id = save_scan_history(
+        user, scoring_engine, ingredients_list, nutrition_result, ingredients_score, nutrition_score
+    )
+    if history_id:
+        analysis_summary, summary_status = None, History.SUMMARY_PENDING
+    else:
+        analysis_summary, summary_status = unsaved_scan_summary(
+            ingredients_list, nutrition_result, ingredients_score, nutrition_score
+        )
+
+    return scan_payload(
+        scoring_engine, history_id, ingredients_list, nutrition_result,
+        ingredients_score, nutrition_score, analysis_summary, summary_status
+    )
+
+
+def catalog_scan(user, entry):
+    """
+    Scan result of a product found in the catalog by its barcode: saved to
+    history like any scan, but without OCR, Gemini or scoring. An entry
+    scored by older models is rescored from its stored ingredients and
+    nutrition first.
+
+    Returns:
+        dict: The result_api response payload
+
+    Raises:
+        ScanError: if the models cannot be loaded
+    """
+    logger.info(f"Barcode {entry.barcode} is in the product catalog, skipping OCR and Gemini")
+    scoring_engine = load_scoring_engine()
+    if entry.model_version != scoring_engine.version:
+        rescore_entry(
+            entry, scoring_engine.version,
+            score_ingredients_list(scoring_engine, entry.ingredients),
+            score_nutrition_result(scoring_engine, entry.nutrition),
+        )
+
+    analysis_summary = catalog_summary(entry)
+    history_id = save_scan_history(
+        user, scoring_engine, entry.ingredients, entry.nutrition,
+        entry.ingredients_score, entry.nutrition_score, analysis_summary,
+    )
+    if analysis_summary:
+        summary_status = History.SUMMARY_READY
+    elif history_id:
+        summary_status = History.SUMMARY_PENDING
+        if entry.source_history_id is None:
+            # The entry picks up this scan's summary once it is written
+            ProductCatalogEntry.objects.filter(pk=entry.pk).update(source_history_id=history_id)
+    else:
+        analysis_summary, summary_status = unsaved_scan_summary(
+            entry.ingredients, entry.nutrition, entry.ingredients_score, entry.nutrition_score
+        )
+
+    payload = scan_payload(
+        scoring_engine, history_id, entry.ingredients, entry.nutrition,
+        entry.ingredients_score, entry.nutrition_score, analysis_summary, summary_status
+    )
+    payload.update(barcode=entry.barcode, from_catalog=True)
+    return payload
+
+
+def catalog_scan_miss(barcode, ingredients_list, nutrition_result, payload):
+    """
+    Finish the payload of a scan that was not answered from the catalog, and
+    add its product to the catalog if it has a barcode and scanned cleanly.
+    """
+    if barcode and payload['history_id'] and ingredients_list != NO_INGREDIENTS_DETECTED:
+        add_product(
+            barcode, ingredients_list, nutrition_result, payload['ingredients']['score'],
+            payload['nutrition']['score'], payload['model_version'], payload['history_id'],
+        )
+    payload.update(barcode=barcode, from_catalog=False)
+    return payload
+
+
+def run_scan(user, ingredients_image, nutrition_image, profile=None):
+    """
+    Full scan pipeline shared by result_api and the scan job workers.
+
+    Products whose barcode is in the catalog are answered from there;
+    other scans are extracted, scored and then added to the catalog.
+
+    Args:
+        profile: Preprocessing profile for the nutrition label OCR
+
+    Returns:
+        dict: The result_api response payload
+
+    Raises:
+        ScanError: if any stage fails
+    """
+    ingredients_label, nutrition_label, barcode = read_scan_uploads(ingredients_image, nutrition_image)
+    entry = lookup_product(barcode) if barcode else None
+    if entry is not None:
+        return catalog_scan(user, entry)
+
+    ingredients_list, nutrition_result = run_extraction_legs(ingredients_label, nutrition_label, profile)
+    payload = score_scan(user, ingredients_list, nutrition_result)
+    return catalog_scan_miss(barcode, ingredients_list, nutrition_result, payload)
+
+
+async def score_scan_async(user, ingredients_list, nutrition_result):
+    """score_scan for async views: the models run on the leg executor, the ORM through sync_to_async"""
+    scoring_engine = await run_blocking(load_scoring_engine)
+    ingredients_score = await run_blocking(score_ingredients_list, scoring_engine, ingredients_list)
+    nutrition_score = await run_blocking(score_nutrition_result, scoring_engine, nutrition_result)
+
+    history_id = await sync_to_async(save_scan_history)(
+        user, scoring_engine, ingredients_list, nutrition_result, ingredients_score, nutrition_score
+    )
+    if history_id:
+        analysis_summary, summary_status = None, History.SUMMARY_PENDING
+    else:
+        analysis_summary, summary_status = await run_blocking(
+            unsaved_scan_summary, ingredients_list, nutrition_result, ingredients_score, nutrition_score
+        )
+
+    return scan_payload(
+        scoring_engine, history_id, ingredients_list, nutrition_result,
+        ingredients_score, nutrition_score, analysis_summary, summary_status
+    )
+
+
+async def run_scan_async(user, ingredients_image, nutrition_image, profile=None):
+    """
+    run_scan for async views.
+
+    The two legs run as coroutines on the request's event loop; threads are
+    only taken for OCR, model predicts and the ORM, not while waiting on
+    Gemini. Error precedence is the same as run_extraction_legs.
+    """
+    ingredients_label, nutrition_label, barcode = await run_blocking(
+        read_scan_uploads, ingredients_image, nutrition_image
+    )
+    entry = await sync_to_async(lookup_product)(barcode) if barcode else None
+    if entry is not None:
+        return await run_blocking(catalog_scan, user, entry)
+
+    ingredients_list, nutrition_result = await asyncio.gather(
+        extract_ingredients_async(ingredients_label),
+        extract_nutrition_async(nutrition_label, profile),
+        return_exceptions=True,
+    )
+    for outcome in (ingredients_list, nutrition_result):
+        if isinstance(outcome, BaseException):
+            raise outcome
+    payload = await score_scan_async(user, ingredients_list, nutrition_result)
+    return await sync_to_async(catalog_scan_miss)(barcode, ingredients_list, nutrition_result, payload)
+
+
+async def scan_events(user, ingredients_image, nutrition_image, profile=None, summary_timeout=None):
+    """
+    The scan pipeline as an async sequence of progress events, for streaming clients.
+
+    Events come out as soon as their stage is done: each extraction leg is
+    reported (and its part scored) when it finishes, so the first event
+    arrives after the faster leg rather than after the whole pipeline. Then
+    the total score once the scan is saved, the analysis summary once the
+    background summary worker has written it, and finally the full
+    result_api payload.
+
+    Yields:
+        tuple: (event name, data dict); event names are 'ingredients',
+        'ingredients_score', 'nutrition', 'nutrition_score', 'total_score',
+        'summary', 'result' and, in place of the remaining events, 'error'.
+        A product found in the catalog produces the same events, all at once.
+    """
+    legs = {}
+    try:
+        ingredients_label, nutrition_label, barcode = await run_blocking(
+            read_scan_uploads, ingredients_image, nutrition_image
+        )
+        entry = await sync_to_async(lookup_product)(barcode) if barcode else None
+        if entry is not None:
+            async for event in _catalog_events(await run_blocking(catalog_scan, user, entry), summary_timeout):
+                yield event
+            return
+
+        scoring_engine = await run_blocking(load_scoring_engine)
+        legs = {
+            asyncio.ensure_future(extract_ingredients_async(ingredients_label)): 'ingredients',
+            asyncio.ensure_future(extract_nutrition_async(nutrition_label, profile)): 'nutrition',
+        }
+        pending = set(legs)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda task: legs[task]):
+                if legs[task] == 'ingredients':
+                    ingredients_list = task.result()
+                    yield 'ingredients', {'raw_data': ingredients_list}
+                    ingredients_score = await run_blocking(score_ingredients_list, scoring_engine, ingredients_list)
+                    yield 'ingredients_score', {'score': ingredients_score}
+                else:
+                    nutrition_result = task.result()
+                    yield 'nutrition', {'data': format_nutrition(nutrition_result)}
+                    nutrition_score = await run_blocking(score_nutrition_result, scoring_engine, nutrition_result)
+                    yield 'nutrition_score', {'score': nutrition_score}
+
+        history_id = await sync_to_async(save_scan_history)(
+            user, scoring_engine, ingredients_list, nutrition_result, ingredients_score, nutrition_score
+        )
+        yield 'total_score', {
+            'score': combined_score(ingredients_score, nutrition_score),
+            'history_id': history_id,
+        }
+
+        if history_id:
+            history = await wait_for_summary_async(
+                history_id, settings.SUMMARY_MAX_WAIT if summary_timeout is None else summary_timeout
+            )
+            analysis_summary, summary_status = history.analysis_summary, history.summary_status
+        else:
+            analysis_summary, summary_status = await run_blocking(
+                unsaved_scan_summary, ingredients_list, nutrition_result, ingredients_score, nutrition_score
+            )
+        yield 'summary', {'analysis_summary': analysis_summary, 'summary_status': summary_status}
+
+        payload = scan_payload(
+            scoring_engine, history_id, ingredients_list, nutrition_result,
+            ingredients_score, nutrition_score, analysis_summary, summary_status
+        )
+        yield 'result', await sync_to_async(catalog_scan_miss)(barcode, ingredients_list, nutrition_result, payload)
+    except ScanError as e:
+        yield 'error', {'success': False, 'error': e.message, 'status': e.status}
+    except Exception as e:
+        logger.error(f"Streaming scan failed: {str(e)}", exc_info=True)
+        yield 'error', {'success': False, 'error': f'Unexpected error: {str(e)}', 'status': 500}
+    finally:
+        # A failed leg or a disconnected client leaves nothing running
+        for task in legs:
+            task.cancel()
+
+
+async def _catalog_events(payload, summary_timeout):
+    """scan_events of a catalog_scan payload"""
+    yield 'ingredients', {'raw_data': payload['ingredients']['raw_data']}
+    yield 'ingredients_score', {'score': payload['ingredients']['score']}
+    yield 'nutrition', {'data': payload['nutrition']['data']}
+    yield 'nutrition_score', {'score': payload['nutrition']['score']}
+    yield 'total_score', {'score': payload['total_score'], 'history_id': payload['history_id']}
+
+    if payload['summary_status'] == History.SUMMARY_PENDING:
+        history = await wait_for_summary_async(
+            payload['history_id'], settings.SUMMARY_MAX_WAIT if summary_timeout is None else summary_timeout
+        )
+        payload.update(analysis_summary=history.analysis_summary, summary_status=history.summary_status)
+    yield 'summary', {'analysis_summary': payload['analysis_summary'], 'summary_status': payload['summary_status']}
+    yield 'result', payload
+
+
+def parse_manual_entry(entry):
+    """
+    Validate one manual-entry payload.
+
+    Returns:
+        tuple: (ingredients_text, nutrition_input, model features)
+
+    Raises:
+        ValueError: with the message reported to the client
+    """
+    if not isinstance(entry, dict) or 'ingredients_text' not in entry or 'nutrition_data' not in entry:
+        raise ValueError('Both ingredients_text and nutrition_data are required')
+    ingredients_text = entry['ingredients_text']
+    nutrition_input = entry['nutrition_data']
+    if not isinstance(ingredients_text, str):
+        raise ValueError('ingredients_text must be a string')
+    if not isinstance(nutrition_input, dict):
+        raise ValueError('nutrition_data must be an object')
+    try:
+        features = nutrition_features_from_input(nutrition_input)
+    except (TypeError, ValueError):
+        raise ValueError('nutrition_data values must be numbers')
+    return ingredients_text, nutrition_input, features
+
+
+def score_manual_entry(scoring_engine, ingredients_text, nutrition_input):
+    """
+    Ingredients and nutrition scores of one manual entry.
+
+    Returns:
+        tuple: (ingredients_score, nutrition_score)
+
+    Raises:
+        ScanError: if scoring fails
+    """
+    try:
+        ingredients_score = float(scoring_engine.score_ingredients([ingredients_text])[0])
+        logger.info(f"Ingredients score: {ingredients_score}")
+    except Exception as e:
+        raise ScanError(f'Ingredients processing error: {str(e)}')
+
+    try:
+        # Parse nutrition input data
+        nutrition_features = nutrition_features_from_input(nutrition_input)
+        logger.info(f"Nutrition data for model: {nutrition_features}")
+
+        nutrition_score = float(scoring_engine.score_nutrition([nutrition_features])[0])
+        logger.info(f"Nutrition score: {nutrition_score}")
+    except Exception as e:
+        logger.error(f"Exception type: {type(e).__name__}")
+        logger.error(f"Exception details: {str(e)}")
+        logger.error(f"Model type: {type(scoring_engine.bundle.nutrition_model).__name__}")
+        raise ScanError(f'Nutrition processing error: {str(e)}')
+
+    return ingredients_score, nutrition_score
+
+
+def save_manual_entry(user, scoring_engine, ingredients_text, nutrition_input, ingredients_score, nutrition_score):
+    """
+    Save a scored manual entry to history and queue its analysis summary.
+
+    Returns:
+        dict: The manual-entry response payload
+
+    Raises:
+        ScanError: if the history row cannot be saved
+    """
+    # Convert ingredients text to list (assuming comma-separated format)
+    ingredients_list = [ingredient.strip() for ingredient in ingredients_text.split(',')]
+    total_score = combined_score(ingredients_score, nutrition_score)
+
+    try:
+        with transaction.atomic():
+            history = History.objects.create(
+                user=user,
+                ingredients_result=ingredients_score,
+                nutrition_result=nutrition_score,
+                total_result=total_score,
+                nutrition_data={key: nutrition_input.get(key) for key in NUTRITION_INPUT_KEYS},
+                ingredients_data={"raw_data": ingredients_list},
+                model_version=scoring_engine.version,
+                summary_status=History.SUMMARY_PENDING,
+            )
+            record_histories([history])
+            # Generated once, in the background; see get_history_summary
+            queue_summary(history)
+        logger.info(f"Successfully created history entry with ID: {history.id}")
+    except Exception as history_error:
+        logger.error(f"Failed to save to history: {str(history_error)}")
+        raise ScanError(f'Failed to save results: {str(history_error)}')
+
+    return {
+        'success': True,
+        'history_id': history.id,
+        'ingredients': {
+            'raw_data': ingredients_list,
+            'score': ingredients_score
+        },
+        'nutrition': {
+            'data': {
+                "Calories": nutrition_input.get('calories'),
+                "Protein (g)": nutrition_input.get('protein'),
+                "Fats (g)": nutrition_input.get('fats'),
+                "Carbohydrates (g)": nutrition_input.get('carbohydrates'),
+                "Sugars (g)": nutrition_input.get('sugar'),
+                "Sodium (mg)": nutrition_input.get('sodium'),
+                "Saturated Fat (g)": nutrition_input.get('saturated_fat'),
+                "Trans Fat (g)": nutrition_input.get('trans_fat'),
+                "Cholesterol (mg)": nutrition_input.get('cholesterol'),
+            },
+            'score': nutrition_score
+        },
+        'total_score': total_score,
+        'analysis_summary': None,
+        'summary_status': History.SUMMARY_PENDING,
+        'model_version': scoring_engine.version,
+        'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def manual_entry(user, ingredients_text, nutrition_input):
+    """
+    Score one manual entry, save it to history and queue its summary.
+
+    Returns:
+        dict: The manual-entry response payload
+
+    Raises:
+        ScanError: if any stage fails
+    """
+    scoring_engine = load_scoring_engine()
+    ingredients_score, nutrition_score = score_manual_entry(scoring_engine, ingredients_text, nutrition_input)
+    return save_manual_entry(
+        user, scoring_engine, ingredients_text, nutrition_input, ingredients_score, nutrition_score
+    )
+
+
+async def manual_entry_async(user, ingredients_text, nutrition_input):
+    """manual_entry for async views: predicts on the leg executor, the ORM through sync_to_async"""
+    scoring_engine = await run_blocking(load_scoring_engine)
+    ingredients_score, nutrition_score = await run_blocking(
+        score_manual_entry, scoring_engine, ingredients_text, nutrition_input
+    )
+    return await sync_to_async(save_manual_entry)(
+        user, scoring_engine, ingredients_text, nutrition_input, ingredients_score, nutrition_score
+    )
+
+
+def score_manual_entries(user, entries):
+    """
+    Score many manual entries at once and save them to history.
+
+    The whole batch goes through one vectorizer transform and one predict per
+    model (see ScoringEngine), and the History rows are written with
+    bulk_create. No analysis summaries are generated for bulk entries.
+
+    Args:
+        user: Owner of the history records
+        entries: list of (ingredients_text, nutrition_input, features) from parse_manual_entry
+
+    Returns:
+        tuple: (model version, list of per-entry result dicts in input order)
+    """
+    try:
+        scoring_engine = ScoringEngine(model_store.get())
+    except Exception as e:
+        raise ScanError(f'Model loading error: {str(e)}')
+
+    try:
+        scores = scoring_engine.score(
+            [ingredients_text for ingredients_text, _, _ in entries],
+            [features for _, _, features in entries],
+        )
+    except Exception as e:
+        logger.error(f"Bulk scoring of {len(entries)} entries failed: {str(e)}", exc_info=True)
+        raise ScanError(f'Scoring error: {str(e)}')
+
+    histories = []
+    for (ingredients_text, nutrition_input, _), score in zip(entries, scores):
+        histories.append(History(
+            user=user,
+            ingredients_result=score['ingredients_score'],
+            nutrition_result=score['nutrition_score'],
+            total_result=score['total_score'],
+            nutrition_data={key: nutrition_input.get(key) for key in NUTRITION_INPUT_KEYS},
+            ingredients_data={
+                "raw_data": [ingredient.strip() for ingredient in ingredients_text.split(',')]
+            },
+            model_version=scoring_engine.version,
+        ))
+
+    try:
+        with transaction.atomic():
+            histories = History.objects.bulk_create(histories, batch_size=500)
+            record_histories(histories)
+    except Exception as e:
+        raise ScanError(f'Failed to save results: {str(e)}')
+
+    results = [
+        dict(score, history_id=history.id)
+        for history, score in zip(histories, scores)
+    ]
+    return scoring_engine.version, results
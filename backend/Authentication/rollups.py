@@ -0,0 +1,299 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, IntegerField, Max, Min, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from models.scoring import NUTRITION_INPUT_KEYS
+from .models import History, UserDailyStats, UserHistoryStats, UserMetricStats
+
+logger = logging.getLogger(__name__)
+
+# Score name -> History column
+SCORE_METRICS = {
+    'ingredients': 'ingredients_result',
+    'nutrition': 'nutrition_result',
+    'total': 'total_result',
+}
+
+# Fields a History instance needs for collect_deltas
+HISTORY_ROLLUP_FIELDS = ['user_id', 'created_at', 'nutrition_data', *SCORE_METRICS.values()]
+
+
+def score_metric(name):
+    return f'score.{name}'
+
+
+def nutrient_metric(key):
+    return f'nutrient.{key}'
+
+
+def _number(value):
+    """A stored score or nutrient value as a float, None if it is missing or not numeric"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class RollupDelta:
+    """Changes to one user's rollup rows, accumulated in memory and written by apply_deltas"""
+
+    def __init__(self):
+        self.scans = 0
+        self.first_scan_at = None
+        self.last_scan_at = None
+        # metric -> [count, sum, min added, max added]
+        self.metrics = {}
+        # metric -> values taken out by a rescore; they may have been the min or max
+        self.removed = defaultdict(list)
+        # day -> [scans, ingredients score sum, nutrition score sum, total score sum]
+        self.days = {}
+
+    def add_value(self, metric, value):
+        if value is None:
+            return
+        entry = self.metrics.setdefault(metric, [0, 0.0, None, None])
+        entry[0] += 1
+        entry[1] += value
+        entry[2] = value if entry[2] is None else min(entry[2], value)
+        entry[3] = value if entry[3] is None else max(entry[3], value)
+
+    def remove_value(self, metric, value):
+        if value is None:
+            return
+        entry = self.metrics.setdefault(metric, [0, 0.0, None, None])
+        entry[0] -= 1
+        entry[1] -= value
+        self.removed[metric].append(value)
+
+    def _day(self, created_at):
+        return self.days.setdefault(timezone.localdate(created_at), [0, 0.0, 0.0, 0.0])
+
+    def add_history(self, created_at, scores, nutrition_data):
+        """Count one new History row; ``scores`` maps SCORE_METRICS names to values"""
+        self.scans += 1
+        self.first_scan_at = created_at if self.first_scan_at is None else min(self.first_scan_at, created_at)
+        self.last_scan_at = created_at if self.last_scan_at is None else max(self.last_scan_at, created_at)
+
+        day = self._day(created_at)
+        day[0] += 1
+        for position, name in enumerate(SCORE_METRICS, start=1):
+            day[position] += scores[name] or 0.0
+            self.add_value(score_metric(name), scores[name])
+
+        nutrition_data = nutrition_data if isinstance(nutrition_data, dict) else {}
+        for key in NUTRITION_INPUT_KEYS:
+            self.add_value(nutrient_metric(key), _number(nutrition_data.get(key)))
+
+    def rescore_history(self, created_at, old_scores, new_scores):
+        """Replace the scores of one already counted History row"""
+        day = self._day(created_at)
+        for position, name in enumerate(SCORE_METRICS, start=1):
+            day[position] += (new_scores[name] or 0.0) - (old_scores[name] or 0.0)
+            self.remove_value(score_metric(name), old_scores[name])
+            self.add_value(score_metric(name), new_scores[name])
+
+
+def history_scores(history):
+    return {name: _number(getattr(history, column)) for name, column in SCORE_METRICS.items()}
+
+
+def collect_deltas(histories, deltas=None):
+    """
+    Accumulate new History rows (instances with at least HISTORY_ROLLUP_FIELDS) per user.
+
+    Returns:
+        dict: user id -> RollupDelta
+    """
+    deltas = deltas if deltas is not None else defaultdict(RollupDelta)
+    for history in histories:
+        deltas[history.user_id].add_history(history.created_at, history_scores(history), history.nutrition_data)
+    return deltas
+
+
+def _case(column, values, default, output_field):
+    """CASE <column> WHEN key THEN value ... ELSE default END"""
+    whens = [When(**{column: key}, then=Value(value)) for key, value in values.items()]
+    if not whens:
+        return default
+    return Case(*whens, default=default, output_field=output_field)
+
+
+def _apply_user_delta(user_id, delta):
+    """Write one user's delta: one upsert for each rollup table, whatever the number of rows counted"""
+    if delta.scans:
+        UserHistoryStats.objects.bulk_create([UserHistoryStats(user_id=user_id)], ignore_conflicts=True)
+        UserHistoryStats.objects.filter(user_id=user_id).update(
+            scan_count=F('scan_count') + delta.scans,
+            first_scan_at=Least(Coalesce('first_scan_at', Value(delta.first_scan_at)), Value(delta.first_scan_at)),
+            last_scan_at=Greatest(Coalesce('last_scan_at', Value(delta.last_scan_at)), Value(delta.last_scan_at)),
+            updated_at=timezone.now(),
+        )
+
+    if delta.metrics:
+        metrics = delta.metrics
+        UserMetricStats.objects.bulk_create(
+            [UserMetricStats(user_id=user_id, metric=metric) for metric in metrics],
+            ignore_conflicts=True,
+        )
+        mins = _case('metric', {m: entry[2] for m, entry in metrics.items() if entry[2] is not None},
+                     F('min_value'), FloatField())
+        maxes = _case('metric', {m: entry[3] for m, entry in metrics.items() if entry[3] is not None},
+                      F('max_value'), FloatField())
+        UserMetricStats.objects.filter(user_id=user_id, metric__in=list(metrics)).update(
+            count=F('count') + _case('metric', {m: entry[0] for m, entry in metrics.items()}, Value(0), IntegerField()),
+            value_sum=F('value_sum') + _case('metric', {m: entry[1] for m, entry in metrics.items()},
+                                             Value(0.0), FloatField()),
+            # Coalesce so the first value counted replaces a NULL bound
+            min_value=Least(Coalesce(F('min_value'), mins), mins),
+            max_value=Greatest(Coalesce(F('max_value'), maxes), maxes),
+        )
+
+    if delta.days:
+        days = delta.days
+        UserDailyStats.objects.bulk_create(
+            [UserDailyStats(user_id=user_id, day=day) for day in days],
+            ignore_conflicts=True,
+        )
+        sums = {
+            field: F(field) + _case('day', {day: values[position] for day, values in days.items()},
+                                    Value(0.0), FloatField())
+            for position, field in enumerate(
+                ['ingredients_score_sum', 'nutrition_score_sum', 'total_score_sum'], start=1)
+        }
+        UserDailyStats.objects.filter(user_id=user_id, day__in=list(days)).update(
+            scan_count=F('scan_count') + _case('day', {day: values[0] for day, values in days.items()},
+                                               Value(0), IntegerField()),
+            **sums,
+        )
+
+    if delta.removed:
+        _refresh_bounds(user_id, delta.removed)
+
+
+def _refresh_bounds(user_id, removed):
+    """
+    Recompute the min/max of rescored metrics whose current bound is a value a rescore took out.
+
+    Sums and counts are updated by difference, but a min or max cannot be: when
+    the old value was the extreme the next one has to be read from History.
+    Only those metrics are re-aggregated, so rescores that leave the extremes
+    alone cost nothing extra.
+    """
+    stale = set()
+    for stats in UserMetricStats.objects.filter(user_id=user_id, metric__in=list(removed)):
+        values = removed[stats.metric]
+        if stats.min_value in values or stats.max_value in values:
+            stale.add(stats.metric)
+    if not stale:
+        return
+
+    columns = {score_metric(name): column for name, column in SCORE_METRICS.items()}
+    aggregates = {}
+    for metric in stale:
+        aggregates[f'{metric}.min'] = Min(columns[metric])
+        aggregates[f'{metric}.max'] = Max(columns[metric])
+    bounds = History.objects.filter(user_id=user_id).aggregate(**aggregates)
+    for metric in stale:
+        UserMetricStats.objects.filter(user_id=user_id, metric=metric).update(
+            min_value=bounds[f'{metric}.min'],
+            max_value=bounds[f'{metric}.max'],
+        )
+
+
+def apply_deltas(deltas):
+    """Write accumulated deltas in one transaction"""
+    with transaction.atomic():
+        for user_id, delta in deltas.items():
+            _apply_user_delta(user_id, delta)
+
+
+def record_histories(histories):
+    """
+    Add newly created History rows to their users' rollups.
+
+    Call it in the same transaction as the create / bulk_create so the
+    rollups never count a row that was not saved.
+    """
+    apply_deltas(collect_deltas(histories))
+
+
+def record_rescores(changes):
+    """
+    Apply score changes of existing History rows to the rollups.
+
+    Args:
+        changes: iterable of (user_id, created_at, old scores, new scores), scores
+            being {SCORE_METRICS name: value} dicts
+    """
+    deltas = defaultdict(RollupDelta)
+    for user_id, created_at, old_scores, new_scores in changes:
+        deltas[user_id].rescore_history(created_at, old_scores, new_scores)
+    apply_deltas(deltas)
+
+
+def reset_user_stats(user_ids=None):
+    """Delete rollup rows (of the given users, or all) before they are rebuilt"""
+    for model in (UserHistoryStats, UserMetricStats, UserDailyStats):
+        rows = model.objects.all() if user_ids is None else model.objects.filter(user_id__in=user_ids)
+        rows.delete()
+
+
+def _metric_summary(stats):
+    return {
+        'count': stats.count,
+        'average': stats.value_sum / stats.count if stats.count else None,
+        'min': stats.min_value,
+        'max': stats.max_value,
+    }
+
+
+def user_stats(user, days=30):
+    """
+    Aggregate history statistics for a user, read from the rollup tables.
+
+    The cost does not depend on the number of History rows: one row of
+    totals, one row per metric and at most ``days`` daily buckets.
+
+    Returns:
+        dict: scan counts, per-score and per-nutrient count/average/min/max,
+        and the daily buckets of the last ``days`` days that have scans
+    """
+    totals = UserHistoryStats.objects.filter(user=user).first()
+    scores = {}
+    nutrients = {}
+    for stats in UserMetricStats.objects.filter(user=user):
+        kind, _, name = stats.metric.partition('.')
+        if kind == 'score':
+            scores[name] = _metric_summary(stats)
+        elif kind == 'nutrient':
+            nutrients[name] = _metric_summary(stats)
+
+    since = timezone.localdate() - timedelta(days=days - 1)
+    daily = [
+        {
+            'date': bucket.day.isoformat(),
+            'scan_count': bucket.scan_count,
+            'average_scores': {
+                'ingredients': bucket.ingredients_score_sum / bucket.scan_count,
+                'nutrition': bucket.nutrition_score_sum / bucket.scan_count,
+                'total': bucket.total_score_sum / bucket.scan_count,
+            } if bucket.scan_count else None,
+        }
+        for bucket in UserDailyStats.objects.filter(user=user, day__gte=since).order_by('day')
+    ]
+
+    return {
+        'scan_count': totals.scan_count if totals else 0,
+        'first_scan_at': totals.first_scan_at.strftime('%Y-%m-%d %H:%M:%S') if totals and totals.first_scan_at else None,
+        'last_scan_at': totals.last_scan_at.strftime('%Y-%m-%d %H:%M:%S') if totals and totals.last_scan_at else None,
+        'scores': {name: scores.get(name) for name in SCORE_METRICS},
+        'nutrients': {key: nutrients.get(key) for key in NUTRITION_INPUT_KEYS},
+        'daily': daily,
+    }
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import wait
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from models.scoring import NUTRITION_FEATURES, NUTRITION_INPUT_KEYS
+from .analysis import generate_analysis_summary, generate_analysis_summary_async
+from .models import History
+
+logger = logging.getLogger(__name__)
+
+# Summaries are one Gemini round trip each and mostly wait on the network, so
+# they run as coroutines on one background event loop per process; up to
+# SUMMARY_CONCURRENCY of them are in flight at a time
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+# Notified whenever this process finishes a summary, to wake wait_for_summary early
+_summary_done = threading.Condition()
+# History id -> (event loop, future) of wait_for_summary_async callers
+_async_waiters = {}
+
+
+def _summary_loop():
+    """The background event loop, started on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='summary-loop', daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def summary_inputs(history):
+    """
+    generate_analysis_summary arguments for a History row.
+
+    Nutrition values are labelled like the result_api response
+    ("Protein (g)", ...), as the summaries always were, so the prompt and
+    its cache key do not change.
+    """
+    raw_data = history.ingredients_data.get('raw_data') if isinstance(history.ingredients_data, dict) else None
+    nutrition_data = history.nutrition_data if isinstance(history.nutrition_data, dict) else {}
+    return {
+        'ingredients_list': raw_data if raw_data is not None else [],
+        'nutrition_data': {
+            feature: nutrition_data.get(key)
+            for feature, key in zip(NUTRITION_FEATURES, NUTRITION_INPUT_KEYS)
+        },
+        'ingredients_score': history.ingredients_result or 0.0,
+        'nutrition_score': history.nutrition_result or 0.0,
+        'total_score': history.total_result or 0.0,
+    }
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _notify_summary_done(history_id):
+    with _summary_done:
+        _summary_done.notify_all()
+    with _pending_lock:
+        waiters = _async_waiters.pop(history_id, [])
+    for loop, future in waiters:
+        loop.call_soon_threadsafe(_wake, future)
+
+
+def _store_summary(history_id, summary, status):
+    close_old_connections()
+    History.objects.filter(id=history_id).update(analysis_summary=summary, summary_status=status)
+
+
+def _fallback_summary(history_id, total_score, error):
+    logger.error(f"Failed to generate analysis summary for history {history_id}: {str(error)}")
+    return f"This product received a score of {total_score or 0.0:.1f}/10."
+
+
+def generate_history_summary(history_id):
+    """
+    Generate the analysis summary of one History row and store it, blocking.
+
+    Makes exactly one generate_analysis_summary call. Used by
+    generate_pending_summaries; requests go through queue_summary.
+
+    Returns:
+        str or None: the summary, None if the row no longer exists
+    """
+    close_old_connections()
+    try:
+        history = History.objects.filter(id=history_id).first()
+        if history is None:
+            return None
+        try:
+            summary = generate_analysis_summary(**summary_inputs(history))
+            status = History.SUMMARY_READY
+        except Exception as e:
+            summary = _fallback_summary(history_id, history.total_result, e)
+            status = History.SUMMARY_FAILED
+        _store_summary(history_id, summary, status)
+        return summary
+    finally:
+        close_old_connections()
+        _notify_summary_done(history_id)
+
+
+def _load_history(history_id):
+    close_old_connections()
+    return History.objects.filter(id=history_id).first()
+
+
+async def generate_history_summary_async(history_id):
+    """generate_history_summary on the async Gemini client, run on the summary loop"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.SUMMARY_CONCURRENCY)
+    try:
+        async with _semaphore:
+            # The summary loop is not a request's loop: its ORM calls take pool threads
+            # rather than queueing behind requests on the thread-sensitive executor
+            history = await sync_to_async(_load_history, thread_sensitive=False)(history_id)
+            if history is None:
+                return None
+            try:
+                summary = await generate_analysis_summary_async(**summary_inputs(history))
+                status = History.SUMMARY_READY
+            except Exception as e:
+                summary = _fallback_summary(history_id, history.total_result, e)
+                status = History.SUMMARY_FAILED
+            await sync_to_async(_store_summary, thread_sensitive=False)(history_id, summary, status)
+            return summary
+    finally:
+        _notify_summary_done(history_id)
+
+
+def _submit_summary(history_id):
+    future = asyncio.run_coroutine_threadsafe(generate_history_summary_async(history_id), _summary_loop())
+    with _pending_lock:
+        _pending.add(future)
+
+    def finished(done):
+        with _pending_lock:
+            _pending.discard(done)
+        if done.exception() is not None:
+            logger.error(f"Summary task for history {history_id} failed: {str(done.exception())}")
+
+    future.add_done_callback(finished)
+
+
+def queue_summary(history):
+    """
+    Generate ``history``'s summary in the background once the current transaction commits.
+
+    The row should have been saved with summary_status=History.SUMMARY_PENDING.
+    """
+    history_id = history.id
+    transaction.on_commit(lambda: _submit_summary(history_id))
+
+
+def drain_summaries(timeout=None):
+    """Wait for every queued summary of this process to be written"""
+    with _pending_lock:
+        pending = list(_pending)
+    wait(pending, timeout=timeout)
+
+
+def wait_for_summary(history_id, timeout):
+    """
+    Block until a row's summary is no longer pending, or ``timeout`` seconds pass.
+
+    Summaries generated by this process wake the waiter immediately; the
+    database is also re-read every SUMMARY_POLL_INTERVAL seconds for ones
+    generated by other processes (e.g. the scan job workers).
+
+    Returns:
+        History or None if the row does not exist
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        history = _summary_state(history_id)
+        remaining = deadline - time.monotonic()
+        if history is None or history.summary_status != History.SUMMARY_PENDING or remaining <= 0:
+            return history
+        with _summary_done:
+            _summary_done.wait(min(remaining, settings.SUMMARY_POLL_INTERVAL))
+
+
+async def wait_for_summary_async(history_id, timeout):
+    """wait_for_summary for async views; waits on the event loop instead of a thread"""
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + timeout
+    while True:
+        history = await sync_to_async(_summary_state)(history_id)
+        remaining = deadline - time.monotonic()
+        if history is None or history.summary_status != History.SUMMARY_PENDING or remaining <= 0:
+            return history
+
+        waiter = (loop, loop.create_future())
+        with _pending_lock:
+            _async_waiters.setdefault(history_id, []).append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], min(remaining, settings.SUMMARY_POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with _pending_lock:
+                waiters = _async_waiters.get(history_id)
+                if waiters and waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del _async_waiters[history_id]
+
+
+def _summary_state(history_id):
+    return History.objects.filter(id=history_id).only(
+        'id', 'user_id', 'analysis_summary', 'summary_status'
+    ).first()
+
+
+def summary_payload(history):
+    return {
+        'success': True,
+        'history_id': history.id,
+        'summary_status': history.summary_status,
+        'analysis_summary': history.analysis_summary,
+    }
@@ -1,3 +1,893 @@
-from django.test import TestCase
+import asyncio
+import base64
+import functools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestClassifier, RandomForestRegressor
+from rest_framework_simplejwt.tokens import RefreshToken
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from models.engines import engine_registry
+from models.flat_forest import CHUNK_ROWS, flatten_forest, parity_rows
+from models.gemini_cache import gemini_cache
+from models.gemini_client import DEFAULT_GEMINI_CLIENT, GeminiClient, gemini_client
+from models.image_utils import LabelImage
+from models.ingrediants_ocr import IngredientExtractor
+from models.ingredient_lexicon import IngredientLexiconService, fix_ocr_digits
+from models.model_store import ModelBundle, model_store
+from models.nutrition_fact_ocr import FoodLabelOCR
+from models.perceptual_hash import HammingIndex, hamming_distance, image_hash
+from models.scoring import NUTRITION_FEATURES, ScoringEngine
+from models.stand_ins import (
+    DEFAULT_ANSWERS, SimulatedGeminiError, SimulatedGeminiModel, StubFoodLabelOCR, StubIngredientExtractor,
+)
+from .catalog import catalog_summary
+from .history import HISTORY_FIELDS, history_page
+from .jobs import enqueue_scan, process_job
+from .management.commands.benchmark_nutrition_ocr import (
+    DEFAULT_FIXTURES_DIR, NUTRITION_FIELDS, compare_modes, load_fixtures,
+)
+from .management.commands.benchmark_startup import LAZY_MODULES
+from .management.commands.load_test import LOAD_TEST_DOMAIN, Command as LoadTestCommand, parse_mix
+from .models import History, NutritionResult, OCRResult, ProductCatalogEntry, ScanJob, User
+from .near_duplicates import NearDuplicateIndex
+from .pipeline import parse_manual_entry, run_scan, unsaved_scan_summary
+from .rollups import SCORE_METRICS, history_scores, record_histories, record_rescores, user_stats
+from .summaries import drain_summaries, generate_history_summary, generate_history_summary_async
+
+
+def use_gemini(test, model):
+    """Answer the shared Gemini client's calls with ``model`` (None: Gemini is unavailable), uncached"""
+    for patcher in (
+        # Fresh limits and circuit breaker, so failures do not carry over to other tests
+        mock.patch.multiple(
+            gemini_client, _model=model, _model_failed=model is None, _limit=None, _bucket=None, _breaker=None,
+        ),
+        mock.patch.object(gemini_cache, '_config', dict(gemini_cache.config, ENABLED=False)),
+    ):
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+INGREDIENT_TEXTS = [
+    'wheat flour sugar palm oil salt', 'oats honey almonds', 'water sugar citric acid flavouring',
+    'milk cocoa sugar emulsifier', 'tomatoes olive oil salt basil', 'rice water salt',
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _fitted_models():
+    rng = np.random.default_rng(0)
+    vectorizer = TfidfVectorizer().fit(INGREDIENT_TEXTS)
+    texts = [' '.join(rng.choice(INGREDIENT_TEXTS, 2)) for _ in range(200)]
+    # Single output on sparse TF-IDF rows, like random_forest_model.pkl
+    ingredients_model = RandomForestRegressor(n_estimators=15, random_state=0).fit(
+        vectorizer.transform(texts), rng.random(200),
+    )
+    # Dense named features with [health class, score] outputs, like chirag_patil.pkl
+    X = pd.DataFrame(np.round(rng.random((300, len(NUTRITION_FEATURES))) * 100, 1), columns=NUTRITION_FEATURES)
+    score = X.iloc[:, 0] / 20 + rng.random(300)
+    nutrition_model = RandomForestRegressor(n_estimators=15, random_state=0).fit(
+        X, np.column_stack([score > 3, score]),
+    )
+    return vectorizer, ingredients_model, nutrition_model, flatten_forest(ingredients_model), flatten_forest(nutrition_model)
+
+
+def scoring_bundle(version='test', flat_forests=True):
+    """A ModelBundle of small forests shaped like the scoring models, which are not part of the repository"""
+    vectorizer, ingredients_model, nutrition_model, ingredients_forest, nutrition_forest = _fitted_models()
+    return ModelBundle(
+        vectorizer, ingredients_model, nutrition_model, version, None, {},
+        ingredients_forest=ingredients_forest if flat_forests else None,
+        nutrition_forest=nutrition_forest if flat_forests else None,
+    )
+
+
+def use_scoring_bundle(test, bundle):
+    patcher = mock.patch.object(model_store, 'get', return_value=bundle)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class GeminiCircuitTests(SimpleTestCase):
+    def _client(self, model):
+        client = GeminiClient(config=dict(DEFAULT_GEMINI_CLIENT, FAILURE_THRESHOLD=1, RESET_SECONDS=0))
+        client.model = model
+        return client
+
+    def test_cancelled_trial_frees_the_half_open_circuit(self):
+        client = self._client(SimulatedGeminiModel(error_rate=1.0))
+        with self.assertRaises(SimulatedGeminiError):
+            client.generate('summary')
+
+        # The next call is the half-open trial; cancel it while it waits on Gemini
+        client.model = SimulatedGeminiModel(latency=10)
+
+        async def cancel_trial():
+            task = asyncio.create_task(client.generate_async('summary'))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_trial())
+        client.model = SimulatedGeminiModel()
+        self.assertEqual(client.generate('summary'), DEFAULT_ANSWERS['summary'])
+        self.assertEqual(client.stats()['circuit'], 'closed')
+        self.assertEqual(client.stats()['in_flight'], 0)
+
+    def test_failed_trial_reopens_the_circuit(self):
+        client = self._client(SimulatedGeminiModel(error_rate=1.0))
+        for _ in range(2):
+            with self.assertRaises(SimulatedGeminiError):
+                client.generate('summary')
+        self.assertEqual(client.stats()['circuit'], 'open')
+        self.assertEqual(client.stats()['circuit_trips'], 2)
+
+
+# The summary workers open and close their own connections, so these tests commit for real
+class SummaryStatusTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='summary@example.com', password='password')
+        self.history = History.objects.create(
+            user=self.user, ingredients_result=6.0, nutrition_result=4.0, total_result=5.0,
+            ingredients_data={'raw_data': ['oats', 'sugar']}, nutrition_data={'calories': 380},
+            summary_status=History.SUMMARY_PENDING,
+        )
+
+    def _status(self):
+        self.history.refresh_from_db()
+        return self.history.summary_status
+
+    def test_outage_marks_the_summary_failed_and_the_command_retries_it(self):
+        use_gemini(self, None)
+        generate_history_summary(self.history.id)
+        self.assertEqual(self._status(), History.SUMMARY_FAILED)
+        self.assertIn('5.0/10', self.history.analysis_summary)
+
+        use_gemini(self, SimulatedGeminiModel())
+        call_command('generate_pending_summaries', older_than=0, stdout=StringIO())
+        self.assertEqual(self._status(), History.SUMMARY_READY)
+        self.assertEqual(self.history.analysis_summary, DEFAULT_ANSWERS['summary'])
+
+    def test_async_outage_marks_the_summary_failed(self):
+        use_gemini(self, SimulatedGeminiModel(error_rate=1.0))
+        asyncio.run(generate_history_summary_async(self.history.id))
+        self.assertEqual(self._status(), History.SUMMARY_FAILED)
+
+    def test_empty_answer_is_a_failure(self):
+        use_gemini(self, SimulatedGeminiModel(answers={'summary': ''}))
+        generate_history_summary(self.history.id)
+        self.assertEqual(self._status(), History.SUMMARY_FAILED)
+
+    def test_unsaved_scan_summary_reports_the_failure(self):
+        use_gemini(self, None)
+        summary, status = unsaved_scan_summary(['oats'], NutritionResult(calories=380), 6.0, 4.0)
+        self.assertEqual(status, History.SUMMARY_FAILED)
+        self.assertIn('/10', summary)
+
+
+class CatalogSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='catalog@example.com', password='password')
+        self.source = History.objects.create(user=self.user, total_result=5.0, summary_status=History.SUMMARY_PENDING)
+        self.entry = ProductCatalogEntry.objects.create(
+            barcode='5901234123457', ingredients=['oats'], nutrition=NutritionResult.objects.create(calories=380),
+            ingredients_score=6.0, nutrition_score=4.0, model_version='v1', source_history=self.source,
+        )
+
+    def _finish_source(self, status, summary):
+        History.objects.filter(id=self.source.id).update(summary_status=status, analysis_summary=summary)
+
+    def test_copies_a_generated_summary(self):
+        self.assertIsNone(catalog_summary(self.entry))
+        self._finish_source(History.SUMMARY_READY, 'Low in sugar.')
+        self.assertEqual(catalog_summary(self.entry), 'Low in sugar.')
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.analysis_summary, 'Low in sugar.')
+
+    def test_does_not_copy_a_fallback_summary(self):
+        self._finish_source(History.SUMMARY_FAILED, 'This product received a score of 5.0/10.')
+        self.assertIsNone(catalog_summary(self.entry))
+        self.entry.refresh_from_db()
+        self.assertIsNone(self.entry.analysis_summary)
+        # The next scan of the product supplies the summary
+        self.assertIsNone(self.entry.source_history_id)
+
+    def test_refresh_command_drops_or_removes_entries(self):
+        ProductCatalogEntry.objects.filter(pk=self.entry.pk).update(analysis_summary='Stale summary.')
+        call_command('refresh_product_catalog', self.entry.barcode, stdout=StringIO(), stderr=StringIO())
+        self.entry.refresh_from_db()
+        self.assertIsNone(self.entry.analysis_summary)
+        self.assertIsNone(self.entry.source_history_id)
+
+        call_command('refresh_product_catalog', '--all', '--remove', stdout=StringIO())
+        self.assertFalse(ProductCatalogEntry.objects.exists())
+
+
+class FlatForestParityTests(SimpleTestCase):
+    """FlatForest.predict must give exactly what sklearn's predict gives"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        bundle = scoring_bundle()
+        cls.vectorizer, cls.ingredients_model, cls.nutrition_model = (
+            bundle.vectorizer, bundle.ingredients_model, bundle.nutrition_model,
+        )
+        cls.ingredients_forest, cls.nutrition_forest = bundle.ingredients_forest, bundle.nutrition_forest
+
+    def _nutrition_rows(self, count, rng):
+        """Random rows, half of them with features set to (or next to) split thresholds"""
+        rows = np.round(rng.random((count, len(NUTRITION_FEATURES))) * 100, 1)
+        boundary = parity_rows(self.nutrition_forest, count, rng).toarray()
+        return np.where(rng.random((count, 1)) < 0.5, rows, boundary)
+
+    def test_dense_batches_match_predict(self):
+        rng = np.random.default_rng(1)
+        for size in (1, 2, 31, 32, 33, 100, CHUNK_ROWS + 1):
+            rows = self._nutrition_rows(size, rng)
+            expected = self.nutrition_model.predict(pd.DataFrame(rows, columns=NUTRITION_FEATURES))
+            np.testing.assert_array_equal(self.nutrition_forest.predict(rows), expected, err_msg=f'{size} rows')
+
+    def test_sparse_batches_match_predict(self):
+        rng = np.random.default_rng(2)
+        for size in (1, 31, 32, 33, CHUNK_ROWS + 1):
+            for X in (
+                parity_rows(self.ingredients_forest, size, rng),
+                self.vectorizer.transform([' '.join(rng.choice(INGREDIENT_TEXTS, 3)) for _ in range(size)]),
+            ):
+                np.testing.assert_array_equal(
+                    self.ingredients_forest.predict(X), self.ingredients_model.predict(X), err_msg=f'{size} rows',
+                )
+                np.testing.assert_array_equal(self.ingredients_forest.predict(X), self.ingredients_forest.predict(X.toarray()))
+
+    def test_scoring_engine_uses_the_flat_forest_up_to_the_cutoff(self):
+        rng = np.random.default_rng(3)
+        flat, plain = ScoringEngine(scoring_bundle()), ScoringEngine(scoring_bundle(flat_forests=False))
+        with override_settings(ML_FLAT_FOREST_MAX_ROWS=32):
+            for size in (1, 31, 32, 33, 64):
+                texts = [' '.join(rng.choice(INGREDIENT_TEXTS, 2)) for _ in range(size)]
+                rows = [dict(zip(NUTRITION_FEATURES, row)) for row in self._nutrition_rows(size, rng)]
+                with mock.patch.object(self.nutrition_forest, 'predict', wraps=self.nutrition_forest.predict) as predict:
+                    np.testing.assert_array_equal(flat.score_nutrition(rows), plain.score_nutrition(rows))
+                self.assertEqual(predict.called, size <= 32, f'{size} rows')
+                np.testing.assert_array_equal(flat.score_ingredients(texts), plain.score_ingredients(texts))
+
+    def test_rejects_bad_input(self):
+        rows = np.zeros((2, len(NUTRITION_FEATURES)))
+        with self.assertRaises(ValueError):
+            self.nutrition_forest.predict(rows[:, :-1])
+        rows[1, 3] = np.nan
+        with self.assertRaises(ValueError):
+            self.nutrition_forest.predict(rows)
+
+    def test_only_forest_regressors_are_flattened(self):
+        X, y = np.arange(20.0).reshape(10, 2), np.arange(10) % 2
+        self.assertIsNone(flatten_forest(GradientBoostingRegressor(n_estimators=3).fit(X, y)))
+        self.assertIsNone(flatten_forest(RandomForestClassifier(n_estimators=3).fit(X, y)))
+
+    def test_nutrition_model_with_other_column_order_is_not_flattened(self):
+        self.assertIsNotNone(model_store._flat_forest('nutrition', self.nutrition_model))
+        # The flat forest is fed NUTRITION_FEATURES by position, so it would score the wrong columns
+        rng = np.random.default_rng(4)
+        columns = NUTRITION_FEATURES[::-1]
+        X = pd.DataFrame(rng.random((50, len(columns))) * 100, columns=columns)
+        model = RandomForestRegressor(n_estimators=3, random_state=0).fit(X, rng.random(50))
+        self.assertIsNone(model_store._flat_forest('nutrition', model))
+
+
+class NonFiniteNutritionTests(TestCase):
+    """"nan" parses as a float; the flat forest and sklearn must never see it, whatever the batch size"""
+
+    entry = {'ingredients_text': 'oats, sugar', 'nutrition_data': {'calories': 'nan', 'protein': 3}}
+
+    def setUp(self):
+        user = User.objects.create_user(email='manual@example.com', password='password')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def test_parse_rejects_non_finite_values(self):
+        for value in ('nan', 'inf', '-Infinity', float('nan')):
+            with self.assertRaisesMessage(ValueError, 'nutrition_data values must be numbers'):
+                parse_manual_entry({'ingredients_text': 'oats', 'nutrition_data': {'sugar': value}})
+
+    def test_single_and_bulk_entries_are_rejected_alike(self):
+        for path in ('/manual-entry/', '/manual-entry/async/'):
+            response = self.client.post(path, self.entry, content_type='application/json')
+            self.assertEqual(response.status_code, 400, path)
+            self.assertEqual(response.json()['error'], 'nutrition_data values must be numbers')
+
+        valid = dict(self.entry, nutrition_data={'calories': 120})
+        # Over ML_FLAT_FOREST_MAX_ROWS entries, which would be scored by sklearn
+        response = self.client.post(
+            '/manual-entry/bulk/', {'entries': [valid] * 40 + [self.entry]}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'index': 40, 'error': 'nutrition_data values must be numbers'}])
+        self.assertFalse(History.objects.exists())
+
+
+def manual_entries(count):
+    """Manual-entry payloads whose ingredients and nutrition differ, so their scores do too"""
+    return [
+        {
+            'ingredients_text': ', '.join(INGREDIENT_TEXTS[i % len(INGREDIENT_TEXTS)].split()),
+            'nutrition_data': {'calories': 40 + 35 * i, 'protein': i % 7, 'sugar': 3 * i, 'sodium': 0.1 * i},
+        }
+        for i in range(count)
+    ]
+
+
+def assert_rollups_match_history(test, user):
+    # The comparison rebuild_history_stats --check runs, raising CommandError on a mismatch
+    call_command('rebuild_history_stats', check=True, stdout=StringIO(), stderr=StringIO())
+
+    stats = user_stats(user)
+    rows = History.objects.filter(user=user)
+    test.assertEqual(stats['scan_count'], rows.count())
+    for name, column in SCORE_METRICS.items():
+        fresh = rows.aggregate(count=Count(column), average=Avg(column), min=Min(column), max=Max(column))
+        test.assertEqual(stats['scores'][name]['count'], fresh['count'], name)
+        test.assertEqual(stats['scores'][name]['min'], fresh['min'], name)
+        test.assertEqual(stats['scores'][name]['max'], fresh['max'], name)
+        test.assertAlmostEqual(stats['scores'][name]['average'], fresh['average'], msg=name)
+
+
+class HistoryRollupTests(TestCase):
+    """user-stats/ is read from rollups kept up to date by every write; they must equal a fresh aggregate"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='rollups@example.com', password='password')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        use_scoring_bundle(self, scoring_bundle())
+
+    def test_single_bulk_and_rescore_writes(self):
+        entries = manual_entries(6)
+        for entry in entries[:2]:
+            response = self.client.post('/manual-entry/', entry, content_type='application/json')
+            self.assertEqual(response.status_code, 200, response.content)
+        response = self.client.post('/manual-entry/bulk/', {'entries': entries[2:]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        assert_rollups_match_history(self, self.user)
+
+        rows = list(History.objects.filter(user=self.user).order_by('total_result'))
+        lowest, middle, highest = rows[0], rows[len(rows) // 2], rows[-1]
+        before = user_stats(self.user)['scores']['total']
+        self.assertEqual((before['min'], before['max']), (lowest.total_result, highest.total_result))
+
+        # Rescore the rows holding the min and max of every score to values inside the range
+        changes = []
+        for history in (lowest, highest):
+            old_scores = history_scores(history)
+            new_scores = history_scores(middle)
+            History.objects.filter(pk=history.pk).update(
+                **{column: new_scores[name] for name, column in SCORE_METRICS.items()}
+            )
+            changes.append((self.user.pk, history.created_at, old_scores, new_scores))
+        record_rescores(changes)
+
+        after = user_stats(self.user)['scores']['total']
+        self.assertGreater(after['min'], before['min'])
+        self.assertLess(after['max'], before['max'])
+        assert_rollups_match_history(self, self.user)
+
+    def test_rescore_of_the_median_row(self):
+        for entry in manual_entries(3):
+            self.client.post('/manual-entry/', entry, content_type='application/json')
+        lowest, middle, highest = History.objects.filter(user=self.user).order_by('total_result')
+        old_scores = history_scores(middle)
+        new_scores = {name: (getattr(lowest, column) + getattr(highest, column)) / 2
+                      for name, column in SCORE_METRICS.items()}
+        History.objects.filter(pk=middle.pk).update(
+            **{column: new_scores[name] for name, column in SCORE_METRICS.items()}
+        )
+        record_rescores([(self.user.pk, middle.created_at, old_scores, new_scores)])
+        assert_rollups_match_history(self, self.user)
+
+
+class RescoreHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='rescore@example.com', password='password')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        use_scoring_bundle(self, scoring_bundle('v1'))
+        entries = manual_entries(6)
+        self.client.post('/manual-entry/', entries[0], content_type='application/json')
+        self.client.post('/manual-entry/bulk/', {'entries': entries[1:]}, content_type='application/json')
+        with transaction.atomic():
+            self.unreadable = History.objects.create(
+                user=self.user, total_result=1.0, nutrition_data={'calories': 'n/a'}, model_version='v1',
+            )
+            record_histories([self.unreadable])
+        # Scores of an older model, different from what v2 predicts; the rollups follow them
+        for position, history in enumerate(History.objects.exclude(pk=self.unreadable.pk).order_by('id')):
+            History.objects.filter(pk=history.pk).update(
+                ingredients_result=10.0 + position, nutrition_result=-position, total_result=20.0 - position,
+            )
+        call_command('rebuild_history_stats', stdout=StringIO())
+
+    def rescore(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('rescore_history', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_resume_skips_rescored_rows(self):
+        use_scoring_bundle(self, scoring_bundle('v2'))
+        stdout, _ = self.rescore('--limit', '2', '--chunk-size', '1')
+        self.assertIn('Rescoring 2 history row(s) with model version v2', stdout)
+        first = list(History.objects.order_by('id').values_list('model_version', flat=True))
+        self.assertEqual(first, ['v2', 'v2'] + ['v1'] * 5)
+        assert_rollups_match_history(self, self.user)
+
+        # The interrupted run is started again: only the rows still at v1 are read
+        stdout, stderr = self.rescore('--chunk-size', '2')
+        self.assertIn('Rescoring 5 history row(s) with model version v2', stdout)
+        self.assertIn('Rescored 4 row(s)', stdout)
+        self.assertIn('1 skipped', stdout)
+        self.assertEqual(stderr, f'Skipping history {self.unreadable.pk}: unreadable nutrition_data\n')
+
+        versions = dict(History.objects.values_list('id', 'model_version'))
+        self.assertEqual(versions.pop(self.unreadable.pk), 'v1')
+        self.assertEqual(set(versions.values()), {'v2'})
+        self.unreadable.refresh_from_db()
+        self.assertEqual(self.unreadable.total_result, 1.0)
+
+        # Nothing left but the unreadable row, which is read and skipped again
+        stdout, _ = self.rescore()
+        self.assertIn('Rescoring 1 history row(s)', stdout)
+
+    def test_rollups_follow_the_new_scores(self):
+        before = user_stats(self.user)['scores']['ingredients']
+        self.assertEqual((before['min'], before['max']), (10.0, 15.0))
+
+        use_scoring_bundle(self, scoring_bundle('v2'))
+        self.rescore()
+        rescored = History.objects.filter(model_version='v2')
+        self.assertEqual(rescored.count(), 6)
+        # The ingredients model predicts in [0, 1], below every older score
+        self.assertLess(user_stats(self.user)['scores']['ingredients']['max'], 10.0)
+        assert_rollups_match_history(self, self.user)
+
+        # A dry run scores but writes neither History nor the rollups
+        History.objects.filter(model_version='v2').update(model_version='v1')
+        stats = user_stats(self.user)
+        stdout, _ = self.rescore('--dry-run')
+        self.assertIn('Scored 6 row(s)', stdout)
+        self.assertEqual(user_stats(self.user), stats)
+        self.assertFalse(History.objects.filter(model_version='v2').exists())
+
+
+class HistoryPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='history@example.com', password='password')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        History.objects.bulk_create(
+            History(user=self.user, total_result=float(i), nutrition_data={'calories': i}) for i in range(7)
+        )
+        # Bulk writes and clock resolution give rows the same created_at; the cursor must break those ties on id
+        now = timezone.now()
+        ids = list(History.objects.order_by('id').values_list('id', flat=True))
+        for position, history_id in enumerate(ids):
+            History.objects.filter(pk=history_id).update(created_at=now - timedelta(minutes=position // 3))
+        self.expected = list(History.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_pages_cover_rows_sharing_created_at_once(self):
+        for limit in range(1, len(self.expected) + 1):
+            seen = []
+            cursor = None
+            while True:
+                records, cursor = history_page(self.user, limit, cursor=cursor, fields=['id'])
+                self.assertLessEqual(len(records), limit)
+                seen += [record['id'] for record in records]
+                if cursor is None:
+                    break
+            self.assertEqual(seen, self.expected, f'limit={limit}')
+
+    def test_invalid_cursor(self):
+        for cursor in ('not a cursor', 'bm9waXBl', base64.urlsafe_b64encode(b'2024-01-01T00:00:00|abc').decode()):
+            response = self.client.get('/user-history/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json()['error'], 'Invalid cursor')
+
+    def test_fields_projection(self):
+        response = self.client.get('/user-history/', {'fields': 'scores, id', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        history = response.json()['history']
+        self.assertEqual([record['id'] for record in history], self.expected[:2])
+        for record in history:
+            self.assertEqual(set(record), {'id', 'scores'})
+            self.assertEqual(set(record['scores']), {'ingredients', 'nutrition', 'total'})
+
+        response = self.client.get('/user-history/', {'limit': 1, 'cursor': response.json()['next_cursor']})
+        self.assertEqual(set(response.json()['history'][0]), set(HISTORY_FIELDS))
+        self.assertEqual(response.json()['history'][0]['id'], self.expected[2])
+
+        response = self.client.get('/user-history/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Unknown field(s): password')
+
+
+class HammingIndexTests(SimpleTestCase):
+    def test_search_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        centres = [int(value) for value in rng.integers(0, 2 ** 63, 40, dtype=np.uint64)]
+
+        def near(value):
+            # Flip up to 12 random bits, so every tested distance has matches and misses
+            for bit in rng.choice(64, rng.integers(0, 13), replace=False):
+                value ^= 1 << int(bit)
+            return value
+
+        entries = [(key, near(centres[key % len(centres)])) for key in range(600)]
+        queries = [near(centre) for centre in centres] + [int(rng.integers(0, 2 ** 63, dtype=np.uint64))]
+
+        for max_distance in (0, 3, 6, 10):
+            # A small pending buffer, so the entries are spread over merged columns and pending slots
+            with mock.patch('models.perceptual_hash.MIN_PENDING', 32):
+                index = HammingIndex(max_distance)
+                index.extend(*zip(*entries[:500]))
+                self.assertEqual(index._pending_count, 0)
+                added = 500
+                for key, value in entries[500:]:
+                    index.add(key, value)
+                    added += 1
+                    if added % 25:
+                        continue
+                    self.assertGreater(index._pending_count, 0)
+                    for query in queries:
+                        expected = sorted(
+                            (hamming_distance(query, value), key) for key, value in entries[:added]
+                            if hamming_distance(query, value) <= max_distance
+                        )
+                        self.assertEqual(index.search(query), expected, f'max_distance={max_distance}')
+                self.assertEqual(len(index), len(entries))
+                # Past 1/PENDING_FRACTION of 500 merged entries, the buffer was merged at least once more
+                self.assertGreater(len(index._keys), 500)
+
+
+@override_settings(NEAR_DUPLICATE_SCANS={'METHOD': 'phash', 'MAX_DISTANCE': 6, 'REFRESH_SECONDS': 0})
+class NearDuplicateIndexTests(TestCase):
+    def setUp(self):
+        self.image = cv2.resize(np.random.default_rng(0).integers(0, 255, (8, 8, 3), dtype=np.uint8), (64, 48))
+        self.hash = f"phash:{image_hash(self.image, 'phash'):016x}"
+        self.index = NearDuplicateIndex('nutrition', NutritionResult)
+
+    def find(self, **kwargs):
+        return self.index.find(self.image, usable=lambda row: True, **kwargs)
+
+    def test_refresh_and_add_index_each_row_once(self):
+        first = NutritionResult.objects.create(perceptual_hash=self.hash, calories=100)
+        self.assertEqual(self.find(), (self.hash, first))
+        self.assertEqual(self.index.stats()['indexed'], 1)
+
+        # Saved by this worker: indexed by add(), then re-read by the next refreshes
+        mine = NutritionResult.objects.create(perceptual_hash=self.hash)
+        self.index.add(mine.id, self.hash)
+        self.index.add(mine.id, self.hash)
+        self.assertEqual(self.index.stats()['indexed'], 2)
+        # Saved by another worker: only a refresh finds it
+        other = NutritionResult.objects.create(perceptual_hash=self.hash)
+        for _ in range(3):
+            self.assertEqual(self.find(), (self.hash, first))
+            self.assertEqual(self.index.stats()['indexed'], 3)
+        self.assertEqual(
+            [key for _, key in self.index._index.search(int(self.hash[6:], 16))], [first.id, mine.id, other.id],
+        )
+
+        # Hashes of the other method are not indexed
+        NutritionResult.objects.create(perceptual_hash='dhash:' + self.hash[6:])
+        self.index.add(first.id + 100, 'dhash:' + self.hash[6:])
+        self.find()
+        self.assertEqual(self.index.stats()['indexed'], 3)
+
+    def test_spot_check_rejection(self):
+        NutritionResult.objects.create(perceptual_hash=self.hash, calories=100)
+        checked = []
+        perceptual_hash, row = self.find(confirm=lambda row: checked.append(row) or False)
+        self.assertEqual((perceptual_hash, row), (self.hash, None))
+        self.assertEqual(len(checked), 1)
+        stats = self.index.stats()
+        self.assertEqual((stats['lookups'], stats['hits'], stats['spot_check_rejections']), (1, 0, 1))
+
+        self.assertEqual(self.find(confirm=lambda row: True)[1], checked[0])
+        self.assertEqual(self.index.stats()['hits'], 1)
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_urlconf_loads_no_lazy_module(self):
+        code = (
+            "import json, sys\n"
+            "from backend.wsgi import application\n"
+            "from django.urls import get_resolver\n"
+            "get_resolver().url_patterns\n"
+            f"print(json.dumps([module for module in {LAZY_MODULES!r} if module in sys.modules]))\n"
+        )
+        # A fresh interpreter: this one has imported most of them already
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='backend.settings', OCR_WARM_UP_ON_STARTUP='0'),
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [])
+
+
+def label_image():
+    """A small encoded JPEG; the stub engines never look at its pixels"""
+    return LabelImage(cv2.imencode('.jpg', np.full((48, 64, 3), 255, dtype=np.uint8))[1].tobytes())
+
+
+def use_temp_media(test):
+    """Store uploads under a temporary MEDIA_ROOT, removed after the test"""
+    media = tempfile.TemporaryDirectory()
+    test.addCleanup(media.cleanup)
+    test.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+
+def use_stand_ins(test):
+    """Scan with the stub OCR engines and a simulated Gemini model, which is returned"""
+    engine_registry.shutdown()
+    engine_registry.register('ingredients', StubIngredientExtractor)
+    engine_registry.register('nutrition', StubFoodLabelOCR)
+    test.addCleanup(engine_registry.configure)
+    test.addCleanup(engine_registry.shutdown)
+    model = SimulatedGeminiModel()
+    use_gemini(test, model)
+    return model
+
+
+class StandInTests(SimpleTestCase):
+    def setUp(self):
+        self.model = SimulatedGeminiModel()
+        use_gemini(self, self.model)
+
+    def test_simulated_gemini_answers_each_prompt(self):
+        extractor = StubIngredientExtractor()
+        ingredients_prompt, _ = extractor._gemini_request('INGREDIENTS: sugar', None)
+        self.assertEqual(
+            json.loads(self.model.generate_content(ingredients_prompt).text),
+            ['wheat flour', 'sugar', 'palm oil', 'salt', 'yeast'],
+        )
+        nutrition_prompt, _ = StubFoodLabelOCR()._gemini_request('Energy 450 kcal', None)
+        self.assertEqual(json.loads(self.model.generate_content(nutrition_prompt).text)['calories'], 450)
+        self.assertEqual(self.model.generate_content('Summarize this product').text, DEFAULT_ANSWERS['summary'])
+        self.assertEqual(self.model.calls, 3)
+
+    def test_simulated_gemini_errors_and_latency(self):
+        failing = SimulatedGeminiModel(latency=0.05, error_rate=1.0)
+        started = time.perf_counter()
+        with self.assertRaises(SimulatedGeminiError):
+            failing.generate_content('Summarize this product')
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+        self.assertEqual((failing.calls, failing.errors), (1, 1))
+
+    def test_stub_ingredient_extractor(self):
+        extractor = StubIngredientExtractor()
+        self.assertEqual(extractor.extract_from_image(label_image()), extractor.text)
+        expected = ['wheat flour', 'sugar', 'palm oil', 'salt', 'yeast']
+        self.assertEqual(extractor.extract_text(label_image()), expected)
+        # Without the lexicon's shortcut the list comes from the Gemini stand-in
+        with mock.patch.object(IngredientExtractor, 'ingredients_from_lexicon', return_value=None):
+            self.assertEqual(extractor.extract_text(label_image()), expected)
+        self.assertEqual(self.model.calls, 1)
+
+    def test_stub_food_label_ocr(self):
+        ocr = StubFoodLabelOCR()
+        nutrition, text = ocr.process_image(label_image(), save_to_db=False)
+        self.assertEqual(text, ocr.text)
+        self.assertEqual(nutrition['calories'], 450.0)
+        self.assertEqual(nutrition['saturated_fat_100g'], 8.0)
+        self.assertEqual(self.model.calls, 1)
+
+
+class LoadTestDriverTests(TransactionTestCase):
+    def setUp(self):
+        use_temp_media(self)
+        # Both uploads are kept on disk, so the cleanup has files to remove
+        self.enterContext(override_settings(SCAN_UPLOAD_RETENTION={'INGREDIENTS': True, 'NUTRITION': True}))
+        use_scoring_bundle(self, scoring_bundle())
+
+    def _run(self, **options):
+        command = LoadTestCommand(stdout=StringIO(), stderr=StringIO())
+        call_command(
+            command, rps=10, duration=1, users=2, stub_ocr=True, gemini_latency=0, ocr_latency=0, workers=4,
+            mix='scan=3,manual=1,history=1,login=1', **options,
+        )
+        return command
+
+    def _assert_all_ok(self, command):
+        outcomes = command.results.outcomes
+        self.assertEqual(outcomes['register']['ok'], 2)
+        for endpoint, counts in outcomes.items():
+            self.assertEqual(set(counts), {'ok'}, f'{endpoint}: {dict(counts)}')
+        self.assertEqual(sum(sum(counts.values()) for endpoint, counts in outcomes.items() if endpoint != 'register'), 10)
+        report = command.stdout.getvalue()
+        for endpoint in outcomes:
+            self.assertRegex(report, rf'\n\s*{endpoint}\s+\d+')
+        self.assertGreater(outcomes['scan']['ok'], 0)
+        # The virtual users, their history and their scans' rows and images are removed afterwards
+        self.assertFalse(User.objects.filter(email__endswith=LOAD_TEST_DOMAIN).exists())
+        self.assertFalse(OCRResult.objects.exists())
+        self.assertFalse(NutritionResult.objects.exists())
+        self.assertEqual([files for _, _, files in os.walk(settings.MEDIA_ROOT) if files], [])
+
+    def test_wsgi_run(self):
+        self._assert_all_ok(self._run())
+
+    def test_asgi_run(self):
+        self._assert_all_ok(self._run(handler='asgi'))
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('scan=2, history'), {'scan': 2.0, 'history': 1.0})
+        for mix in ('register=1', 'scan=x', 'scan=0'):
+            with self.assertRaises(CommandError):
+                parse_mix(mix)
+
+
+@override_settings(NEAR_DUPLICATE_SCANS=dict(settings.NEAR_DUPLICATE_SCANS, ENABLED=False), SCAN_DEDUP_ENABLED=False)
+class CatalogScanTests(TransactionTestCase):
+    barcode = '5901234123457'
+
+    def setUp(self):
+        use_temp_media(self)
+        self.gemini = use_stand_ins(self)
+        use_scoring_bundle(self, scoring_bundle('v1'))
+        for patcher in (
+            mock.patch('Authentication.pipeline.catalog_enabled', return_value=True),
+            mock.patch('Authentication.pipeline.find_barcode', return_value=self.barcode),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(drain_summaries, timeout=30)
+        self.user = User.objects.create_user(email='catalog-scan@example.com', password='password')
+
+    def _scan(self):
+        return run_scan(self.user, label_image(), label_image())
+
+    def test_miss_then_hit(self):
+        miss = self._scan()
+        self.assertFalse(miss['from_catalog'])
+        entry = ProductCatalogEntry.objects.get(barcode=self.barcode)
+        self.assertEqual(entry.source_history_id, miss['history_id'])
+        self.assertEqual(entry.model_version, 'v1')
+        drain_summaries(timeout=30)
+
+        calls = self.gemini.calls
+        hit = self._scan()
+        self.assertTrue(hit['from_catalog'])
+        # Answered without OCR, Gemini or a new summary
+        self.assertEqual(self.gemini.calls, calls)
+        self.assertEqual(hit['analysis_summary'], History.objects.get(id=miss['history_id']).analysis_summary)
+        self.assertEqual(hit['ingredients']['score'], miss['ingredients']['score'])
+        self.assertEqual(History.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(ProductCatalogEntry.objects.get(barcode=self.barcode).hits, 1)
+
+    def test_rescored_when_the_model_version_changes(self):
+        self._scan()
+        drain_summaries(timeout=30)
+        self._scan()
+        self.assertTrue(ProductCatalogEntry.objects.get(barcode=self.barcode).analysis_summary)
+
+        use_scoring_bundle(self, scoring_bundle('v2'))
+        hit = self._scan()
+        self.assertTrue(hit['from_catalog'])
+        self.assertEqual(hit['model_version'], 'v2')
+        entry = ProductCatalogEntry.objects.get(barcode=self.barcode)
+        self.assertEqual(entry.model_version, 'v2')
+        # The old summary explained the old scores; this scan supplies the next one
+        self.assertIsNone(entry.analysis_summary)
+        self.assertEqual(entry.source_history_id, hit['history_id'])
+
+
+class IngredientLexiconTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Built from ml_files/dataset/Ingredients.csv, like in production
+        cls.service = IngredientLexiconService()
+        cls.lexicon = cls.service.get()
+
+    def test_corrects_near_miss_tokens(self):
+        for read, expected in (
+            ('sugarr', 'sugar'), ('citric acd', 'citric acid'), ('whaet flour', 'wheat flour'),
+            ('sa lt', 'salt'), ('Palm Oil.', 'palm oil'),
+        ):
+            self.assertEqual(self.lexicon.resolve(read), (expected, True), read)
+
+    def test_leaves_unknown_tokens_alone(self):
+        for read in ('xylophonite', 'zqxv'):
+            self.assertEqual(self.lexicon.resolve(read), (read, False))
+        self.assertEqual(self.lexicon.resolve('(2%)'), ('', False))
+
+    def test_reads_digits_inside_words_as_letters(self):
+        self.assertEqual(fix_ocr_digits('f1our, palm 0il'), 'flour, palm oil')
+        self.assertEqual(fix_ocr_digits('e150d, 100g, b12'), 'e150d, 100g, b12')
+        self.assertEqual(self.lexicon.resolve(fix_ocr_digits('palm 0il')), ('palm oil', True))
+
+    def test_clean(self):
+        cleaned, confident = self.service.clean(['sugarr', 'whaet flour', 'sa lt', 'palm oil'])
+        self.assertEqual(cleaned, ['sugar', 'wheat flour', 'salt', 'palm oil'])
+        self.assertTrue(confident)
+        # Too few known ingredients to skip Gemini
+        cleaned, confident = self.service.clean(['sugarr', 'xylophonite', 'zqxv'])
+        self.assertEqual(cleaned, ['sugar', 'xylophonite', 'zqxv'])
+        self.assertFalse(confident)
+        stats = self.service.stats()
+        self.assertEqual((stats['labels'], stats['gemini_skipped'], stats['items']), (2, 1, 7))
+        self.assertEqual(stats['corrected'], 4)
+
+
+class ScanJobTests(TransactionTestCase):
+    def setUp(self):
+        use_temp_media(self)
+        self.enterContext(override_settings(
+            SCAN_DEDUP_ENABLED=False, PRODUCT_CATALOG_ENABLED=False,
+            NEAR_DUPLICATE_SCANS=dict(settings.NEAR_DUPLICATE_SCANS, ENABLED=False),
+        ))
+        use_stand_ins(self)
+        use_scoring_bundle(self, scoring_bundle())
+        self.addCleanup(drain_summaries, timeout=30)
+        self.user = User.objects.create_user(email='scan-job@example.com', password='password')
+
+    def _process(self, retain_ingredients):
+        uploads = [SimpleUploadedFile(name, label_image().data, 'image/jpeg') for name in ('in.jpg', 'nu.jpg')]
+        job = enqueue_scan(self.user, *uploads)
+        paths = [job.ingredients_image.path, job.nutrition_image.path]
+        retention = dict(settings.SCAN_UPLOAD_RETENTION, INGREDIENTS=retain_ingredients)
+        with override_settings(SCAN_UPLOAD_RETENTION=retention):
+            process_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScanJob.STATUS_SUCCEEDED, job.error)
+        return job, paths
+
+    def test_uploads_are_discarded_after_the_scan(self):
+        job, paths = self._process(retain_ingredients=False)
+        self.assertFalse(job.ingredients_image)
+        self.assertFalse(job.nutrition_image)
+        for path in paths:
+            self.assertFalse(os.path.exists(path), path)
+        self.assertFalse(OCRResult.objects.get().image)
+
+    def test_retained_ingredients_image_is_stored_once(self):
+        job, paths = self._process(retain_ingredients=True)
+        self.assertFalse(os.path.exists(paths[0]))
+        image = OCRResult.objects.get().image
+        self.assertTrue(os.path.exists(image.path))
+        self.assertEqual(image.read(), label_image().data)
+
+
+class NutritionOCRModeTests(SimpleTestCase):
+    def setUp(self):
+        self.fixtures = load_fixtures(DEFAULT_FIXTURES_DIR)
+
+    def test_fixtures_are_labelled(self):
+        self.assertGreaterEqual(len(self.fixtures), 5)
+        for name, path, expected in self.fixtures:
+            self.assertIsNotNone(cv2.imread(path), name)
+            self.assertTrue(expected, name)
+            self.assertLessEqual(set(expected), set(NUTRITION_FIELDS), name)
+
+    def test_single_pass_is_as_accurate_as_two_pass(self):
+        try:
+            ocr = FoodLabelOCR()
+        except Exception as e:
+            self.skipTest(f'Nutrition OCR engine unavailable: {str(e)}')
+        report = compare_modes(ocr, self.fixtures, ['two_pass', 'single'])
+        self.assertEqual(report['single']['expected'], sum(len(expected) for _, _, expected in self.fixtures))
+        self.assertEqual(report['single']['matched'], report['two_pass']['matched'])
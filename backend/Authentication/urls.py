@@ -10,6 +10,15 @@ urlpatterns = [
     # path("extract_ingredients/", extract_ingredients_api, name="extract_ingredients_api"),
     # path("extract_nutrition/", extract_nutrition_api, name="extract_nutrition_api"),
     path("result_api/",result_api, name="result_api"),
+    path("result_api/stream/", result_stream_api, name="result_stream_api"),
+    path("result_api/async/", result_async_api, name="result_async_api"),
+    path("scan-jobs/", create_scan_job, name="create_scan_job"),
+    path("scan-jobs/<uuid:job_id>/", get_scan_job, name="get_scan_job"),
     path('user-history/', get_user_history, name='user-history'),
+    path('history/<int:history_id>/summary/', get_history_summary, name='history-summary'),
+    path('user-stats/', get_user_stats, name='user-stats'),
     path("manual-entry/", manual_entry_api, name="manual_entry_api"),
+    path("manual-entry/bulk/", bulk_manual_entry_api, name="bulk_manual_entry_api"),
+    path("manual-entry/async/", manual_entry_async_api, name="manual_entry_async_api"),
+    path("runtime-stats/", runtime_stats, name="runtime_stats"),
 ]
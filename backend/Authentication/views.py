@@ -8,35 +8,10 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.views.decorators.csrf import csrf_exempt
 from .models import *
 from django.http import JsonResponse
-from models.ingrediants_ocr import IngredientExtractor
 import logging
-import joblib
-import pickle
-import pandas as pd
 
 logger = logging.getLogger(__name__)
 
-def load_pickle_file(file_path):
-    """Helper function to load pickle files with multiple methods"""
-    logger.info(f"Attempting to load file: {file_path}")
-    
-    # Try joblib first
-    try:
-        return joblib.load(file_path)
-    except Exception as e:
-        logger.warning(f"Joblib load failed: {str(e)}")
-    
-    # Try pickle with different protocols
-    for protocol in range(5):
-        try:
-            with open(file_path, 'rb') as f:
-                return pickle.load(f)
-        except Exception as e:
-            logger.warning(f"Pickle load failed with protocol {protocol}: {str(e)}")
-            continue
-            
-    raise ValueError(f"Failed to load file: {file_path}")
-
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from django.contrib.auth import login
@@ -324,95 +299,34 @@ def get_profile_view(request):
 #         error_msg = f"API error: {str(e)}"
 #         return JsonResponse({'success': False, 'error': error_msg}, status=500)
 
-import json
-import google.generativeai as genai
-from django.conf import settings
-from django.http import JsonResponse
-
-def generate_analysis_summary(ingredients_list, nutrition_data, ingredients_score, nutrition_score, total_score):
-    """
-    Generate an analysis summary using Gemini AI based on ingredients list, 
-    nutrition data, and scoring from our models.
-    
-    Args:
-        ingredients_list: List of ingredients extracted
-        nutrition_data: Dictionary of nutrition values
-        ingredients_score: Score from ingredients model
-        nutrition_score: Score from nutrition model
-        total_score: Overall calculated score
-        
-    Returns:
-        str: An analysis summary explaining the score and health implications
-    """
-    try :
-        # Configure Gemini AI
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # Prepare data for the prompt
-        ingredients_text = ", ".join(ingredients_list) if isinstance(ingredients_list, list) else str(ingredients_list)
-        nutrition_text = json.dumps(nutrition_data, indent=2)
-        
-        # Create a categorization based on total score
-        if total_score >= 8:
-            category = "excellent"
-        elif total_score >= 6:
-            category = "good"
-        elif total_score >= 4:
-            category = "moderate"
-        else:
-            category = "poor"
-        
-        # Create the prompt for Gemini AI
-        prompt = f"""
-        As a nutritional expert, analyze the following food product based on its ingredients and nutrition facts.
-        
-        Ingredients: {ingredients_text}
-        
-        Nutrition Facts: {nutrition_text}
-        
-        Model Scores:
-        - Ingredients Quality Score: {ingredients_score:.2f}/10
-        - Nutritional Value Score: {nutrition_score:.2f}/10
-        - Overall Health Score: {total_score:.2f}/10
-        - General Category: {category}
-        
-        Generate a 2-3 sentence analysis summary that explains:
-        1. Why this product received its score
-        2. Key concerns or benefits from ingredients
-        3. A brief recommendation based on the nutritional profile
-        
-        Keep the summary concise, factual, and actionable.
-        """
-        
-        # Generate response from Gemini
-        response = model.generate_content(prompt)
-        summary = response.text.strip()
-        
-        # Ensure we have a valid summary
-        if not summary:
-            return "Unable to generate analysis. This product received a {category} score of {total_score:.1f}/10."
-            
-        return summary
-        
-    except Exception as e:
-        logger.error(f"Error generating analysis summary: {str(e)}")
-        return f"This product received a {category} health score of {total_score:.1f}/10."
-    
-
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from .models import OCRResult, NutritionResult, History
-import os
-import pickle
-import sys
-import numpy as np
-import importlib.util
 
-from models.ingrediants_ocr import IngredientExtractor
-from models.nutrition_fact_ocr import FoodLabelOCR
+from models.engines import engine_registry
+from models.model_store import model_store
+from models.gemini_cache import gemini_cache
+from models.gemini_client import gemini_client
+from models.image_utils import normalization_stats
+from models.ingredient_lexicon import ingredient_lexicon
+from models.preprocessing import available_profiles, preprocessing_stats
+from .pipeline import (
+    ScanError, dedup_stats, manual_entry, manual_entry_async, parse_manual_entry, run_scan, run_scan_async,
+    scan_events, score_manual_entries,
+)
+from .jobs import enqueue_scan, job_payload
+from .history import HistoryQueryError, history_page, parse_fields
+from .rollups import user_stats
+from .near_duplicates import near_duplicate_stats
+from .catalog import catalog_stats
+from .summaries import summary_payload, wait_for_summary
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -421,6 +335,9 @@ def result_api(request):
     """
     API that processes ingredients and nutrition data directly from images
     through ML models and saves results to history.
+
+    An optional preprocessing_profile field ("fast", "quality", ...) selects
+    the image preprocessing used for the nutrition label OCR.
     """
     try:
         if 'ingredients_image' not in request.FILES or 'nutrition_image' not in request.FILES:
@@ -429,224 +346,249 @@ def result_api(request):
                 'error': 'Both ingredients_image and nutrition_image are required'
             }, status=400)
 
-        # Extract ingredients using OCR
-        try:
-            ingredients_image = request.FILES['ingredients_image']
-            ocr_result = OCRResult.objects.create(image=ingredients_image, extracted_data={})
-            
-            extractor = IngredientExtractor()
-            logger.info(f"Processing ingredients image at path: {ocr_result.image.path}")
-            
-            ingredients_list = extractor.extract_text(ocr_result.image.path)
-            logger.info(f"Extracted ingredients: {ingredients_list}")
-            
-            # Use a default value if extraction fails
-            if not ingredients_list:
-                logger.warning("Ingredients extraction returned empty list. Using default value.")
-                ingredients_list = ["No ingredients detected"]
-                
-            # Save extracted data to OCR result
-            ocr_result.extracted_data = ingredients_list
-            ocr_result.save()
-            
-        except Exception as e:
-            logger.error(f"Ingredients extraction error details: {str(e)}", exc_info=True)
+        profile = request.data.get('preprocessing_profile') or None
+        if profile and profile not in available_profiles():
             return JsonResponse({
                 'success': False,
-                'error': f'Ingredients extraction error: {str(e)}'
-            }, status=500)
+                'error': f'Unknown preprocessing_profile: {profile}'
+            }, status=400)
 
-        # Extract nutrition using OCR
+        # Extract ingredients and nutrition concurrently, then score, save and summarize
         try:
-            nutrition_image = request.FILES['nutrition_image']
-            media_path = os.path.join(settings.MEDIA_ROOT, "uploads")
-            os.makedirs(media_path, exist_ok=True)
-            
-            nutrition_path = os.path.join(media_path, nutrition_image.name)
-            with open(nutrition_path, 'wb') as f:
-                for chunk in nutrition_image.chunks():
-                    f.write(chunk)
-
-            ocr_processor = FoodLabelOCR(use_gpu=False)
-            nutrition_result, _ = ocr_processor.process_image(nutrition_path, save_to_db=True)
-            
-            if os.path.exists(nutrition_path):
-                os.remove(nutrition_path)
-
-            if not nutrition_result:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Failed to extract nutrition information'
-                }, status=500)
-        except Exception as e:
+            result = run_scan(
+                request.user,
+                request.FILES['ingredients_image'],
+                request.FILES['nutrition_image'],
+                profile
+            )
+        except ScanError as e:
             return JsonResponse({
                 'success': False,
-                'error': f'Nutrition extraction error: {str(e)}'
-            }, status=500)
+                'error': e.message
+            }, status=e.status)
 
-        # Load ML models
-        try:
-            BASE_PATH = r"C:\Users\Chira\OneDrive\Desktop\backend\backend\ml_models"
-            vectorizer = load_pickle_file(os.path.join(BASE_PATH, 'tfidf_vectorizer.pkl'))
-            ingredients_model = load_pickle_file(os.path.join(BASE_PATH, 'random_forest_model.pkl'))
-            nutrition_model = load_pickle_file(os.path.join(BASE_PATH, 'chirag_patil.pkl'))
-        except Exception as e:
-            return JsonResponse({
-                'success': False,
-                'error': f'Model loading error: {str(e)}\nAvailable files: {os.listdir(BASE_PATH)}'
-            }, status=500)
+        return JsonResponse(result)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Unexpected error: {str(e)}'
+        }, status=500)
+
+def _jwt_user(request):
+    """The user of a request's JWT bearer token, None if it has none or it is invalid"""
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return authenticated[0] if authenticated else None
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@csrf_exempt
+@require_POST
+async def result_stream_api(request):
+    """
+    Streaming variant of result_api, as Server-Sent Events.
+
+    Takes the same multipart fields and bearer token as result_api and emits
+    'ingredients', 'ingredients_score', 'nutrition' and 'nutrition_score'
+    events as each extraction leg finishes, then 'total_score' (with the
+    history_id), 'summary' and finally 'result' with the full result_api
+    payload; a failure ends the stream with an 'error' event.
+
+    Events are only flushed one by one when the app is served through ASGI
+    (backend.asgi:application); under WSGI the response arrives all at once.
+    """
+    user = await sync_to_async(_jwt_user)(request)
+    if user is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Authentication credentials were not provided or are invalid'
+        }, status=401)
+
+    # Multipart parsing spools uploads to disk, so keep it off the event loop
+    files, data = await sync_to_async(lambda: (request.FILES, request.POST))()
+    if 'ingredients_image' not in files or 'nutrition_image' not in files:
+        return JsonResponse({
+            'success': False,
+            'error': 'Both ingredients_image and nutrition_image are required'
+        }, status=400)
+
+    profile = data.get('preprocessing_profile') or None
+    if profile and profile not in available_profiles():
+        return JsonResponse({
+            'success': False,
+            'error': f'Unknown preprocessing_profile: {profile}'
+        }, status=400)
 
-        # Process ingredients
+    events = scan_events(user, files['ingredients_image'], files['nutrition_image'], profile)
+
+    async def stream():
         try:
-            # Convert ingredients list to a single string
-            ingredients_text = " ".join(str(ingredient) for ingredient in ingredients_list) if ingredients_list else ""
-            logger.info(f"Processing ingredients: {ingredients_text[:100]}...")  # Log first 100 chars
-            
-            # Vectorize as a single string
-            ingredients_vector = vectorizer.transform([ingredients_text])
-            ingredients_score = (float(ingredients_model.predict(ingredients_vector)[0])*10)  # Multiply by 10
-            
-            logger.info(f"Ingredients score: {ingredients_score}")
-        except Exception as e:
+            async for event, data in events:
+                yield _sse_event(event, data)
+        finally:
+            await events.aclose()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def result_async_api(request):
+    """
+    result_api as an async view, for ASGI deployments.
+
+    Same fields, bearer token and response as result_api. While a scan waits
+    on Gemini it holds no thread and no OCR engine, so one worker serves many
+    scans at once; OCR, the models and the ORM still run on threads.
+    """
+    user = await sync_to_async(_jwt_user)(request)
+    if user is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Authentication credentials were not provided or are invalid'
+        }, status=401)
+
+    files, data = await sync_to_async(lambda: (request.FILES, request.POST))()
+    if 'ingredients_image' not in files or 'nutrition_image' not in files:
+        return JsonResponse({
+            'success': False,
+            'error': 'Both ingredients_image and nutrition_image are required'
+        }, status=400)
+
+    profile = data.get('preprocessing_profile') or None
+    if profile and profile not in available_profiles():
+        return JsonResponse({
+            'success': False,
+            'error': f'Unknown preprocessing_profile: {profile}'
+        }, status=400)
+
+    try:
+        result = await run_scan_async(user, files['ingredients_image'], files['nutrition_image'], profile)
+    except ScanError as e:
+        return JsonResponse({
+            'success': False,
+            'error': e.message
+        }, status=e.status)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Unexpected error: {str(e)}'
+        }, status=500)
+
+    return JsonResponse(result)
+
+
+@csrf_exempt
+@require_POST
+async def manual_entry_async_api(request):
+    """manual_entry_api as an async view, for ASGI deployments; takes a JSON body"""
+    user = await sync_to_async(_jwt_user)(request)
+    if user is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Authentication credentials were not provided or are invalid'
+        }, status=401)
+
+    try:
+        entry = json.loads(request.body)
+        ingredients_text, nutrition_input, _ = parse_manual_entry(entry)
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+    try:
+        result = await manual_entry_async(user, ingredients_text, nutrition_input)
+    except ScanError as e:
+        return JsonResponse({
+            'success': False,
+            'error': e.message
+        }, status=e.status)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Unexpected error: {str(e)}'
+        }, status=500)
+
+    return JsonResponse(result)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser])
+def create_scan_job(request):
+    """
+    Asynchronous variant of result_api.
+
+    Stores the two images, queues a scan job and returns immediately; the
+    run_scan_workers command processes it and writes the History row.
+    Poll scan-jobs/<job_id>/ for the result. Accepts the same optional
+    preprocessing_profile field.
+    """
+    try:
+        if 'ingredients_image' not in request.FILES or 'nutrition_image' not in request.FILES:
             return JsonResponse({
                 'success': False,
-                'error': f'Ingredients processing error: {str(e)}'
-            }, status=500)
+                'error': 'Both ingredients_image and nutrition_image are required'
+            }, status=400)
 
-        # Process nutrition
-        try:
-            # Prepare nutrition features in the format expected by chirag_patil.pkl model
-            nutrition_data = {
-                "Calories": float(nutrition_result.calories or 0),
-                "Protein (g)": float(nutrition_result.protein or 0),
-                "Fats (g)": float(nutrition_result.fats or 0),
-                "Carbohydrates (g)": float(nutrition_result.carbohydrates or 0),
-                "Sugars (g)": float(nutrition_result.sugar or 0),
-                "Sodium (mg)": float(nutrition_result.sodium or 0),
-                "Saturated Fat (g)": float(nutrition_result.saturated_fat_100g or 0),
-                "Trans Fat (g)": float(nutrition_result.trans_fat_100g or 0),
-                "Cholesterol (mg)": float(nutrition_result.cholesterol_100g or 0)
-            }
-            
-            # Log the data being sent to model
-            logger.info(f"Nutrition data for model: {nutrition_data}")
-            
-            # Convert to DataFrame as expected by the model
-            nutrition_df = pd.DataFrame([nutrition_data])
-            
-            # Make prediction
-            prediction = nutrition_model.predict(nutrition_df)
-            
-            # Extract the nutrition score from the prediction
-            if isinstance(prediction, np.ndarray) and prediction.size > 0:
-                if len(prediction[0]) > 1:  # If prediction contains [health_class, nutrition_score]
-                    health_class, nutrition_score = prediction[0]
-                    nutrition_score = float(nutrition_score)
-                else:  # If prediction is just the score
-                    nutrition_score = float(prediction[0])
-            else:
-                nutrition_score = 0.0
-                
-            logger.info(f"Nutrition score: {nutrition_score}")
-            
-        except Exception as e:
-            logger.error(f"Exception type: {type(e).__name__}")
-            logger.error(f"Exception details: {str(e)}")
-            logger.error(f"Model type: {type(nutrition_model).__name__}")
+        profile = request.data.get('preprocessing_profile') or None
+        if profile and profile not in available_profiles():
             return JsonResponse({
                 'success': False,
-                'error': f'Nutrition processing error: {str(e)}'
-            }, status=500)
-
-        # Calculate total score
-        total_score = ingredients_score + nutrition_score / 2  # Adjust weight as needed
-        
-        # Prepare data structures for storage
-        nutrition_data = {
-            "calories": nutrition_result.calories,
-            "protein": nutrition_result.protein,
-            "fats": nutrition_result.fats,
-            "carbohydrates": nutrition_result.carbohydrates,
-            "sugar": nutrition_result.sugar,
-            "sodium": nutrition_result.sodium,
-            "saturated_fat": nutrition_result.saturated_fat_100g,
-            "trans_fat": nutrition_result.trans_fat_100g,
-            "cholesterol": nutrition_result.cholesterol_100g,
-        }
-        
-        ingredients_data = {
-            "raw_data": ingredients_list
-        }
+                'error': f'Unknown preprocessing_profile: {profile}'
+            }, status=400)
 
-        # Save to history with all structured data
-        try:
-            history = History.objects.create(
-                user=request.user,
-                ingredients_result=ingredients_score,
-                nutrition_result=nutrition_score,
-                total_result=total_score,
-                nutrition_data=nutrition_data,
-                ingredients_data=ingredients_data
-            )
-            history_id = history.id
-        except Exception as history_error:
-            logger.error(f"Failed to save to history: {str(history_error)}")
-            history_id = None
-
-        # Format data for response
-        formatted_nutrition_data = {
-            "Calories": nutrition_result.calories,
-            "Protein (g)": nutrition_result.protein,
-            "Fats (g)": nutrition_result.fats,
-            "Carbohydrates (g)": nutrition_result.carbohydrates,
-            "Sugars (g)": nutrition_result.sugar,
-            "Sodium (mg)": nutrition_result.sodium,
-            "Saturated Fat (g)": nutrition_result.saturated_fat_100g,
-            "Trans Fat (g)": nutrition_result.trans_fat_100g,
-            "Cholesterol (mg)": nutrition_result.cholesterol_100g,
-        }
-        
-        try:
-        # Generate analysis summary
-            analysis_summary = generate_analysis_summary(
-            ingredients_list=ingredients_list,
-            nutrition_data=formatted_nutrition_data,
-            ingredients_score=ingredients_score,
-            nutrition_score=nutrition_score,
-            total_score=total_score
-        )   
-            # Update history object with summary
-            if history_id:
-                history = History.objects.get(id=history_id)
-                history.analysis_summary = analysis_summary
-                history.save()
-        except Exception as summary_error:
-            logger.error(f"Failed to generate or save analysis summary: {str(summary_error)}")
-            analysis_summary = f"This product received a score of {total_score:.1f}/10."
-        
-# Modify the return statement to include the summary
+        job = enqueue_scan(
+            request.user,
+            request.FILES['ingredients_image'],
+            request.FILES['nutrition_image'],
+            profile
+        )
         return JsonResponse({
             'success': True,
-            'history_id': history_id,
-            'ingredients': {
-                'raw_data': ingredients_list,
-                'score': ingredients_score  # Add ingredients score
-            },
-            'nutrition': {
-                'data': formatted_nutrition_data,
-                'score': nutrition_score  # Add nutrition score
-            },
-            'total_score': total_score,
-        'analysis_summary': analysis_summary,  # Add this line
-        'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-        })
+            'job_id': str(job.id),
+            'status': job.status
+        }, status=202)
 
     except Exception as e:
         return JsonResponse({
             'success': False,
-            'error': f'Unexpected error: {str(e)}'
+            'error': f'Failed to queue scan: {str(e)}'
         }, status=500)
 
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_scan_job(request, job_id):
+    """
+    API to poll a scan job created by create_scan_job.
+
+    Returns:
+        The job status and, once finished, the same payload result_api
+        returns or the error it would have returned.
+    """
+    try:
+        job = ScanJob.objects.get(id=job_id, user=request.user)
+    except ScanJob.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Scan job not found'
+        }, status=404)
+
+    return JsonResponse(job_payload(job))
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_user_history(request):
@@ -654,8 +596,11 @@ def get_user_history(request):
     API to fetch the history of results for the authenticated user.
     
     Returns:
-        A list of history records with scores and detailed data.
+        A page of history records with scores and detailed data, most recent first.
         Can be filtered by date range using query parameters 'start_date' and 'end_date'.
+        'limit' sets the page size; pass the returned 'next_cursor' as 'cursor'
+        to get the next page. 'fields' (e.g. fields=id,created_at,scores)
+        restricts the returned fields so list views can skip the JSON data.
     """
     try:
         # Get query parameters for filtering
@@ -663,42 +608,33 @@ def get_user_history(request):
         end_date = request.query_params.get('end_date')
         limit = request.query_params.get('limit', 10)  # Default to 10 records
         
-        # Query the user's history, ordered by most recent first
-        history_query = History.objects.filter(user=request.user).order_by('-created_at')
-        
-        # Apply date filters if provided
-        if start_date:
-            history_query = history_query.filter(created_at__gte=start_date)
-        if end_date:
-            history_query = history_query.filter(created_at__lte=end_date)
-            
-        # Apply limit
         try:
             limit = int(limit)
         except ValueError:
             limit = 10
-        history_query = history_query[:limit]
+        limit = min(max(limit, 1), settings.USER_HISTORY_MAX_LIMIT)
         
-        # Format the history data
-        history_data = []
-        for record in history_query:
-            history_data.append({
-                'id': record.id,
-                'created_at': record.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                'scores': {
-                    'ingredients': record.ingredients_result,
-                    'nutrition': record.nutrition_result,
-                    'total': record.total_result
-                },
-                'nutrition_data': record.nutrition_data,
-                'ingredients_data': record.ingredients_data,
-                'analysis_summary': record.analysis_summary  # Add this line
-            })
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+            history_data, next_cursor = history_page(
+                request.user,
+                limit,
+                cursor=request.query_params.get('cursor'),
+                fields=fields,
+                start_date=start_date,
+                end_date=end_date,
+            )
+        except HistoryQueryError as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
         
         return JsonResponse({
             'success': True,
             'count': len(history_data),
-            'history': history_data
+            'history': history_data,
+            'next_cursor': next_cursor
         })
     
     except Exception as e:
@@ -708,190 +644,161 @@ def get_user_history(request):
         }, status=500)
     
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_history_summary(request, history_id):
+    """
+    API returning the analysis summary of one of the user's history records.
+
+    Summaries are generated in the background after result_api / manual-entry
+    respond, so 'summary_status' is 'pending' until it is ready. With
+    ?wait=N the request waits up to N seconds for a pending summary, so a
+    client can long-poll instead of polling repeatedly.
+    """
+    try:
+        wait = request.query_params.get('wait', 0)
+        try:
+            wait = float(wait)
+        except ValueError:
+            wait = 0
+        wait = min(max(wait, 0), settings.SUMMARY_MAX_WAIT)
+
+        if not History.objects.filter(id=history_id, user=request.user).exists():
+            return JsonResponse({
+                'success': False,
+                'error': 'History record not found'
+            }, status=404)
+
+        history = wait_for_summary(history_id, wait)
+        return JsonResponse(summary_payload(history))
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Error fetching summary: {str(e)}'
+        }, status=500)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_user_stats(request):
+    """
+    API returning aggregate statistics of the authenticated user's history.
+
+    Returns:
+        Scan count, first/last scan, count/average/min/max of each score and
+        nutrient, and per-day scan counts and average scores for the last
+        'days' days (default 30). Read from rollup tables maintained as history
+        is written, so the cost does not grow with the number of scans.
+    """
+    try:
+        days = request.query_params.get('days', 30)
+        try:
+            days = int(days)
+        except ValueError:
+            days = 30
+        days = min(max(days, 1), settings.USER_STATS_MAX_DAYS)
+
+        return JsonResponse({
+            'success': True,
+            'stats': user_stats(request.user, days=days)
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Error fetching stats: {str(e)}'
+        }, status=500)
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def manual_entry_api(request):
     """
     API that processes manually entered ingredients and nutrition data
     and saves results to history, similar to result_api but without image processing.
+    The analysis summary is generated in the background, as for result_api.
     """
     try:
-        # Check if required data is provided
-        if 'ingredients_text' not in request.data or 'nutrition_data' not in request.data:
+        # Same validation as the async and bulk views, so no entry reaches the models unchecked
+        try:
+            ingredients_text, nutrition_input, _ = parse_manual_entry(request.data)
+        except ValueError as e:
             return JsonResponse({
                 'success': False,
-                'error': 'Both ingredients_text and nutrition_data are required'
+                'error': str(e)
             }, status=400)
 
-        ingredients_text = request.data['ingredients_text']
-        nutrition_input = request.data['nutrition_data']
-        
-        # Process ingredients
+        # Score, save to history and queue the summary
         try:
-            # Convert ingredients text to list (assuming comma-separated format)
-            ingredients_list = [ingredient.strip() for ingredient in ingredients_text.split(',')]
-            
-            # Load ML models
-            BASE_PATH = r"C:\Users\Chira\OneDrive\Desktop\backend\backend\ml_models"
-            vectorizer = load_pickle_file(os.path.join(BASE_PATH, 'tfidf_vectorizer.pkl'))
-            ingredients_model = load_pickle_file(os.path.join(BASE_PATH, 'random_forest_model.pkl'))
-            nutrition_model = load_pickle_file(os.path.join(BASE_PATH, 'chirag_patil.pkl'))
-            
-            # Vectorize ingredients text
-            ingredients_vector = vectorizer.transform([ingredients_text])
-            ingredients_score = (float(ingredients_model.predict(ingredients_vector)[0])*10)
-            
-            logger.info(f"Ingredients score: {ingredients_score}")
-        except Exception as e:
+            result = manual_entry(request.user, ingredients_text, nutrition_input)
+        except ScanError as e:
             return JsonResponse({
                 'success': False,
-                'error': f'Ingredients processing error: {str(e)}'
-            }, status=500)
+                'error': e.message
+            }, status=e.status)
 
-        # Process nutrition
-        try:
-            # Parse nutrition input data
-            nutrition_data = {
-                "Calories": float(nutrition_input.get('calories', 0)),
-                "Protein (g)": float(nutrition_input.get('protein', 0)),
-                "Fats (g)": float(nutrition_input.get('fats', 0)),
-                "Carbohydrates (g)": float(nutrition_input.get('carbohydrates', 0)),
-                "Sugars (g)": float(nutrition_input.get('sugar', 0)),
-                "Sodium (mg)": float(nutrition_input.get('sodium', 0)),
-                "Saturated Fat (g)": float(nutrition_input.get('saturated_fat', 0)),
-                "Trans Fat (g)": float(nutrition_input.get('trans_fat', 0)),
-                "Cholesterol (mg)": float(nutrition_input.get('cholesterol', 0))
-            }
-            
-            # Log the data being sent to model
-            logger.info(f"Nutrition data for model: {nutrition_data}")
-            
-            # Convert to DataFrame as expected by the model
-            nutrition_df = pd.DataFrame([nutrition_data])
-            
-            # Make prediction
-            prediction = nutrition_model.predict(nutrition_df)
-            
-            # Extract the nutrition score from the prediction
-            if isinstance(prediction, np.ndarray) and prediction.size > 0:
-                if len(prediction[0]) > 1:  # If prediction contains [health_class, nutrition_score]
-                    health_class, nutrition_score = prediction[0]
-                    nutrition_score = float(nutrition_score)
-                else:  # If prediction is just the score
-                    nutrition_score = float(prediction[0])
-            else:
-                nutrition_score = 0.0
-                
-            logger.info(f"Nutrition score: {nutrition_score}")
-            
-        except Exception as e:
-            logger.error(f"Exception type: {type(e).__name__}")
-            logger.error(f"Exception details: {str(e)}")
-            logger.error(f"Model type: {type(nutrition_model).__name__}")
+        return JsonResponse(result)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Unexpected error: {str(e)}'
+        }, status=500)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulk_manual_entry_api(request):
+    """
+    Bulk variant of manual_entry_api for catalog imports.
+
+    Expects {"entries": [{"ingredients_text": ..., "nutrition_data": {...}}, ...]}.
+    All entries are scored in one batch and saved to history together; if any
+    entry is invalid nothing is saved and the errors are returned per index.
+    Analysis summaries are not generated.
+    """
+    try:
+        entries = request.data.get('entries')
+        if not isinstance(entries, list) or not entries:
+            return JsonResponse({
+                'success': False,
+                'error': 'entries must be a non-empty list'
+            }, status=400)
+        if len(entries) > settings.MANUAL_ENTRY_BULK_MAX_ENTRIES:
             return JsonResponse({
                 'success': False,
-                'error': f'Nutrition processing error: {str(e)}'
-            }, status=500)
+                'error': f'At most {settings.MANUAL_ENTRY_BULK_MAX_ENTRIES} entries per request'
+            }, status=400)
 
-        # Calculate total score
-        total_score = ingredients_score + nutrition_score / 2  # Adjust weight as needed
-        
-        # Prepare data structures for storage
-        nutrition_data_for_storage = {
-            "calories": nutrition_input.get('calories'),
-            "protein": nutrition_input.get('protein'),
-            "fats": nutrition_input.get('fats'),
-            "carbohydrates": nutrition_input.get('carbohydrates'),
-            "sugar": nutrition_input.get('sugar'),
-            "sodium": nutrition_input.get('sodium'),
-            "saturated_fat": nutrition_input.get('saturated_fat'),
-            "trans_fat": nutrition_input.get('trans_fat'),
-            "cholesterol": nutrition_input.get('cholesterol'),
-        }
-        
-        ingredients_data = {
-            "raw_data": ingredients_list
-        }
+        parsed = []
+        errors = []
+        for index, entry in enumerate(entries):
+            try:
+                parsed.append(parse_manual_entry(entry))
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+        if errors:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid entries',
+                'errors': errors
+            }, status=400)
 
-        # Save to history with all structured data
         try:
-            history = History.objects.create(
-                user=request.user,
-                ingredients_result=ingredients_score,
-                nutrition_result=nutrition_score,
-                total_result=total_score,
-                nutrition_data=nutrition_data_for_storage,
-                ingredients_data=ingredients_data,
-            )
-            history_id = history.id
-            
-            # Generate and update analysis summary
-            analysis_summary = generate_analysis_summary(
-                ingredients_list=ingredients_list,
-                nutrition_data=nutrition_data_for_storage,
-                ingredients_score=ingredients_score,
-                nutrition_score=nutrition_score,
-                total_score=total_score
-            )
-            
-            # Update the history record with the summary
-            history.analysis_summary = analysis_summary
-            history.save()
-            
-            logger.info(f"Successfully created history entry with ID: {history_id}")
-            
-        except Exception as history_error:
-            logger.error(f"Failed to save to history: {str(history_error)}")
+            model_version, results = score_manual_entries(request.user, parsed)
+        except ScanError as e:
             return JsonResponse({
                 'success': False,
-                'error': f'Failed to save results: {str(history_error)}'
-            }, status=500)
-
-        # Format data for response
-        formatted_nutrition_data = {
-            "Calories": nutrition_input.get('calories'),
-            "Protein (g)": nutrition_input.get('protein'),
-            "Fats (g)": nutrition_input.get('fats'),
-            "Carbohydrates (g)": nutrition_input.get('carbohydrates'),
-            "Sugars (g)": nutrition_input.get('sugar'),
-            "Sodium (mg)": nutrition_input.get('sodium'),
-            "Saturated Fat (g)": nutrition_input.get('saturated_fat'),
-            "Trans Fat (g)": nutrition_input.get('trans_fat'),
-            "Cholesterol (mg)": nutrition_input.get('cholesterol'),
-        }
+                'error': e.message
+            }, status=e.status)
 
-        try:
-        # Generate analysis summary
-            analysis_summary = generate_analysis_summary(
-            ingredients_list=ingredients_list,
-            nutrition_data=formatted_nutrition_data,
-            ingredients_score=ingredients_score,
-            nutrition_score=nutrition_score,
-            total_score=total_score
-        )       # Update history object with summary
-            if history_id:
-                history = History.objects.get(id=history_id)
-                history.analysis_summary = analysis_summary
-                history.save()
-        except Exception as summary_error:
-            logger.error(f"Failed to generate or save analysis summary: {str(summary_error)}")
-            analysis_summary = f"This product received a score of {total_score:.1f}/10."
-
-# Modify the return statement to include the summary
         return JsonResponse({
             'success': True,
-            'history_id': history_id,
-            'ingredients': {
-                'raw_data': ingredients_list,
-                'score': ingredients_score  # Add ingredients score
-            },
-            'nutrition': {
-            'data': formatted_nutrition_data,
-            'score': nutrition_score  # Add nutrition score
-        },
-        'total_score': total_score,
-        'analysis_summary': analysis_summary,  # Add this line
-        'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+            'count': len(results),
+            'results': results,
+            'model_version': model_version,
+            'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
         })
 
     except Exception as e:
@@ -900,3 +807,33 @@ def manual_entry_api(request):
             'error': f'Unexpected error: {str(e)}'
         }, status=500)
 
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def runtime_stats(request):
+    """
+    API exposing per-worker runtime statistics for operators.
+
+    Returns:
+        Build and reuse counters for each OCR engine held by this worker process
+        and the version / load time of the scoring models it is serving,
+        plus Gemini response cache, upload deduplication and near-duplicate hit
+        rates (with perceptual hash lookup latency), product catalog barcode
+        hits, how many ingredient labels the ingredient lexicon resolved without
+        Gemini, the shared Gemini client's circuit state and call / rejection
+        counters, and the pixels/time saved by resolution normalization before
+        OCR and the average latency of each preprocessing stage per profile.
+    """
+    return JsonResponse({
+        'success': True,
+        'engines': engine_registry.stats(),
+        'models': model_store.info(),
+        'gemini_cache': gemini_cache.stats(),
+        'gemini_client': gemini_client.stats(),
+        'dedup': dedup_stats.stats(),
+        'near_duplicates': near_duplicate_stats(),
+        'catalog': catalog_stats.stats(),
+        'ingredient_lexicon': ingredient_lexicon.stats(),
+        'normalization': normalization_stats.stats(),
+        'preprocessing': preprocessing_stats.stats(),
+    })
@@ -14,3 +14,14 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Load the OCR engines, scoring models and ingredient lexicon once per worker so the first scan does not pay for it
+from django.conf import settings
+from models.engines import engine_registry
+from models.ingredient_lexicon import ingredient_lexicon
+from models.model_store import model_store
+
+if settings.OCR_WARM_UP_ON_STARTUP:
+    engine_registry.warm_up()
+    model_store.warm_up()
+    ingredient_lexicon.warm_up()
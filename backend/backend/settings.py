@@ -72,6 +72,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than shared-cache memory, so tests that drive the API from
+        # several threads (load_test) wait for locks instead of failing on them
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        # Transactions take the write lock up front: a deferred one that reads and then
+        # writes (add_product's get_or_create) fails at once with "database is locked"
+        # if a summary worker wrote in between, instead of waiting for the lock
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
     }
 }
 
@@ -212,4 +219,151 @@ SIMPLE_JWT = {
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
-}
\ No newline at end of file
+}
+
+# OCR engine registry
+# Engines are built once per worker process (see models/engines.py) and
+# shared by every scan instead of being constructed per request.
+OCR_ENGINES = {
+    "ingredients": {
+        "FACTORY": "models.ingrediants_ocr.IngredientExtractor",
+        "OPTIONS": {},
+    },
+    "nutrition": {
+        "FACTORY": "models.nutrition_fact_ocr.FoodLabelOCR",
+        "OPTIONS": {"use_gpu": False},
+    },
+}
+
+# Build the OCR engines when the WSGI/ASGI application loads rather than on the first scan
+OCR_WARM_UP_ON_STARTUP = os.environ.get("OCR_WARM_UP_ON_STARTUP", "1") == "1"
+
+# Scoring models
+# Loaded once per process by models/model_store.py and hot-reloaded when the
+# files change on disk (checked at most every ML_MODEL_RELOAD_INTERVAL seconds).
+ML_MODELS_DIR = os.environ.get("ML_MODELS_DIR", os.path.join(BASE_DIR, "ml_models"))
+ML_MODEL_FILES = {
+    "vectorizer": "tfidf_vectorizer.pkl",
+    "ingredients": "random_forest_model.pkl",
+    "nutrition": "chirag_patil.pkl",
+}
+ML_MODEL_RELOAD_INTERVAL = int(os.environ.get("ML_MODEL_RELOAD_INTERVAL", "30"))
+# Forests are also flattened into numpy node arrays when loaded (models/flat_forest.py).
+# Batches of up to ML_FLAT_FOREST_MAX_ROWS rows are scored on those, without sklearn's
+# per-call overhead; larger batches by sklearn's compiled predict, which is faster there
+ML_FLAT_FORESTS = os.environ.get("ML_FLAT_FORESTS", "1") == "1"
+ML_FLAT_FOREST_MAX_ROWS = int(os.environ.get("ML_FLAT_FOREST_MAX_ROWS", "32"))
+
+# Threads used to run the ingredients and nutrition legs of a scan side by side
+SCAN_LEG_WORKERS = int(os.environ.get("SCAN_LEG_WORKERS", "4"))
+
+# Scan job queue (scan-jobs/ endpoints, processed by `manage.py run_scan_workers`)
+SCAN_JOB_WORKERS = int(os.environ.get("SCAN_JOB_WORKERS", "2"))
+SCAN_JOB_POLL_INTERVAL = 1.0
+# Seconds after which a running job is considered abandoned by a dead worker
+SCAN_JOB_TIMEOUT = 600
+SCAN_JOB_MAX_ATTEMPTS = 2
+
+# Gemini response cache (models/gemini_cache.py): in-process LRU in front of a
+# SQLite file shared by all workers on the host
+GEMINI_CACHE = {
+    "ENABLED": os.environ.get("GEMINI_CACHE_ENABLED", "1") == "1",
+    "PATH": os.environ.get("GEMINI_CACHE_PATH", os.path.join(BASE_DIR, "gemini_cache.sqlite3")),
+    "TTL": 7 * 24 * 3600,
+    "MAX_MEMORY_ENTRIES": 1024,
+}
+
+# Shared Gemini client (models/gemini_client.py), per worker process: at most
+# MAX_CONCURRENCY calls in flight and RATE_PER_SECOND calls started per second
+# (bursts of BURST, 0 = no rate limit). DEADLINE bounds each call in seconds,
+# waiting for capacity included. After FAILURE_THRESHOLD consecutive failures
+# the circuit opens: callers use the regex / rule-based fallbacks without
+# calling Gemini until a trial call RESET_SECONDS later succeeds.
+GEMINI_CLIENT = {
+    "MODEL": "gemini-2.0-flash",
+    "MAX_CONCURRENCY": int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8")),
+    "RATE_PER_SECOND": float(os.environ.get("GEMINI_RATE_PER_SECOND", "0")),
+    "BURST": int(os.environ.get("GEMINI_BURST", "10")),
+    "DEADLINE": float(os.environ.get("GEMINI_DEADLINE", "20")),
+    "FAILURE_THRESHOLD": 5,
+    "RESET_SECONDS": 30.0,
+}
+
+# Reuse the extraction of a byte-identical upload (matched by SHA-256) instead of re-running OCR and Gemini
+SCAN_DEDUP_ENABLED = os.environ.get("SCAN_DEDUP_ENABLED", "1") == "1"
+
+# Scan uploads are read into memory once and decoded there for OCR and Gemini;
+# they are only written to disk when kept here: ingredients images in
+# OCRResult.image (media/ocr_uploads/), nutrition images under media/nutrition_uploads/
+SCAN_UPLOAD_RETENTION = {
+    'INGREDIENTS': os.environ.get("SCAN_RETAIN_INGREDIENTS", "1") == "1",
+    'NUTRITION': os.environ.get("SCAN_RETAIN_NUTRITION", "0") == "1",
+}
+
+# Near-duplicate uploads (Authentication/near_duplicates.py): without a byte-identical
+# match, the upload's perceptual hash is looked up among earlier uploads and an
+# extraction within MAX_DISTANCE bits (of 64) is reused, after a SPOT_CHECK OCR of a
+# downscaled copy finds SPOT_CHECK_MIN_OVERLAP of its ingredient words / nutrient
+# values. Only active while SCAN_DEDUP_ENABLED is on.
+NEAR_DUPLICATE_SCANS = {
+    'ENABLED': os.environ.get("NEAR_DUPLICATE_SCANS", "1") == "1",
+    'METHOD': 'phash',
+    'MAX_DISTANCE': int(os.environ.get("NEAR_DUPLICATE_MAX_DISTANCE", "6")),
+    'SPOT_CHECK': os.environ.get("NEAR_DUPLICATE_SPOT_CHECK", "1") == "1",
+}
+
+# Product catalog (Authentication/catalog.py): scans look for an EAN/UPC barcode
+# first; products already in the catalog are answered from it without OCR,
+# Gemini or scoring, others are added to it after a successful scan
+PRODUCT_CATALOG_ENABLED = os.environ.get("PRODUCT_CATALOG_ENABLED", "1") == "1"
+
+# Ingredient lexicon (models/ingredient_lexicon.py), built from the ingredient lists
+# of ml_files/dataset/Ingredients.csv: the rule-based parse of the OCR text is
+# spell-corrected against it, and when at least MIN_RESOLVED of its items map to
+# known ingredient names the Gemini extraction is skipped
+INGREDIENT_LEXICON = {
+    'ENABLED': os.environ.get("INGREDIENT_LEXICON_ENABLED", "1") == "1",
+    'SKIP_GEMINI': os.environ.get("INGREDIENT_LEXICON_SKIP_GEMINI", "1") == "1",
+    'MIN_RESOLVED': float(os.environ.get("INGREDIENT_LEXICON_MIN_RESOLVED", "0.8")),
+}
+
+# Nutrition label OCR: "two_pass" runs PaddleOCR on the full image and re-reads the
+# bottom half; "single" reads the full image once. Only switch to "single" after
+# `manage.py benchmark_nutrition_ocr` shows no accuracy loss with the real engine.
+NUTRITION_OCR_MODE = os.environ.get("NUTRITION_OCR_MODE", "two_pass")
+
+# Resolution normalization before OCR (models/image_utils.py): photos are
+# downsampled so the longest side is at most MAX_DIMENSION and the estimated
+# text height is close to TARGET_TEXT_HEIGHT pixels; never upscaled
+IMAGE_NORMALIZATION = {
+    'ENABLED': os.environ.get("IMAGE_NORMALIZATION_ENABLED", "1") == "1",
+    'MAX_DIMENSION': int(os.environ.get("IMAGE_NORMALIZATION_MAX_DIMENSION", "2000")),
+    'TARGET_TEXT_HEIGHT': int(os.environ.get("IMAGE_NORMALIZATION_TEXT_HEIGHT", "32")),
+    'MIN_SCALE': 0.25,
+}
+
+# Nutrition label preprocessing (models/preprocessing.py). "quality" is the full
+# denoise/CLAHE/double-threshold chain, "fast" skips NL-means denoising and uses
+# a single Otsu threshold. Scan requests can override it with preprocessing_profile.
+PREPROCESSING_PROFILE = os.environ.get("PREPROCESSING_PROFILE", "quality")
+# Extra or overridden profiles: {'name': [('stage', {options}), ...]}
+PREPROCESSING_PROFILES = {}
+
+# Largest batch accepted by manual-entry/bulk/ (scored in one predict call per model)
+MANUAL_ENTRY_BULK_MAX_ENTRIES = int(os.environ.get("MANUAL_ENTRY_BULK_MAX_ENTRIES", "5000"))
+
+# Rows per batch for `manage.py rescore_history` (one predict per model per batch)
+HISTORY_RESCORE_CHUNK_SIZE = 2000
+
+# Largest page size accepted by user-history/
+USER_HISTORY_MAX_LIMIT = 500
+
+# Most days of daily buckets returned by user-stats/
+USER_STATS_MAX_DAYS = 366
+
+# Analysis summaries are generated in the background after the scores are returned,
+# with up to SUMMARY_CONCURRENCY Gemini calls in flight per process;
+# history/<id>/summary/?wait=N long-polls for at most SUMMARY_MAX_WAIT seconds
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", "16"))
+SUMMARY_MAX_WAIT = 30
+SUMMARY_POLL_INTERVAL = 0.5
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Longest side the detector works on; product barcodes stay readable well below photo resolution
+BARCODE_MAX_DIMENSION = 1600
+
+
+def gtin_check_digit_valid(code):
+    """GS1 check digit: from the right, digits are weighted 3, 1, 3, ... before the check digit"""
+    total = sum(int(digit) * (3 if position % 2 == 0 else 1) for position, digit in enumerate(reversed(code[:-1])))
+    return (10 - total % 10) % 10 == int(code[-1])
+
+
+def normalize_gtin(code):
+    """
+    Catalog key of a decoded barcode: UPC-A is widened to its EAN-13 form,
+    EAN-8, EAN-13 and GTIN-14 are kept as they are.
+
+    Returns:
+        str or None if ``code`` is not a GTIN with a valid check digit
+    """
+    code = (code or '').strip()
+    if not code.isdigit():
+        return None
+    if len(code) == 12:
+        code = '0' + code
+    if len(code) not in (8, 13, 14) or not gtin_check_digit_valid(code):
+        return None
+    return code
+
+
+class BarcodeReader:
+    """
+    Finds the product barcode (EAN/UPC) on a label photo with OpenCV's
+    barcode detector. Detectors are not shared between threads, so each
+    thread gets its own. cv2 is imported on first use.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.images = 0
+        self.found = 0
+        self.seconds = 0.0
+
+    @property
+    def available(self):
+        import cv2
+        return hasattr(cv2, 'barcode')
+
+    def _detector(self):
+        detector = getattr(self._local, 'detector', None)
+        if detector is None:
+            import cv2
+            detector = self._local.detector = cv2.barcode.BarcodeDetector()
+        return detector
+
+    def read(self, image):
+        """
+        GTIN of the first valid product barcode in a BGR image array.
+
+        Returns:
+            str or None if there is none (or the detector is not available)
+        """
+        if not self.available or image is None:
+            return None
+
+        import cv2
+        started = time.perf_counter()
+        height, width = image.shape[:2]
+        scale = BARCODE_MAX_DIMENSION / max(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+        gtin = None
+        try:
+            found, codes, _, _ = self._detector().detectAndDecodeWithType(image)
+            if found:
+                gtin = next(filter(None, map(normalize_gtin, codes)), None)
+        except cv2.error as e:
+            logger.warning(f"Barcode detection failed: {str(e)}")
+
+        with self._stats_lock:
+            self.images += 1
+            self.found += gtin is not None
+            self.seconds += time.perf_counter() - started
+        return gtin
+
+    def stats(self):
+        return {
+            'available': self.available,
+            'images': self.images,
+            'found': self.found,
+            'avg_ms': round(self.seconds / self.images * 1000, 2) if self.images else 0.0,
+        }
+
+
+barcode_reader = BarcodeReader()
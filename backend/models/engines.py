@@ -0,0 +1,218 @@
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OCR_ENGINES = {
+    'ingredients': {
+        'FACTORY': 'models.ingrediants_ocr.IngredientExtractor',
+        'OPTIONS': {},
+    },
+    'nutrition': {
+        'FACTORY': 'models.nutrition_fact_ocr.FoodLabelOCR',
+        'OPTIONS': {'use_gpu': False},
+    },
+}
+
+
+class EngineSlot:
+    """A single named engine: its factory, the built instance and usage counters"""
+
+    def __init__(self, name, factory, options=None):
+        self.name = name
+        self.factory = factory
+        self.options = options or {}
+        self.instance = None
+
+        # build_lock guards construction, use_lock serializes inference because
+        # the EasyOCR / PaddleOCR predictors are not safe to share between threads
+        self.build_lock = threading.Lock()
+        self.use_lock = threading.Lock()
+
+        self.builds = 0
+        self.build_failures = 0
+        self.leases = 0
+        self.reuses = 0
+        self.build_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.built_at = None
+
+    def stats(self):
+        return {
+            'factory': self.factory if isinstance(self.factory, str) else repr(self.factory),
+            'loaded': self.instance is not None,
+            'builds': self.builds,
+            'build_failures': self.build_failures,
+            'leases': self.leases,
+            # Leases that found the engine already built, i.e. requests that skipped model loading
+            'reuses': self.reuses,
+            'last_build_seconds': round(self.build_seconds, 3),
+            'avg_wait_ms': round(self.wait_seconds / self.leases * 1000, 2) if self.leases else 0.0,
+            'avg_busy_ms': round(self.busy_seconds / self.leases * 1000, 2) if self.leases else 0.0,
+            'built_at': self.built_at.strftime('%Y-%m-%d %H:%M:%S') if self.built_at else None,
+        }
+
+
+class EngineRegistry:
+    """
+    Process-wide registry of warm OCR engines.
+
+    Each engine is constructed once per worker process and then handed to
+    every request through ``lease()``, so a scan only pays for inference and
+    not for loading EasyOCR, PaddleOCR, spaCy and the Gemini client.
+
+    Lifecycle:
+        warm_up()   build engines eagerly (called from wsgi.py / asgi.py)
+        lease(name) borrow an engine for the duration of a ``with`` block
+        evict(name) drop one engine so the next lease rebuilds it
+        shutdown()  drop every engine (registered with atexit)
+    Callbacks added with ``add_hook('built' | 'evicted', fn)`` receive
+    ``(name, instance)``.
+    """
+
+    HOOK_EVENTS = ('built', 'evicted')
+
+    def __init__(self, engines=None):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._hooks = {event: [] for event in self.HOOK_EVENTS}
+        self._configured = False
+        if engines is not None:
+            self.configure(engines)
+
+    def configure(self, engines=None):
+        """Register engines from a mapping shaped like ``settings.OCR_ENGINES``"""
+        if engines is None:
+            engines = getattr(settings, 'OCR_ENGINES', DEFAULT_OCR_ENGINES)
+        with self._lock:
+            for name, spec in engines.items():
+                self._slots[name] = EngineSlot(name, spec['FACTORY'], spec.get('OPTIONS'))
+            self._configured = True
+
+    def register(self, name, factory, **options):
+        """Register (or replace) a single engine factory"""
+        with self._lock:
+            self._slots[name] = EngineSlot(name, factory, options)
+            self._configured = True
+
+    def add_hook(self, event, callback):
+        if event not in self._hooks:
+            raise ValueError(f"Unknown engine hook '{event}', expected one of {self.HOOK_EVENTS}")
+        self._hooks[event].append(callback)
+
+    def _run_hooks(self, event, name, instance):
+        for callback in self._hooks[event]:
+            try:
+                callback(name, instance)
+            except Exception as e:
+                logger.error(f"Engine hook '{event}' failed for {name}: {str(e)}")
+
+    def _slot(self, name):
+        if not self._configured:
+            self.configure()
+        try:
+            return self._slots[name]
+        except KeyError:
+            raise KeyError(f"No OCR engine registered under '{name}'")
+
+    def _build(self, slot):
+        """Construct the engine for a slot if it has not been built yet"""
+        if slot.instance is not None:
+            return slot.instance
+
+        with slot.build_lock:
+            if slot.instance is not None:
+                return slot.instance
+
+            factory = import_string(slot.factory) if isinstance(slot.factory, str) else slot.factory
+            logger.info(f"Building OCR engine '{slot.name}'")
+            started = time.perf_counter()
+            try:
+                instance = factory(**slot.options)
+            except Exception:
+                slot.build_failures += 1
+                raise
+            slot.build_seconds = time.perf_counter() - started
+            slot.builds += 1
+            slot.built_at = timezone.now()
+            slot.instance = instance
+            logger.info(f"OCR engine '{slot.name}' ready in {slot.build_seconds:.2f}s")
+
+        self._run_hooks('built', slot.name, instance)
+        return instance
+
+    def get(self, name):
+        """Return the shared engine without taking its use lock"""
+        return self._build(self._slot(name))
+
+    @contextmanager
+    def lease(self, name):
+        """
+        Borrow an engine for the duration of a ``with`` block.
+
+        Concurrent leases of the same engine are serialized; leases of
+        different engines run in parallel.
+        """
+        slot = self._slot(name)
+        reused = slot.instance is not None
+        instance = self._build(slot)
+
+        waited = time.perf_counter()
+        with slot.use_lock:
+            started = time.perf_counter()
+            slot.leases += 1
+            slot.reuses += reused
+            slot.wait_seconds += started - waited
+            try:
+                yield instance
+            finally:
+                slot.busy_seconds += time.perf_counter() - started
+
+    def warm_up(self, names=None):
+        """
+        Build engines eagerly so the first scan does not pay for model loading.
+
+        A failing engine is logged and skipped; it will be retried on first use.
+
+        Returns:
+            dict: engine name -> build time in seconds (None if it failed)
+        """
+        if not self._configured:
+            self.configure()
+        timings = {}
+        for name in names or list(self._slots):
+            slot = self._slot(name)
+            try:
+                self._build(slot)
+                timings[name] = round(slot.build_seconds, 3)
+            except Exception as e:
+                logger.error(f"Failed to warm up OCR engine '{name}': {str(e)}", exc_info=True)
+                timings[name] = None
+        return timings
+
+    def evict(self, name):
+        slot = self._slot(name)
+        with slot.build_lock, slot.use_lock:
+            instance, slot.instance = slot.instance, None
+        if instance is not None:
+            logger.info(f"Evicted OCR engine '{name}'")
+            self._run_hooks('evicted', name, instance)
+
+    def shutdown(self):
+        for name in list(self._slots):
+            self.evict(name)
+
+    def stats(self):
+        return {name: slot.stats() for name, slot in self._slots.items()}
+
+
+engine_registry = EngineRegistry()
+atexit.register(engine_registry.shutdown)
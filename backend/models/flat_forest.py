@@ -0,0 +1,205 @@
+import logging
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# Rows densified and walked at once; bounds the dense copy of sparse input
+# (CHUNK_ROWS x features used by the forest, float32)
+CHUNK_ROWS = 512
+
+# Tree steps between checks for rows that reached their leaves
+STEPS_PER_CHECK = 8
+
+
+class FlatForest:
+    """
+    A fitted sklearn forest regressor (RandomForestRegressor, ExtraTreesRegressor)
+    flattened into contiguous node arrays shared by all its trees, and a
+    numpy evaluator for them.
+
+    Every row walks every tree at once: each step gathers the split feature
+    of the current nodes, compares it with their thresholds and moves to the
+    left or right child, and entries that reached a leaf drop out of the
+    next step. Only the features the forest splits on are kept, as a dense
+    float32 matrix, so sparse TF-IDF rows are densified into a few thousand
+    columns per chunk of rows.
+
+    Predictions match ``forest.predict``: the input is compared as float32
+    like sklearn does, and the tree outputs are summed in tree order before
+    dividing by the number of trees.
+    """
+
+    def __init__(self, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        counts = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        left = np.concatenate([tree.children_left for tree in trees]).astype(np.int64)
+        right = np.concatenate([tree.children_right for tree in trees]).astype(np.int64)
+        self.is_leaf = left < 0
+        node_offsets = np.repeat(offsets, counts)
+        left = left + node_offsets
+        right = right + node_offsets
+        # children[node, go_left] is the (right, left) child; a leaf is its own child, so
+        # rows that reached one can keep stepping until the others catch up
+        own = np.arange(len(left))
+        self.children = np.stack([np.where(self.is_leaf, own, right), np.where(self.is_leaf, own, left)], axis=1)
+        self.threshold = np.concatenate([tree.threshold for tree in trees])
+        # (nodes, outputs): the mean target of the training rows in each node
+        self.value = np.concatenate([tree.value[:, :, 0] for tree in trees])
+        self.roots = offsets
+
+        feature = np.concatenate([tree.feature for tree in trees])
+        self.features = np.unique(feature[~self.is_leaf])
+        self.feature = np.where(self.is_leaf, 0, np.searchsorted(self.features, feature))
+        self.n_features_in = forest.n_features_in_
+        # Input feature -> column of the dense matrix, -1 for features no tree splits on
+        self.columns = np.full(self.n_features_in, -1, dtype=np.int64)
+        self.columns[self.features] = np.arange(len(self.features))
+
+        self.n_trees = len(trees)
+        self.n_outputs = self.value.shape[1]
+        self.max_depth = max(tree.max_depth for tree in trees)
+
+    def __len__(self):
+        return len(self.threshold)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.is_leaf, self.children, self.threshold, self.value, self.roots, self.feature, self.columns,
+        ))
+
+    def _dense(self, X):
+        """The used features of a chunk of rows, as float32 (sklearn's comparison dtype)"""
+        if sparse.issparse(X):
+            X = X.tocsr()
+            if not X.has_canonical_format:
+                X = X.copy()
+                X.sum_duplicates()
+            rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+            columns = self.columns[X.indices]
+            used = columns >= 0
+            dense = np.zeros((X.shape[0], len(self.features)), dtype=np.float32)
+            dense[rows[used], columns[used]] = X.data[used]
+            return dense
+        return np.ascontiguousarray(X[:, self.features])
+
+    def _leaves(self, dense):
+        """(rows, trees) leaf node of every row in every tree"""
+        n_rows, n_columns = dense.shape
+        nodes = np.tile(self.roots, n_rows)
+        # Offset of each entry's row in the flattened dense matrix
+        starts = np.repeat(np.arange(n_rows) * n_columns, self.n_trees)
+        values = dense.ravel()
+        feature, threshold, children, is_leaf = self.feature, self.threshold, self.children, self.is_leaf
+
+        active = np.arange(len(nodes))
+        current = nodes
+        while True:
+            for _ in range(STEPS_PER_CHECK):
+                go_left = values[starts + feature[current]] <= threshold[current]
+                current = children[current, go_left.view(np.int8)]
+            done = is_leaf[current]
+            if done.all():
+                nodes[active] = current
+                return nodes.reshape(n_rows, self.n_trees)
+            # Drop finished entries once they are the majority; stepping them costs as much as the rest
+            if 2 * np.count_nonzero(done) > len(done):
+                nodes[active[done]] = current[done]
+                inner = ~done
+                active, current, starts = active[inner], current[inner], starts[inner]
+
+    def predict(self, X):
+        """
+        Args:
+            X: (rows, n_features_in) array-like or scipy sparse matrix
+
+        Returns:
+            np.ndarray: (rows,) for single-output forests, (rows, outputs) otherwise
+
+        Raises:
+            ValueError: for a wrong number of features, NaN or infinite values
+        """
+        if not sparse.issparse(X):
+            X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in:
+            raise ValueError(f"X must have shape (rows, {self.n_features_in}), got {X.shape}")
+        # sklearn refuses these too (after the same float32 cast) unless trained with missing values
+        if not np.isfinite(X.data if sparse.issparse(X) else X).all():
+            raise ValueError("Input contains NaN or infinity")
+        prediction = np.zeros((X.shape[0], self.n_outputs))
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            leaves = self._leaves(self._dense(X[start:start + CHUNK_ROWS]))
+            chunk = prediction[start:start + CHUNK_ROWS]
+            # Tree by tree, in sklearn's order, so the sums round the same way
+            for tree in range(self.n_trees):
+                chunk += self.value[leaves[:, tree]]
+        prediction /= self.n_trees
+        return prediction[:, 0] if self.n_outputs == 1 else prediction
+
+
+def flatten_forest(model):
+    """FlatForest of a fitted forest regressor, or None if ``model`` is not one"""
+    estimators = getattr(model, 'estimators_', None)
+    # Gradient boosting keeps a 2-D array of trees whose outputs are added, not averaged
+    if not isinstance(estimators, list) or not estimators or not all(hasattr(tree, 'tree_') for tree in estimators):
+        logger.info(f"Not flattening {type(model).__name__}: not a forest of decision trees")
+        return None
+    if hasattr(model, 'classes_'):
+        logger.info(f"Not flattening {type(model).__name__}: only forest regressors are supported")
+        return None
+    return FlatForest(model)
+
+
+def parity_rows(forest, count, rng, features_per_row=64):
+    """
+    Rows for checking a FlatForest against its sklearn forest: up to
+    ``features_per_row`` of the features the forest splits on are set to one
+    of their thresholds, exactly or nudged either way, so the rows take both
+    branches and hit the ``<=`` boundary.
+
+    Returns:
+        scipy.sparse.csr_matrix: (count, n_features_in)
+    """
+    inner = ~forest.is_leaf
+    order = np.argsort(forest.feature[inner], kind='stable')
+    split_columns = forest.feature[inner][order]
+    thresholds = forest.threshold[inner][order]
+    columns = np.arange(len(forest.features))
+    starts = np.searchsorted(split_columns, columns)
+    counts = np.searchsorted(split_columns, columns, side='right') - starts
+
+    size = min(len(columns), features_per_row)
+    rows, cols, values = [], [], []
+    for row in range(count):
+        chosen = rng.choice(columns, size=size, replace=False)
+        picked = thresholds[starts[chosen] + (rng.random(size) * counts[chosen]).astype(np.int64)]
+        nudge = rng.choice([-1e-4, 0.0, 1e-4], size=size) * np.maximum(np.abs(picked), 1.0)
+        rows.append(np.full(size, row))
+        cols.append(forest.features[chosen])
+        values.append(picked + nudge)
+    return sparse.csr_matrix(
+        (np.concatenate(values).astype(np.float32), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(count, forest.n_features_in),
+    )
+
+
+def verify_flat_forest(model, forest, count=32, seed=0):
+    """
+    Whether ``forest`` scores parity_rows exactly like ``model.predict``.
+
+    Returns:
+        float: largest absolute difference (0.0 when they agree)
+    """
+    X = parity_rows(forest, count, np.random.default_rng(seed))
+    feature_names = getattr(model, 'feature_names_in_', None)
+    if feature_names is not None:
+        # Fitted on a DataFrame: give sklearn one too, the flat forest the same values
+        import pandas as pd
+        X = X.toarray()
+        expected = model.predict(pd.DataFrame(X, columns=feature_names))
+    else:
+        expected = model.predict(X)
+    return float(np.max(np.abs(np.asarray(expected, dtype=float) - forest.predict(X)), initial=0.0))
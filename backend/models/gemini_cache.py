@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEMINI_CACHE = {
+    'ENABLED': True,
+    'PATH': None,
+    'TTL': 7 * 24 * 3600,
+    'MAX_MEMORY_ENTRIES': 1024,
+}
+
+
+def make_cache_key(prompt_version, image_bytes=None, text=None):
+    """
+    Cache key for one Gemini call.
+
+    Args:
+        prompt_version: Version tag of the prompt template; bump it whenever the
+                        prompt changes so stale answers are not served
+        image_bytes: Raw bytes of the image sent along with the prompt, if any
+        text: The variable text the prompt is built from (OCR text, scores, ...)
+    """
+    digest = hashlib.sha256()
+    digest.update(prompt_version.encode())
+    digest.update(b'\0')
+    digest.update(hashlib.sha256(image_bytes or b'').digest())
+    digest.update(b'\0')
+    digest.update((text or '').encode('utf-8', 'replace'))
+    return digest.hexdigest()
+
+
+class GeminiResponseCache:
+    """
+    Two-tier cache for Gemini response texts.
+
+    The first tier is an in-process LRU. The second is a SQLite file shared by
+    every worker on the host, so a label scanned by one worker is a hit for the
+    others and survives restarts. Entries expire after ``TTL`` seconds.
+    """
+
+    def __init__(self, config=None):
+        self._config = config
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_ready = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+
+    @property
+    def config(self):
+        if self._config is None:
+            config = dict(DEFAULT_GEMINI_CACHE)
+            config.update(getattr(settings, 'GEMINI_CACHE', {}))
+            if not config['PATH']:
+                config['PATH'] = os.path.join(settings.BASE_DIR, 'gemini_cache.sqlite3')
+            self._config = config
+        return self._config
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    def _connection(self):
+        """One SQLite connection per thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.config['PATH'], timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            if not self._schema_ready:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS gemini_cache ('
+                    'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+                )
+                connection.commit()
+                self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    def _remember(self, key, value, expires_at):
+        with self._memory_lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.config['MAX_MEMORY_ENTRIES']:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached response text, or None on a miss"""
+        if not self.enabled:
+            return None
+        now = time.time()
+
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+        try:
+            row = self._connection().execute(
+                'SELECT value, expires_at FROM gemini_cache WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Gemini cache read failed: {str(e)}")
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    def set(self, key, value):
+        """Store a response text under ``key`` for TTL seconds"""
+        if not self.enabled or not value:
+            return
+        expires_at = time.time() + self.config['TTL']
+        self._remember(key, value, expires_at)
+        try:
+            connection = self._connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO gemini_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, expires_at)
+            )
+            connection.commit()
+            self.stores += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Gemini cache write failed: {str(e)}")
+
+    def purge_expired(self):
+        """Delete expired rows from the SQLite tier; returns the number removed"""
+        connection = self._connection()
+        deleted = connection.execute('DELETE FROM gemini_cache WHERE expires_at <= ?', (time.time(),)).rowcount
+        connection.commit()
+        return deleted
+
+    def clear(self):
+        with self._memory_lock:
+            self._memory.clear()
+        connection = self._connection()
+        connection.execute('DELETE FROM gemini_cache')
+        connection.commit()
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'memory_entries': len(self._memory),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'errors': self.errors,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+gemini_cache = GeminiResponseCache()
@@ -0,0 +1,349 @@
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEMINI_CLIENT = {
+    'MODEL': 'gemini-2.0-flash',
+    'MAX_CONCURRENCY': 8,
+    'RATE_PER_SECOND': 0,
+    'BURST': 10,
+    'DEADLINE': 20.0,
+    'FAILURE_THRESHOLD': 5,
+    'RESET_SECONDS': 30.0,
+}
+
+# How often an async caller re-checks for a free concurrency slot
+_ASYNC_SLOT_POLL = 0.01
+
+
+class GeminiUnavailable(Exception):
+    """Gemini was not called: no client, the circuit is open or no capacity before the deadline"""
+
+
+class TokenBucket:
+    """Rate limiter: ``rate`` calls per second on average, bursts of up to ``burst``"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        Take a token.
+
+        Returns:
+            float or None: seconds to wait before the call may start, None if
+            that would be longer than ``max_wait`` (nothing is taken then)
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            # Tokens may go negative: later callers then wait behind this reservation
+            self.tokens -= 1
+            return wait
+
+
+class ConcurrencyLimit:
+    """Counting semaphore usable from threads and from any event loop"""
+
+    def __init__(self, limit):
+        self.limit = max(limit, 1)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def try_acquire(self):
+        with self._condition:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self, timeout):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < self.limit, timeout=max(timeout, 0)):
+                return False
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(_ASYNC_SLOT_POLL)
+        return True
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures; while open, calls are refused
+    without touching the network. After ``reset_seconds`` a single trial call is
+    let through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = max(threshold, 1)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def release(self):
+        """An allowed call ended without an outcome (no capacity before its deadline, cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                    logger.warning(f"Gemini circuit opened after {self.failures} consecutive failure(s)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class GeminiClient:
+    """
+    The Gemini model shared by the OCR engines and the analysis summaries.
+
+    The SDK is configured and the model built once per process. Every call
+    goes through a concurrency cap and a token bucket, has a deadline that
+    covers both the wait for capacity and the request, and is refused at once
+    while the circuit breaker is open, so callers drop to their rule-based
+    fallbacks instead of piling up behind a slow or failing Gemini.
+    """
+
+    def __init__(self, config=None):
+        self._config = config
+        self._model = None
+        self._model_failed = False
+        self._setup_lock = threading.Lock()
+        self._limit = None
+        self._bucket = None
+        self._breaker = None
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = {'circuit_open': 0, 'concurrency': 0, 'rate_limit': 0}
+        self.call_seconds = 0.0
+
+    @property
+    def config(self):
+        if self._config is None:
+            config = dict(DEFAULT_GEMINI_CLIENT)
+            config.update(getattr(settings, 'GEMINI_CLIENT', {}))
+            self._config = config
+        return self._config
+
+    @property
+    def model(self):
+        """The GenerativeModel, built on first use; None if it cannot be built"""
+        if self._model is None and not self._model_failed:
+            with self._setup_lock:
+                if self._model is None and not self._model_failed:
+                    try:
+                        # Imported here: the SDK takes most of a second and ~80 MB to import
+                        import google.generativeai as genai
+                        genai.configure(api_key=settings.GEMINI_API_KEY)
+                        self._model = genai.GenerativeModel(self.config['MODEL'])
+                        logger.info("Gemini AI initialized successfully")
+                    except Exception as e:
+                        logger.error(f"Failed to initialize Gemini AI: {str(e)}")
+                        self._model_failed = True
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self._model_failed = model is None
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    def _guards(self):
+        if self._breaker is None:
+            with self._setup_lock:
+                if self._breaker is None:
+                    config = self.config
+                    self._limit = ConcurrencyLimit(config['MAX_CONCURRENCY'])
+                    self._bucket = TokenBucket(config['RATE_PER_SECOND'], config['BURST'])
+                    self._breaker = CircuitBreaker(config['FAILURE_THRESHOLD'], config['RESET_SECONDS'])
+        return self._limit, self._bucket, self._breaker
+
+    def _reject(self, reason, message):
+        with self._stats_lock:
+            self.rejected[reason] += 1
+        raise GeminiUnavailable(message)
+
+    def _admit(self, breaker):
+        model = self.model
+        if model is None:
+            raise GeminiUnavailable('Gemini AI is not configured')
+        if not breaker.allow():
+            self._reject('circuit_open', 'Gemini circuit is open')
+        return model
+
+    def _record(self, breaker, started, error=None):
+        elapsed = time.monotonic() - started
+        with self._stats_lock:
+            self.calls += 1
+            self.call_seconds += elapsed
+            if error is None:
+                self.successes += 1
+            else:
+                self.failures += 1
+        if error is None:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def generate(self, contents, deadline=None):
+        """
+        Text of a generate_content call.
+
+        Args:
+            contents: Prompt, or prompt and image parts
+            deadline: Seconds for the whole call, defaults to DEADLINE
+
+        Raises:
+            GeminiUnavailable: if the call was not made; other exceptions come from the call itself
+        """
+        deadline_at = time.monotonic() + (deadline or self.config['DEADLINE'])
+        limit, bucket, breaker = self._guards()
+        model = self._admit(breaker)
+
+        settled = False
+        try:
+            if not limit.acquire(deadline_at - time.monotonic()):
+                self._reject('concurrency', 'No Gemini capacity before the deadline')
+            try:
+                wait = bucket.reserve(deadline_at - time.monotonic())
+                if wait is None:
+                    self._reject('rate_limit', 'Gemini rate limit leaves no time before the deadline')
+                time.sleep(wait)
+
+                started = time.monotonic()
+                try:
+                    response = model.generate_content(
+                        contents, request_options={'timeout': max(deadline_at - started, 0.001)}
+                    )
+                    text = response.text.strip()
+                except Exception as e:
+                    settled = True
+                    self._record(breaker, started, e)
+                    raise
+                settled = True
+                self._record(breaker, started)
+                return text
+            finally:
+                limit.release()
+        finally:
+            # Refused, cancelled or interrupted before it had an outcome: give back a half-open trial
+            if not settled:
+                breaker.release()
+
+    async def generate_async(self, contents, deadline=None):
+        """generate on the SDK's async client; waits for capacity without blocking the event loop"""
+        deadline_at = time.monotonic() + (deadline or self.config['DEADLINE'])
+        limit, bucket, breaker = self._guards()
+        model = self._admit(breaker)
+
+        settled = False
+        try:
+            if not await limit.acquire_async(deadline_at - time.monotonic()):
+                self._reject('concurrency', 'No Gemini capacity before the deadline')
+            try:
+                wait = bucket.reserve(deadline_at - time.monotonic())
+                if wait is None:
+                    self._reject('rate_limit', 'Gemini rate limit leaves no time before the deadline')
+                await asyncio.sleep(wait)
+
+                started = time.monotonic()
+                remaining = max(deadline_at - started, 0.001)
+                try:
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(contents, request_options={'timeout': remaining}),
+                        remaining,
+                    )
+                    text = response.text.strip()
+                except Exception as e:
+                    settled = True
+                    self._record(breaker, started, e)
+                    raise
+                settled = True
+                self._record(breaker, started)
+                return text
+            finally:
+                limit.release()
+        finally:
+            # CancelledError is not an Exception: a cancelled trial must still free the half-open slot
+            if not settled:
+                breaker.release()
+
+    def stats(self):
+        limit, bucket, breaker = self._guards()
+        return {
+            'available': self._model is not None,
+            'circuit': breaker.state,
+            'circuit_trips': breaker.trips,
+            'consecutive_failures': breaker.failures,
+            'in_flight': limit.in_flight,
+            'calls': self.calls,
+            'successes': self.successes,
+            'failures': self.failures,
+            'rejected': dict(self.rejected),
+            'avg_call_ms': round(self.call_seconds / self.calls * 1000, 2) if self.calls else 0.0,
+        }
+
+
+gemini_client = GeminiClient()
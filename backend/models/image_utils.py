@@ -0,0 +1,329 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_NORMALIZATION = {
+    'ENABLED': True,
+    # Longest side in pixels after normalization (None disables the cap)
+    'MAX_DIMENSION': 2000,
+    # Median text line height in pixels to scale towards (None disables the estimate)
+    'TARGET_TEXT_HEIGHT': 32,
+    # Never shrink by more than this factor, whatever the estimate says
+    'MIN_SCALE': 0.25,
+}
+
+# Longest side of the thumbnail used to estimate the text height
+ESTIMATE_DIMENSION = 800
+
+
+def normalization_config():
+    config = dict(DEFAULT_IMAGE_NORMALIZATION)
+    config.update(getattr(settings, 'IMAGE_NORMALIZATION', {}))
+    return config
+
+
+def estimate_text_height(image):
+    """
+    Estimate the median height of the text glyphs in an image.
+
+    The estimate runs on a small grayscale thumbnail: Otsu binarization
+    followed by connected components, keeping blobs shaped like characters.
+
+    Args:
+        image: BGR or grayscale image array
+
+    Returns:
+        float: median glyph height in pixels of the original image, or None
+               if no character-like components were found
+    """
+    import cv2
+    import numpy as np
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape[:2]
+    factor = min(1.0, ESTIMATE_DIMENSION / max(height, width))
+    if factor < 1.0:
+        gray = cv2.resize(gray, (max(int(width * factor), 1), max(int(height * factor), 1)), interpolation=cv2.INTER_AREA)
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # Labels are usually dark text on a light background; flip if Otsu picked the other way round
+    if cv2.countNonZero(binary) > binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return None
+
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    glyphs = (
+        (heights >= 4) & (heights <= binary.shape[0] / 5)
+        & (widths <= heights * 3) & (heights <= widths * 8)
+        & (areas >= 8)
+    )
+    if np.count_nonzero(glyphs) < 5:
+        return None
+    return float(np.median(heights[glyphs])) / factor
+
+
+class NormalizationReport:
+    """What normalize_resolution did to one image"""
+
+    def __init__(self, original_shape, shape, original_bytes, normalized_bytes, text_height, elapsed_ms):
+        self.original_shape = original_shape
+        self.shape = shape
+        self.original_bytes = original_bytes
+        self.normalized_bytes = normalized_bytes
+        self.text_height = text_height
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def scale(self):
+        return self.shape[0] / self.original_shape[0]
+
+    @property
+    def pixel_ratio(self):
+        """Original pixel count divided by the normalized one"""
+        return (self.original_shape[0] * self.original_shape[1]) / (self.shape[0] * self.shape[1])
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - self.normalized_bytes
+
+    def estimated_time_saved_ms(self, processing_ms):
+        """
+        Estimate how much of ``processing_ms`` the resize saved.
+
+        Denoising, thresholding and text detection all scale about linearly
+        with the pixel count, so the full-resolution run is estimated as
+        ``processing_ms * pixel_ratio``; the cost of normalizing is subtracted.
+        """
+        return processing_ms * (self.pixel_ratio - 1) - self.elapsed_ms
+
+    def as_dict(self, processing_ms=None):
+        data = {
+            'original_shape': list(self.original_shape[:2]),
+            'shape': list(self.shape[:2]),
+            'scale': round(self.scale, 4),
+            'text_height': round(self.text_height, 1) if self.text_height else None,
+            'bytes_saved': self.bytes_saved,
+            'normalize_ms': round(self.elapsed_ms, 2),
+        }
+        if processing_ms is not None:
+            data['processing_ms'] = round(processing_ms, 2)
+            data['estimated_time_saved_ms'] = round(self.estimated_time_saved_ms(processing_ms), 2)
+        return data
+
+
+def normalize_resolution(image, max_dimension=None, target_text_height=None, min_scale=None):
+    """
+    Downsample an image before preprocessing and OCR.
+
+    The scale is the smallest of ``max_dimension / longest side`` and
+    ``target_text_height / estimated text height``, clamped to
+    [``min_scale``, 1]; images are never upscaled. Arguments left as None
+    come from settings.IMAGE_NORMALIZATION.
+
+    Args:
+        image: BGR or grayscale image array
+
+    Returns:
+        tuple: (image, NormalizationReport); the input array is returned
+               untouched when no resize is needed or normalization is disabled
+    """
+    config = normalization_config()
+    started = time.perf_counter()
+    original_shape = image.shape
+
+    if not config['ENABLED']:
+        return image, NormalizationReport(original_shape, original_shape, image.nbytes, image.nbytes, None, 0.0)
+
+    max_dimension = max_dimension if max_dimension is not None else config['MAX_DIMENSION']
+    target_text_height = target_text_height if target_text_height is not None else config['TARGET_TEXT_HEIGHT']
+    min_scale = min_scale if min_scale is not None else config['MIN_SCALE']
+
+    height, width = original_shape[:2]
+    scale = 1.0
+    if max_dimension:
+        scale = min(scale, max_dimension / max(height, width))
+
+    text_height = None
+    if target_text_height:
+        text_height = estimate_text_height(image)
+        if text_height:
+            scale = min(scale, target_text_height / text_height)
+
+    scale = max(scale, min_scale)
+    normalized = image
+    if scale < 1.0:
+        size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+        import cv2
+        normalized = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    report = NormalizationReport(
+        original_shape, normalized.shape, image.nbytes, normalized.nbytes,
+        text_height, (time.perf_counter() - started) * 1000,
+    )
+    return normalized, report
+
+
+class NormalizationStats:
+    """Per-process totals of what resolution normalization saved"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.resized = 0
+        self.pixels_in = 0
+        self.pixels_out = 0
+        self.bytes_saved = 0
+        self.normalize_ms = 0.0
+        self.estimated_time_saved_ms = 0.0
+
+    def record(self, source, report, processing_ms):
+        """Log one image's savings and add them to the totals"""
+        time_saved = report.estimated_time_saved_ms(processing_ms)
+        if report.scale < 1.0:
+            logger.info(
+                f"{source}: normalized {report.original_shape[1]}x{report.original_shape[0]} -> "
+                f"{report.shape[1]}x{report.shape[0]} (text height {report.text_height or 0:.0f}px), "
+                f"saved {report.bytes_saved / 1048576:.1f} MiB and ~{time_saved:.0f} ms"
+            )
+        with self._lock:
+            self.images += 1
+            self.resized += report.scale < 1.0
+            self.pixels_in += report.original_shape[0] * report.original_shape[1]
+            self.pixels_out += report.shape[0] * report.shape[1]
+            self.bytes_saved += report.bytes_saved
+            self.normalize_ms += report.elapsed_ms
+            self.estimated_time_saved_ms += time_saved
+
+    def stats(self):
+        return {
+            'images': self.images,
+            'resized': self.resized,
+            'pixel_reduction': round(1 - self.pixels_out / self.pixels_in, 4) if self.pixels_in else 0.0,
+            'bytes_saved': self.bytes_saved,
+            'avg_normalize_ms': round(self.normalize_ms / self.images, 2) if self.images else 0.0,
+            'avg_estimated_time_saved_ms': round(self.estimated_time_saved_ms / self.images, 2) if self.images else 0.0,
+        }
+
+
+normalization_stats = NormalizationStats()
+
+
+# Leading bytes of the formats a label photo is likely to come in
+_IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'RIFF', 'image/webp'),
+    (b'GIF8', 'image/gif'),
+)
+
+
+class LabelImage:
+    """
+    A label image held in memory as its encoded bytes.
+
+    The upload is read once: the same bytes are hashed, sent to Gemini and,
+    on first use, decoded with cv2.imdecode for preprocessing and OCR. Nothing
+    touches the disk unless ``save`` is called.
+    """
+
+    def __init__(self, data, name='label.jpg', path=None):
+        self.data = data
+        self.name = name
+        self.path = path
+        self._array = None
+        self._content_hash = None
+
+    @classmethod
+    def from_upload(cls, uploaded_file):
+        """Read an uploaded (or stored) file, leaving it rewound for any other reader"""
+        data = b''.join(uploaded_file.chunks())
+        uploaded_file.seek(0)
+        return cls(data, os.path.basename(uploaded_file.name or 'label.jpg'))
+
+    @classmethod
+    def from_path(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read(), os.path.basename(path), path)
+
+    @property
+    def content_hash(self):
+        """SHA-256 of the bytes"""
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.data).hexdigest()
+        return self._content_hash
+
+    @property
+    def mime_type(self):
+        for signature, mime_type in _IMAGE_SIGNATURES:
+            if self.data.startswith(signature):
+                return mime_type
+        return 'image/jpeg'
+
+    def decode(self):
+        """BGR array of the image, decoded on the first call; None if the bytes are not an image"""
+        if self._array is None and self.data:
+            # cv2 and numpy are imported on first use, so importing the URLconf does not load them
+            import cv2
+            import numpy as np
+            self._array = cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+        return self._array
+
+    def thumbnail(self, max_dimension):
+        """
+        Copy whose longest side is at most ``max_dimension``, for cheap checks;
+        the image itself if it is already that small, None if it cannot be decoded
+        """
+        image = self.decode()
+        if image is None:
+            return None
+        height, width = image.shape[:2]
+        scale = max_dimension / max(height, width)
+        if scale >= 1:
+            return self
+        import cv2
+        small = cv2.resize(image, (max(int(width * scale), 1), max(int(height * scale), 1)), interpolation=cv2.INTER_AREA)
+        thumbnail = LabelImage(cv2.imencode('.jpg', small)[1].tobytes(), self.name)
+        thumbnail._array = small
+        return thumbnail
+
+    def gemini_part(self):
+        """Inline image part for generate_content; the SDK takes the raw bytes, no base64 copy"""
+        return {'mime_type': self.mime_type, 'data': self.data}
+
+    def save(self, directory):
+        """Write the bytes under ``directory`` with a unique name; returns (and keeps) the path"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{uuid.uuid4().hex}_{self.name}")
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        self.path = path
+        return path
+
+
+def as_label_image(image):
+    """
+    LabelImage of a LabelImage or an image file path.
+
+    Returns:
+        LabelImage or None if ``image`` is empty or the path is not a readable file
+    """
+    if image is None or isinstance(image, LabelImage):
+        return image
+    if not image or not os.path.isfile(image):
+        return None
+    try:
+        return LabelImage.from_path(image)
+    except OSError as e:
+        logger.error(f"Error reading image {image}: {str(e)}")
+        return None
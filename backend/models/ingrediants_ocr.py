@@ -1,7 +1,6 @@
 import cv2
-import easyocr
 import re
-import google.generativeai as genai
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes, parser_classes
@@ -9,8 +8,13 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 from Authentication.models import OCRResult
 import logging
-import base64
+import json
 import os
+import time
+from models.gemini_cache import gemini_cache, make_cache_key
+from models.gemini_client import GeminiUnavailable, gemini_client
+from models.image_utils import as_label_image, normalization_stats, normalize_resolution
+from models.ingredient_lexicon import fix_ocr_digits, ingredient_lexicon
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -19,54 +23,46 @@ logger = logging.getLogger(__name__)
 class IngredientExtractor:
     """Extracts ingredients from food product images"""
     
+    # Bump when the extraction prompt changes so cached Gemini answers are not reused
+    GEMINI_PROMPT_VERSION = 'ingredients-v1'
+    
     def __init__(self):
         """ Initialize EasyOCR reader """
+        # EasyOCR brings torch with it; only building a real reader pays for that
+        import easyocr
         self.reader = easyocr.Reader(['en'])
-        
-        # Initialize Gemini AI
-        try:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.gemini_model = genai.GenerativeModel('gemini-2.0-flash')
-            logger.info("Gemini AI initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini AI: {str(e)}")
-            self.gemini_model = None
 
-    def extract_from_image(self, image_path):
-        """Extract raw text from image using OCR"""
-        image = cv2.imread(image_path)
+    def extract_from_image(self, image):
+        """Extract raw text from an image (LabelImage or file path) using OCR"""
+        label = as_label_image(image)
+        image = label.decode() if label else None
         if image is None:
             raise ValueError("Error: Unable to load image.")
 
+        # EasyOCR resizes internally anyway; normalizing first avoids reading 12MP photos at full size
+        image, normalization = normalize_resolution(image)
+        started = time.perf_counter()
         results = self.reader.readtext(image)
+        normalization_stats.record('ingredients', normalization, (time.perf_counter() - started) * 1000)
         extracted_text = "\n".join([res[1] for res in results])
         return extracted_text
 
-    def extract_ingredients_with_gemini(self, ocr_text, image_path=None):
-        """Directly ask Gemini to extract ingredients from OCR text and optionally image"""
-        if not self.gemini_model:
-            logger.warning("Gemini AI not available for ingredient extraction")
-            return self.parse_ingredients(ocr_text)  # Fallback to simple parsing
+    def _gemini_request(self, ocr_text, image=None):
+        """
+        Build the ingredients extraction request.
+
+        Args:
+            ocr_text: OCR text of the label
+            image: LabelImage or file path sent along with the text, if any
+
+        Returns:
+            tuple: (contents for generate_content, cache key)
+        """
+        # The image part carries the upload's own bytes
+        label = as_label_image(image)
+        image_parts = [label.gemini_part()] if label else []
         
-        try:
-            # Prepare the image if available
-            image_parts = []
-            if image_path and os.path.isfile(image_path):
-                try:
-                    with open(image_path, "rb") as img_file:
-                        image_data = img_file.read()
-                        encoded_image = base64.b64encode(image_data).decode('utf-8')
-                        image_parts = [
-                            {
-                                "mime_type": "image/jpeg",
-                                "data": encoded_image
-                            }
-                        ]
-                        logger.info("Successfully encoded image for Gemini")
-                except Exception as img_error:
-                    logger.error(f"Error encoding image: {str(img_error)}")
-            
-            prompt = f"""
+        prompt = f"""
             You are a food ingredients expert. I have scanned a food product and extracted the following text from it. 
             Please identify and extract ONLY the ingredients list from this text:
 
@@ -86,39 +82,87 @@ class IngredientExtractor:
 
             Respond ONLY with a valid JSON array of ingredient strings.
             """
+        
+        # Identical image bytes and OCR text get the cached answer
+        cache_key = make_cache_key(self.GEMINI_PROMPT_VERSION, label.data if label else None, ocr_text)
+        contents = [prompt] + image_parts if image_parts else prompt
+        return contents, cache_key
+
+    def _ingredients_from_response(self, gemini_text, ocr_text, cache_key, from_cache):
+        """Parse Gemini's answer, caching it if usable; rule-based parsing otherwise"""
+        # Extract JSON array from response
+        json_match = re.search(r'\[.*\]', gemini_text, re.DOTALL)
+        if json_match:
+            try:
+                ingredients = json.loads(json_match.group(0))
+                if isinstance(ingredients, list) and len(ingredients) > 0:
+                    logger.info(f"Successfully extracted {len(ingredients)} ingredients with Gemini")
+                    if not from_cache:
+                        gemini_cache.set(cache_key, gemini_text)
+                    return ingredients
+                else:
+                    logger.warning("Gemini returned an empty ingredients list")
+            except json.JSONDecodeError as json_err:
+                logger.warning(f"Could not parse Gemini response as JSON: {gemini_text}")
+        else:
+            logger.warning(f"No JSON array found in Gemini response: {gemini_text}")
+        
+        # Fallback to standard parsing if Gemini processing fails
+        return self.parse_ingredients(ocr_text)
+
+    def extract_ingredients_with_gemini(self, ocr_text, image=None):
+        """Directly ask Gemini to extract ingredients from OCR text and optionally image"""
+        if not gemini_client.available:
+            logger.warning("Gemini AI not available for ingredient extraction")
+            return self.parse_ingredients(ocr_text)  # Fallback to simple parsing
+        
+        try:
+            contents, cache_key = self._gemini_request(ocr_text, image)
+            gemini_text = gemini_cache.get(cache_key)
+            from_cache = gemini_text is not None
             
-            # Get response from Gemini with or without image
-            if image_parts:
-                response = self.gemini_model.generate_content(
-                    [prompt] + image_parts
-                )
+            if from_cache:
+                logger.info("Using cached Gemini ingredients response")
             else:
-                response = self.gemini_model.generate_content(prompt)
-                
-            gemini_text = response.text.strip()
+                # Get response from Gemini with or without image
+                gemini_text = gemini_client.generate(contents)
             
-            # Extract JSON array from response
-            json_match = re.search(r'\[.*\]', gemini_text, re.DOTALL)
-            if json_match:
-                try:
-                    import json
-                    ingredients = json.loads(json_match.group(0))
-                    if isinstance(ingredients, list) and len(ingredients) > 0:
-                        logger.info(f"Successfully extracted {len(ingredients)} ingredients with Gemini")
-                        return ingredients
-                    else:
-                        logger.warning("Gemini returned an empty ingredients list")
-                except json.JSONDecodeError as json_err:
-                    logger.warning(f"Could not parse Gemini response as JSON: {gemini_text}")
+            return self._ingredients_from_response(gemini_text, ocr_text, cache_key, from_cache)
+        
+        except GeminiUnavailable as e:
+            logger.warning(f"Skipping Gemini ingredient extraction: {str(e)}")
+            return self.parse_ingredients(ocr_text)
+        except Exception as e:
+            logger.error(f"Error extracting ingredients with Gemini: {str(e)}")
+            return self.parse_ingredients(ocr_text)  # Fallback to simple parsing
+
+    async def extract_ingredients_with_gemini_async(self, ocr_text, image=None):
+        """extract_ingredients_with_gemini on the async Gemini client, for async views"""
+        if not gemini_client.available:
+            logger.warning("Gemini AI not available for ingredient extraction")
+            return self.parse_ingredients(ocr_text)
+        
+        try:
+            contents, cache_key = self._gemini_request(ocr_text, image)
+            # The cache is SQLite: its reads and writes run off the event loop
+            gemini_text = await sync_to_async(gemini_cache.get, thread_sensitive=False)(cache_key)
+            from_cache = gemini_text is not None
+            
+            if from_cache:
+                logger.info("Using cached Gemini ingredients response")
             else:
-                logger.warning(f"No JSON array found in Gemini response: {gemini_text}")
+                gemini_text = await gemini_client.generate_async(contents)
             
-            # Fallback to standard parsing if Gemini processing fails
+            return await sync_to_async(self._ingredients_from_response, thread_sensitive=False)(
+                gemini_text, ocr_text, cache_key, from_cache
+            )
+        
+        except GeminiUnavailable as e:
+            logger.warning(f"Skipping Gemini ingredient extraction: {str(e)}")
             return self.parse_ingredients(ocr_text)
-                
         except Exception as e:
             logger.error(f"Error extracting ingredients with Gemini: {str(e)}")
-            return self.parse_ingredients(ocr_text)  # Fallback to simple parsing
+            return self.parse_ingredients(ocr_text)
 
     def parse_ingredients(self, text):
         """Traditional rule-based ingredient parsing (fallback method)"""
@@ -153,14 +197,51 @@ class IngredientExtractor:
         ingredients = [item.strip() for item in text.split(',') if item.strip()]
         return ingredients
 
-    def extract_text(self, image_path):
-        """Main method to extract ingredients from an image"""
+    def extract_text(self, image):
+        """Main method to extract ingredients from an image (LabelImage or file path)"""
+        # Read a path once, for both the OCR and the Gemini request
+        label = as_label_image(image)
+
         # Use OCR to extract text first
-        ocr_text = self.extract_from_image(image_path)
-        
-        # Go straight to Gemini for ingredient extraction (with the image)
-        ingredients = self.extract_ingredients_with_gemini(ocr_text, image_path)
-        
+        ocr_text = self.extract_from_image(label)
+        return self.ingredients_from_text(ocr_text, label)
+
+    def ingredients_from_text(self, ocr_text, image):
+        """
+        The part of extract_text after OCR. The pipeline calls it without the
+        engine lease, so other scans can use the OCR reader while this one
+        waits on Gemini.
+        """
+        # Most labels parse cleanly once OCR noise is corrected; Gemini (with the image) gets the rest
+        ingredients = self.ingredients_from_lexicon(ocr_text)
+        if ingredients is None:
+            ingredients = self.extract_ingredients_with_gemini(ocr_text, image)
+        return self._ensure_ingredients(ingredients, ocr_text)
+
+    def ingredients_from_lexicon(self, ocr_text):
+        """
+        Rule-based parse of the OCR text, corrected against the ingredient
+        lexicon; None if too few items map to known ingredients to trust it
+        without Gemini.
+        """
+        ingredients, confident = ingredient_lexicon.clean(self.parse_ingredients(fix_ocr_digits(ocr_text)))
+        if not confident:
+            return None
+        logger.info(f"Extracted {len(ingredients)} ingredients with the ingredient lexicon, skipping Gemini")
+        return ingredients
+
+    async def ingredients_from_text_async(self, ocr_text, image):
+        """
+        ingredients_from_text awaiting Gemini instead of blocking. Async callers
+        run extract_from_image on a thread, holding the engine lease, and call
+        this without it.
+        """
+        ingredients = self.ingredients_from_lexicon(ocr_text)
+        if ingredients is None:
+            ingredients = await self.extract_ingredients_with_gemini_async(ocr_text, image)
+        return self._ensure_ingredients(ingredients, ocr_text)
+
+    def _ensure_ingredients(self, ingredients, ocr_text):
         # If no ingredients found or parsing failed, try fallback
         if not ingredients or len(ingredients) < 1:
             logger.warning("No ingredients found with Gemini, using fallback method")
@@ -0,0 +1,371 @@
+import csv
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INGREDIENT_LEXICON = {
+    'ENABLED': True,
+    # Ingredient lists the lexicon is built from; defaults to ml_files/dataset/Ingredients.csv
+    'PATH': None,
+    # Words / ingredient names seen fewer times are treated as OCR noise in the dataset itself
+    'MIN_WORD_COUNT': 2,
+    'MIN_NAME_COUNT': 3,
+    # Most edits (insert, delete, substitute, swap) for a word to be corrected
+    'MAX_EDIT_DISTANCE': 2,
+    # fuzz.ratio a corrected item needs to be mapped to a known ingredient name
+    'MIN_SIMILARITY': 88,
+    # Skip the Gemini extraction when the parsed label has at least MIN_ITEMS
+    # items and at least MIN_RESOLVED of them map to known ingredient names
+    'SKIP_GEMINI': True,
+    'MIN_ITEMS': 2,
+    'MIN_RESOLVED': 0.8,
+}
+
+# Words in a SymSpell delete dictionary are indexed by deletes of their first PREFIX_LENGTH characters
+PREFIX_LENGTH = 7
+
+# Separators between the ingredients of a dataset row
+_ITEM_SEPARATOR = re.compile(r'[,;()\[\]{}.:*]+|\band\b')
+_NON_LETTERS = re.compile(r'[^a-z]+')
+# Words of letters and digits OCR often reads for letters
+_DIGIT_IN_WORD = re.compile(r'\b(?=[A-Za-z]*[015])[A-Za-z015]{3,}\b')
+_DIGIT_LETTERS = str.maketrans('015', 'ols')
+
+
+def ingredient_lexicon_config():
+    config = dict(DEFAULT_INGREDIENT_LEXICON)
+    config.update(getattr(settings, 'INGREDIENT_LEXICON', {}))
+    if not config['PATH']:
+        config['PATH'] = os.path.join(settings.BASE_DIR, 'ml_files', 'dataset', 'Ingredients.csv')
+    return config
+
+
+def normalize_ingredient(text):
+    """Lowercase words of an ingredient, without digits, punctuation or hyphens"""
+    return ' '.join(_NON_LETTERS.sub(' ', text.lower()).split())
+
+
+def _digits_as_letters(match):
+    word = match.group()
+    # Mostly digits is a quantity or an E number ("100g", "e150d"), not a misread word
+    if 2 * sum(character.isdigit() for character in word) > len(word):
+        return word
+    return word.translate(_DIGIT_LETTERS)
+
+
+def fix_ocr_digits(text):
+    """
+    Read 0, 1 and 5 inside words as o, l and s ("f1our" -> "flour"); tokens
+    that are mostly digits, such as "b12" or "100g", are left alone.
+    """
+    return _DIGIT_IN_WORD.sub(_digits_as_letters, text)
+
+
+def split_ingredient_list(text):
+    """Normalized ingredients of an ingredient list as written in the dataset"""
+    items = (normalize_ingredient(item) for item in _ITEM_SEPARATOR.split(text))
+    return [item for item in items if item]
+
+
+def _deletes(word, max_distance):
+    """``word`` and every string made by deleting up to ``max_distance`` of its characters"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def allowed_distance(word, max_distance):
+    """Short words are left alone or get one edit; a typo there is as likely to be another word"""
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 5:
+        return min(1, max_distance)
+    return max_distance
+
+
+class SymSpellIndex:
+    """
+    Symmetric delete spelling correction: every vocabulary word is indexed
+    under the strings made by deleting up to ``max_distance`` characters of
+    its prefix. A misspelt word within ``max_distance`` edits of a vocabulary
+    word shares one of those deletes, so the candidates of a lookup are the
+    union of a few dict entries, checked with an exact edit distance,
+    instead of the whole vocabulary.
+    """
+
+    def __init__(self, word_counts, max_distance):
+        self.counts = dict(word_counts)
+        self.max_distance = max_distance
+        self._deletes = {}
+        for word in self.counts:
+            for variant in _deletes(word[:PREFIX_LENGTH], max_distance):
+                self._deletes.setdefault(variant, []).append(word)
+
+    def __contains__(self, word):
+        return word in self.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def lookup(self, word, max_distance=None):
+        """
+        Closest vocabulary word, the most frequent one among equally close words.
+
+        Returns:
+            tuple: (word, distance), or (None, None) if nothing is within max_distance
+        """
+        if word in self.counts:
+            return word, 0
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = min(max_distance, self.max_distance)
+        if max_distance == 0:
+            return None, None
+
+        # rapidfuzz is loaded with the first correction, not when the module is imported
+        from rapidfuzz.distance import OSA
+        candidates = set()
+        for variant in _deletes(word[:PREFIX_LENGTH], max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+
+        best, best_key = None, None
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+            distance = OSA.distance(word, candidate, score_cutoff=max_distance)
+            if distance > max_distance:
+                continue
+            key = (distance, -self.counts[candidate])
+            if best_key is None or key < best_key:
+                best, best_key = candidate, key
+        return (best, best_key[0]) if best is not None else (None, None)
+
+
+class IngredientLexicon:
+    """
+    Canonical ingredient names and their vocabulary, built from the
+    ingredient lists of the scoring dataset, for cleaning up OCR'd ingredient
+    lists without a Gemini round trip.
+
+    Each item is normalized, then word by word: kept if known, merged with
+    the next word or split in two if that gives known words ("soy bean",
+    "wheatflour"), or spell-corrected with a SymSpellIndex. The corrected
+    item is then looked up among the known names; if it is not one, the
+    names sharing a word with it are scored with RapidFuzz and the best one
+    above MIN_SIMILARITY is taken.
+    """
+
+    def __init__(self, path, min_word_count, min_name_count, max_edit_distance, min_similarity):
+        started = time.perf_counter()
+        word_counts = Counter()
+        name_counts = Counter()
+        with open(path, newline='', encoding='utf-8') as dataset:
+            for row in csv.DictReader(dataset):
+                for item in split_ingredient_list(row.get('Ingredient') or ''):
+                    name_counts[item] += 1
+                    word_counts.update(item.split())
+
+        self.min_similarity = min_similarity
+        self.words = SymSpellIndex(
+            {word: count for word, count in word_counts.items() if count >= min_word_count}, max_edit_distance,
+        )
+        self.names = [name for name, count in name_counts.most_common() if count >= min_name_count]
+        self._name_set = set(self.names)
+        # Blocking index: word -> positions in self.names of the names containing it
+        self._names_by_word = {}
+        for position, name in enumerate(self.names):
+            for word in set(name.split()):
+                self._names_by_word.setdefault(word, []).append(position)
+        self.build_seconds = time.perf_counter() - started
+
+    def correct_words(self, words):
+        """Spell-corrected words of a normalized item; unknown words without a correction are kept"""
+        vocabulary = self.words
+        counts = vocabulary.counts
+        corrected = []
+        position = 0
+        while position < len(words):
+            word = words[position]
+            following = words[position + 1] if position + 1 < len(words) else None
+            merged = word + following if following is not None else None
+            # OCR splits words into fragments that are often words themselves ("sa lt"); the
+            # merged word wins if it is at least as common as the rarer fragment
+            if merged in counts and counts[merged] >= min(counts.get(word, 0), counts.get(following, 0)):
+                corrected.append(merged)
+                position += 1
+            elif word in vocabulary:
+                corrected.append(word)
+            else:
+                correction = self._split(word)
+                if correction is None:
+                    correction, _ = vocabulary.lookup(word, allowed_distance(word, vocabulary.max_distance))
+                    correction = [correction] if correction else self._split(word, max_distance=1)
+                corrected.extend(correction or [word])
+            position += 1
+        return corrected
+
+    def _split(self, word, max_distance=0):
+        """
+        Two known words that ``word`` is the run-together of, the most frequent
+        pair if several. With ``max_distance``, each half may also be a
+        misspelling of a word (of at least 4 characters), closer pairs first.
+        """
+        vocabulary = self.words
+        best, best_key = None, None
+        for cut in range(3, len(word) - 2):
+            (left, left_distance), (right, right_distance) = (
+                vocabulary.lookup(half, allowed_distance(half, max_distance)) for half in (word[:cut], word[cut:])
+            )
+            if left is None or right is None:
+                continue
+            key = (left_distance + right_distance, -min(vocabulary.counts[left], vocabulary.counts[right]))
+            if best_key is None or key < best_key:
+                best, best_key = [left, right], key
+        return best
+
+    def resolve(self, item):
+        """
+        Clean one OCR'd ingredient.
+
+        Returns:
+            tuple: (cleaned item, whether it is a known ingredient name); the
+            cleaned item is '' if nothing but punctuation or digits was left
+        """
+        words = normalize_ingredient(item).split()
+        if not words:
+            return '', False
+        corrected = ' '.join(self.correct_words(words))
+        if corrected in self._name_set:
+            return corrected, True
+
+        positions = set()
+        for word in corrected.split():
+            positions.update(self._names_by_word.get(word, ()))
+        if positions:
+            from rapidfuzz import fuzz, process
+            match = process.extractOne(
+                corrected, [self.names[position] for position in positions],
+                scorer=fuzz.ratio, score_cutoff=self.min_similarity,
+            )
+            if match is not None:
+                return match[0], True
+        return corrected, False
+
+
+class IngredientLexiconService:
+    """
+    The process-wide IngredientLexicon, built on first use (or by warm_up)
+    from the INGREDIENT_LEXICON settings, and counters of what it cleaned.
+    """
+
+    def __init__(self):
+        self._lexicon = None
+        self._lock = threading.Lock()
+        self.last_error = None
+        self._stats_lock = threading.Lock()
+        self.labels = 0
+        self.confident = 0
+        self.items = 0
+        self.resolved = 0
+        self.changed = 0
+        self.seconds = 0.0
+
+    @property
+    def config(self):
+        return ingredient_lexicon_config()
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    def get(self):
+        """The IngredientLexicon, or None if it is disabled or the dataset cannot be read"""
+        if self._lexicon is None and self.enabled:
+            with self._lock:
+                if self._lexicon is None and self.last_error is None:
+                    config = self.config
+                    try:
+                        self._lexicon = IngredientLexicon(
+                            config['PATH'], config['MIN_WORD_COUNT'], config['MIN_NAME_COUNT'],
+                            config['MAX_EDIT_DISTANCE'], config['MIN_SIMILARITY'],
+                        )
+                        logger.info(
+                            f"Built ingredient lexicon: {len(self._lexicon.names)} names, "
+                            f"{len(self._lexicon.words)} words in {self._lexicon.build_seconds * 1000:.0f} ms"
+                        )
+                    except (OSError, csv.Error, UnicodeDecodeError) as e:
+                        self.last_error = str(e)
+                        logger.error(f"Failed to build the ingredient lexicon from {config['PATH']}: {str(e)}")
+        return self._lexicon if self.enabled else None
+
+    def warm_up(self):
+        self.get()
+
+    def clean(self, ingredients):
+        """
+        Clean a rule-based parse of an ingredients label.
+
+        Args:
+            ingredients: list of ingredient strings, e.g. from parse_ingredients
+
+        Returns:
+            tuple: (cleaned ingredients list, whether it is good enough to skip
+            the Gemini extraction); (ingredients, False) if the lexicon is not available
+        """
+        lexicon = self.get()
+        if lexicon is None:
+            return ingredients, False
+
+        started = time.perf_counter()
+        cleaned, resolved, changed = [], 0, 0
+        for ingredient in ingredients:
+            item, known = lexicon.resolve(ingredient)
+            if not item:
+                continue
+            cleaned.append(item)
+            resolved += known
+            changed += item != normalize_ingredient(ingredient)
+
+        config = self.config
+        confident = (
+            config['SKIP_GEMINI']
+            and len(cleaned) >= config['MIN_ITEMS']
+            and resolved >= config['MIN_RESOLVED'] * len(cleaned)
+        )
+        with self._stats_lock:
+            self.labels += 1
+            self.confident += confident
+            self.items += len(cleaned)
+            self.resolved += resolved
+            self.changed += changed
+            self.seconds += time.perf_counter() - started
+        return cleaned, confident
+
+    def stats(self):
+        lexicon = self._lexicon
+        return {
+            'loaded': lexicon is not None,
+            'names': len(lexicon.names) if lexicon is not None else 0,
+            'words': len(lexicon.words) if lexicon is not None else 0,
+            'labels': self.labels,
+            'gemini_skipped': self.confident,
+            'skip_rate': round(self.confident / self.labels, 4) if self.labels else 0.0,
+            'items': self.items,
+            'resolved_rate': round(self.resolved / self.items, 4) if self.items else 0.0,
+            'corrected': self.changed,
+            'avg_ms': round(self.seconds / self.labels * 1000, 3) if self.labels else 0.0,
+            'last_error': self.last_error,
+        }
+
+
+ingredient_lexicon = IngredientLexiconService()
@@ -0,0 +1,275 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_FILES = {
+    'vectorizer': 'tfidf_vectorizer.pkl',
+    'ingredients': 'random_forest_model.pkl',
+    'nutrition': 'chirag_patil.pkl',
+}
+
+
+def load_pickle_file(file_path):
+    """Helper function to load pickle files with multiple methods"""
+    logger.info(f"Attempting to load file: {file_path}")
+
+    # Try joblib first; imported here so only processes that load the models pay for it
+    try:
+        import joblib
+        return joblib.load(file_path)
+    except Exception as e:
+        logger.warning(f"Joblib load failed: {str(e)}")
+
+    # Try pickle with different protocols
+    for protocol in range(5):
+        try:
+            with open(file_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Pickle load failed with protocol {protocol}: {str(e)}")
+            continue
+
+    raise ValueError(f"Failed to load file: {file_path}")
+
+
+def file_checksum(file_path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks so large forests are not held twice in memory"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelBundle:
+    """
+    Immutable snapshot of the scoring artifacts that were loaded together.
+
+    Views hold on to the bundle they got from ``ModelStore.get()`` for the
+    whole request, so a reload never mixes a new vectorizer with an old forest.
+    """
+
+    def __init__(self, vectorizer, ingredients_model, nutrition_model, version, loaded_at, artifacts,
+                 ingredients_forest=None, nutrition_forest=None):
+        self.vectorizer = vectorizer
+        self.ingredients_model = ingredients_model
+        self.nutrition_model = nutrition_model
+        self.version = version
+        self.loaded_at = loaded_at
+        self.artifacts = artifacts
+        # FlatForest copies of the models for low-latency scoring, None where not available
+        self.ingredients_forest = ingredients_forest
+        self.nutrition_forest = nutrition_forest
+
+
+class ModelStore:
+    """
+    In-memory store for the ingredients/nutrition scoring models.
+
+    Artifacts are deserialized once per process. ``get()`` stats the files at
+    most every ``check_interval`` seconds; when one changed (mtime or size)
+    its SHA-256 is compared with the loaded one and, if different, a complete
+    new bundle is loaded by that one request and swapped in with a single
+    reference assignment. Other requests keep using the current bundle while
+    it loads, and a failed reload keeps serving the previous version.
+    Replace artifacts with an atomic rename to avoid loading half-written files.
+    """
+
+    def __init__(self, base_path=None, files=None, check_interval=None):
+        self._base_path = base_path
+        self._files = files
+        self._check_interval = check_interval
+        self._bundle = None
+        self._fingerprints = {}
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+        self.last_error = None
+
+    @property
+    def base_path(self):
+        if self._base_path is None:
+            return getattr(settings, 'ML_MODELS_DIR', os.path.join(settings.BASE_DIR, 'ml_models'))
+        return self._base_path
+
+    @property
+    def files(self):
+        if self._files is None:
+            return getattr(settings, 'ML_MODEL_FILES', DEFAULT_MODEL_FILES)
+        return self._files
+
+    @property
+    def check_interval(self):
+        if self._check_interval is None:
+            return getattr(settings, 'ML_MODEL_RELOAD_INTERVAL', 30)
+        return self._check_interval
+
+    def _paths(self):
+        return {name: os.path.join(self.base_path, file_name) for name, file_name in self.files.items()}
+
+    def _stat_fingerprints(self):
+        fingerprints = {}
+        for name, path in self._paths().items():
+            stat = os.stat(path)
+            fingerprints[name] = (stat.st_mtime_ns, stat.st_size)
+        return fingerprints
+
+    def _load_bundle(self, fingerprints):
+        """Load every artifact and build a new bundle; raises if any artifact fails"""
+        started = time.perf_counter()
+        artifacts = {}
+        loaded = {}
+        for name, path in self._paths().items():
+            checksum = file_checksum(path)
+            loaded[name] = load_pickle_file(path)
+            artifacts[name] = {
+                'path': path,
+                'sha256': checksum,
+                'size': fingerprints[name][1],
+                'modified_at': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(fingerprints[name][0] / 1e9)),
+            }
+
+        forests = {}
+        if getattr(settings, 'ML_FLAT_FORESTS', True):
+            for name in ('ingredients', 'nutrition'):
+                forests[name] = self._flat_forest(name, loaded[name])
+
+        # The bundle version identifies the exact combination of artifacts
+        combined = hashlib.sha256()
+        for name in sorted(artifacts):
+            combined.update(f"{name}:{artifacts[name]['sha256']}".encode())
+        version = combined.hexdigest()[:12]
+
+        logger.info(f"Loaded ML models version {version} in {time.perf_counter() - started:.2f}s")
+        return ModelBundle(
+            vectorizer=loaded['vectorizer'],
+            ingredients_model=loaded['ingredients'],
+            nutrition_model=loaded['nutrition'],
+            version=version,
+            loaded_at=timezone.now(),
+            artifacts=artifacts,
+            ingredients_forest=forests.get('ingredients'),
+            nutrition_forest=forests.get('nutrition'),
+        )
+
+    def _flat_forest(self, name, model):
+        """A FlatForest of the model that scores like it, or None to keep using sklearn alone"""
+        # Needs scipy, which the unpickled models have already imported
+        from models.flat_forest import flatten_forest, verify_flat_forest
+        from models.scoring import NUTRITION_FEATURES
+
+        # ScoringEngine hands the flat forest rows in NUTRITION_FEATURES order, by position;
+        # sklearn would match a DataFrame's columns by name, so another order must stay with sklearn
+        feature_names = getattr(model, 'feature_names_in_', None)
+        if name == 'nutrition' and feature_names is not None and list(feature_names) != NUTRITION_FEATURES:
+            logger.error("The nutrition model's features are not in NUTRITION_FEATURES order; not flattening it")
+            return None
+
+        try:
+            forest = flatten_forest(model)
+            if forest is None:
+                return None
+            difference = verify_flat_forest(model, forest)
+        except Exception as e:
+            logger.error(f"Failed to flatten the {name} model: {str(e)}")
+            return None
+        if difference:
+            logger.error(f"Flattened {name} model differs from predict by up to {difference}; not using it")
+            return None
+        logger.info(f"Flattened {name} model: {forest.n_trees} trees, {len(forest)} nodes")
+        return forest
+
+    def _changed_on_disk(self, fingerprints):
+        """True if any artifact's content differs from the loaded bundle"""
+        for name, fingerprint in fingerprints.items():
+            if self._fingerprints.get(name) == fingerprint:
+                continue
+            # mtime/size moved; only a different checksum counts as a new version
+            if file_checksum(self._paths()[name]) != self._bundle.artifacts[name]['sha256']:
+                return True
+            self._fingerprints[name] = fingerprint
+        return False
+
+    def reload(self, force=False, blocking=True):
+        """
+        Check the artifacts on disk and swap in a new bundle if they changed.
+
+        Args:
+            force: Reload even if the files look unchanged
+            blocking: Wait for a reload already running in another thread;
+                      if False, return immediately instead
+
+        Returns:
+            bool: True if a new bundle was loaded
+        """
+        if not self._reload_lock.acquire(blocking=blocking):
+            return False
+        try:
+            self._last_check = time.monotonic()
+            try:
+                fingerprints = self._stat_fingerprints()
+                if self._bundle is not None and not force and not self._changed_on_disk(fingerprints):
+                    return False
+                bundle = self._load_bundle(fingerprints)
+            except Exception as e:
+                self.last_error = str(e)
+                if self._bundle is None:
+                    raise
+                logger.error(f"Model reload failed, keeping version {self._bundle.version}: {str(e)}")
+                return False
+
+            self._fingerprints = fingerprints
+            self._bundle = bundle
+            self.reloads += 1
+            self.last_error = None
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def get(self):
+        """Return the current ModelBundle, loading or refreshing it if needed"""
+        bundle = self._bundle
+        if bundle is None:
+            self.reload()
+            return self._bundle
+
+        if time.monotonic() - self._last_check >= self.check_interval:
+            # Only one request does the check; the others keep serving the current bundle
+            self.reload(blocking=False)
+            return self._bundle
+        return bundle
+
+    def warm_up(self):
+        try:
+            self.get()
+        except Exception as e:
+            logger.error(f"Failed to load ML models at startup: {str(e)}")
+
+    def info(self):
+        bundle = self._bundle
+        if bundle is None:
+            return {'loaded': False, 'base_path': self.base_path, 'last_error': self.last_error}
+        return {
+            'loaded': True,
+            'version': bundle.version,
+            'loaded_at': bundle.loaded_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'base_path': self.base_path,
+            'artifacts': bundle.artifacts,
+            'flat_forests': {
+                name: {'nodes': len(forest), 'mib': round(forest.nbytes() / 1048576, 1)} if forest else None
+                for name, forest in (('ingredients', bundle.ingredients_forest), ('nutrition', bundle.nutrition_forest))
+            },
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+        }
+
+
+model_store = ModelStore()
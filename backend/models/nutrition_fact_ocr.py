@@ -1,15 +1,19 @@
 import cv2
 import re
-import spacy
 import logging
 import os
 import numpy as np  # Add this import
-from paddleocr import PaddleOCR
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 from Authentication.models import NutritionResult
-import google.generativeai as genai
 from django.conf import settings
-import base64
+import json
+import time
+from models.gemini_cache import gemini_cache, make_cache_key
+from models.gemini_client import GeminiUnavailable, gemini_client
+from models.image_utils import LabelImage, as_label_image, normalization_stats, normalize_resolution
+from models.preprocessing import get_pipeline
+from models.nutrition_text import NUTRITION_PATTERNS, nutrition_text_extractor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -18,21 +22,18 @@ logger = logging.getLogger(__name__)
 class FoodLabelOCR:
     """Service for OCR processing of food labels""" 
     
-    NUTRITION_PATTERNS = {
-        # Updated calories pattern with more variations and flexibility
-        'calories': r'(?:calories|energy|cal\.?|calorie content|kcal|nutritional value)[\s:]*(\d+[\.,]?\d*)\s*(?:kcal|cal|kj|calories|$)',
-        'protein': r'(?:protein|proteins|prot\.?|proteines?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
-        'fats': r'(?:total fat|fats?|lipids|fat content|total lipids?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
-        'carbohydrates': r'(?:carbohydrates?|carbs?|total carbs?|glucides|total carbohydrates?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
-        'sugar': r'(?:sugars?|total sugars?|of which sugars?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
-        'sodium': r'(?:sodium|salt|na|salt content)[\s:]*(\d+[\.,]?\d*)\s*(?:mg|g|milligrams?|grams?|$)',
-        'saturated_fat_100g': r'(?:saturated fat|saturates|sat\.?\s*fat|saturated)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
-        'trans_fat_100g': r'(?:trans\s*fat|trans-fat|trans\s*fatty acids?)[\s:]*(\d+[\.,]?\d*)\s*(?:g|grams?|gr|$)',
-        'cholesterol_100g': r'(?:cholesterol|chol\.?)[\s:]*(\d+[\.,]?\d*)\s*(?:mg|milligrams?|g|$)',
-    }
+    # Bump when the extraction prompt changes so cached Gemini answers are not reused
+    GEMINI_PROMPT_VERSION = 'nutrition-v1'
+    
+    # Patterns live in models/nutrition_text.py, compiled once into a single-scan extractor
+    NUTRITION_PATTERNS = NUTRITION_PATTERNS
     
     def __init__(self, use_gpu=False):
         """Initialize the OCR service"""
+        # Only a real engine loads PaddleOCR and spaCy; StubFoodLabelOCR skips this constructor
+        from paddleocr import PaddleOCR
+        import spacy
+
         try:
             self.ocr = PaddleOCR(use_angle_cls=True, lang="en", use_gpu=use_gpu)
             logger.info("PaddleOCR initialized successfully")
@@ -47,119 +48,131 @@ class FoodLabelOCR:
             logger.error(f"SpaCy model not found: {str(e)}")
             logger.error("Please install using: python -m spacy download en_core_web_sm")
             raise
-        
-        # Initialize Gemini AI
-        try:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.gemini_model = genai.GenerativeModel('gemini-2.0-flash')
-            logger.info("Gemini AI initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini AI: {str(e)}")
-            self.gemini_model = None
     
-    def preprocess_image(self, image):
-        """Enhanced image preprocessing pipeline"""
-        # Initial grayscale conversion
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Noise reduction
-        denoised = cv2.fastNlMeansDenoising(gray)
+    def preprocess_image(self, image, profile=None):
+        """
+        Run the preprocessing pipeline of a profile (see models/preprocessing.py)
         
-        # Contrast enhancement
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(denoised)
+        Args:
+            image: BGR image array
+            profile: "quality" (the full chain), "fast" or a custom profile;
+                     defaults to settings.PREPROCESSING_PROFILE
+        """
+        processed, timings = get_pipeline(profile).run(image)
+        logger.debug(f"Preprocessing stage timings (ms): {timings}")
+        return processed
+    
+    def _ocr_lines(self, image, y_offset=0, profile=None):
+        """
+        Run detection + recognition once on an image.
         
-        # Thresholding with multiple methods
-        _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        adaptive = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                      cv2.THRESH_BINARY, 11, 2)
+        PaddleOCR detects text boxes and then recognizes only those regions.
         
-        # Combine thresholding results
-        combined = cv2.bitwise_and(binary, adaptive)
+        Returns:
+            list: (box, text, confidence) tuples, boxes in full-image coordinates
+        """
+        processed = self.preprocess_image(image, profile)
+        result = self.ocr.ocr(processed)
+        lines = []
+        if result and result[0]:
+            for line in result[0]:
+                if not line:
+                    continue
+                box = [(float(x), float(y) + y_offset) for x, y in line[0]]
+                lines.append((box, line[1][0], float(line[1][1])))
+        return lines
+    
+    @staticmethod
+    def _box_iou(box_a, box_b):
+        """Intersection over union of the axis-aligned bounds of two quadrilaterals"""
+        ax0, ay0 = min(x for x, _ in box_a), min(y for _, y in box_a)
+        ax1, ay1 = max(x for x, _ in box_a), max(y for _, y in box_a)
+        bx0, by0 = min(x for x, _ in box_b), min(y for _, y in box_b)
+        bx1, by1 = max(x for x, _ in box_b), max(y for _, y in box_b)
         
-        # Text enhancement
-        kernel = np.ones((2,2), np.uint8)
-        dilated = cv2.dilate(combined, kernel, iterations=1)
-        cleaned = cv2.erode(dilated, kernel, iterations=1)
+        inter_w = min(ax1, bx1) - max(ax0, bx0)
+        inter_h = min(ay1, by1) - max(ay0, by0)
+        if inter_w <= 0 or inter_h <= 0:
+            return 0.0
+        intersection = inter_w * inter_h
+        union = (ax1 - ax0) * (ay1 - ay0) + (bx1 - bx0) * (by1 - by0) - intersection
+        return intersection / union if union > 0 else 0.0
+    
+    @classmethod
+    def deduplicate_lines(cls, lines, iou_threshold=0.5, same_box_threshold=0.8):
+        """
+        Drop OCR lines that repeat an earlier line at the same place on the label.
         
-        return cleaned
+        A line is a duplicate if its box overlaps a kept box by at least
+        ``iou_threshold`` and reads the same (ignoring case and spaces), or if
+        the boxes overlap by ``same_box_threshold`` whatever the text.
+        The first occurrence is kept, so reading order is preserved.
+        """
+        kept = []
+        for box, text, confidence in lines:
+            normalized = re.sub(r'\s+', '', text.lower())
+            duplicate = False
+            for kept_box, kept_text, _ in kept:
+                iou = cls._box_iou(box, kept_box)
+                if iou >= same_box_threshold or (
+                    iou >= iou_threshold and normalized == re.sub(r'\s+', '', kept_text.lower())
+                ):
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append((box, text, confidence))
+        return kept
     
-    def extract_nutrition_info(self, text):
-        """Extract nutritional information with improved text preprocessing"""
-        nutrition_data = {}
+    def ocr_text(self, image, mode=None, profile=None):
+        """
+        OCR a nutrition label image.
         
-        # Text preprocessing
-        text = text.lower()
-        text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
-        text = text.replace('\n', ' ').replace('\r', ' ')
-        text = text.replace(',', '.')  # Handle European decimals
-        text = re.sub(r'[^\w\s.:]', ' ', text)  # Remove special chars except dots and colons
-        text = re.sub(r'\(.*?\)', '', text)  # Remove parenthetical content
+        Args:
+            image: BGR image array
+            mode: "two_pass" reads the full image and re-reads the bottom half;
+                  "single" runs detection and recognition once on the full image.
+                  Defaults to settings.NUTRITION_OCR_MODE.
+            profile: Preprocessing profile, see preprocess_image
+                  
+        Returns:
+            tuple: (text, lines) with lines deduplicated by box geometry
+        """
+        mode = mode or getattr(settings, 'NUTRITION_OCR_MODE', 'two_pass')
+        lines = self._ocr_lines(image, profile=profile)
         
-        # Debug logging for calories detection
-        calories_matches = list(re.finditer(self.NUTRITION_PATTERNS['calories'], text))
-        if calories_matches:
-            logger.info(f"Found {len(calories_matches)} potential calories matches")
-            for idx, match in enumerate(calories_matches):
-                logger.info(f"Calories match {idx+1}: {match.group(0)} -> value: {match.group(1)}")
-        else:
-            logger.warning(f"No calories detected in text. Sample text: {text[:200]}...")
-            
-            # Try a fallback pattern for calories
-            fallback_pattern = r'(\d+)\s*(?:kcal|calories|cal)'
-            fallback_match = re.search(fallback_pattern, text)
-            if fallback_match:
-                logger.info(f"Found calories using fallback pattern: {fallback_match.group(0)}")
-                try:
-                    nutrition_data['calories'] = float(fallback_match.group(1))
-                except (ValueError, IndexError):
-                    pass
+        if mode == 'two_pass':
+            # Re-read the bottom half (nutrition facts often at bottom), mapped back to full-image coordinates
+            height = image.shape[0]
+            lines += self._ocr_lines(image[height//2:, :], y_offset=height//2, profile=profile)
         
-        # Process each nutrient
-        for nutrient, pattern in self.NUTRITION_PATTERNS.items():
-            matches = list(re.finditer(pattern, text))
-            
-            if matches:
-                values = []
-                for match in matches:
-                    try:
-                        value = float(match.group(1).replace(',', '.'))
-                        if 0 <= value <= 1000:  # Sanity check for realistic values
-                            values.append(value)
-                    except (ValueError, IndexError):
-                        continue
-                
-                if values:
-                    # Use median for multiple matches to avoid outliers
-                    nutrition_data[nutrient] = round(sorted(values)[len(values)//2], 2)
+        lines = self.deduplicate_lines(lines)
+        return " ".join(text for _, text, _ in lines), lines
+    
+    def extract_nutrition_info(self, text):
+        """
+        Extract nutritional information from OCR text with the regex patterns
         
-        return nutrition_data
+        Normalizes the text and finds every nutrient in a single scan, see
+        NutritionTextExtractor. This is also the fallback whenever Gemini fails.
+        """
+        return nutrition_text_extractor.extract(text)
     
-    def extract_nutrition_with_gemini(self, extracted_text, image_path=None):
-        """Use Gemini AI to directly extract nutrition information from text and image"""
-        if not self.gemini_model:
-            logger.warning("Gemini AI not available for extraction")
-            return self.extract_nutrition_info(extracted_text)  # Fallback to regex
-            
-        try:
-            # Prepare the image if available
-            image_parts = []
-            if image_path and os.path.isfile(image_path):
-                try:
-                    with open(image_path, "rb") as img_file:
-                        image_data = img_file.read()
-                        encoded_image = base64.b64encode(image_data).decode('utf-8')
-                        image_parts = [
-                            {
-                                "mime_type": "image/jpeg",
-                                "data": encoded_image
-                            }
-                        ]
-                        logger.info("Successfully encoded image for Gemini")
-                except Exception as img_error:
-                    logger.error(f"Error encoding image: {str(img_error)}")
-            
-            prompt = f"""
+    def _gemini_request(self, extracted_text, image=None):
+        """
+        Build the nutrition extraction request.
+
+        Args:
+            extracted_text: OCR text of the label
+            image: LabelImage or file path sent along with the text, if any
+
+        Returns:
+            tuple: (contents for generate_content, cache key)
+        """
+        # The image part carries the upload's own bytes
+        label = as_label_image(image)
+        image_parts = [label.gemini_part()] if label else []
+        
+        prompt = f"""
             You are a nutrition fact expert. I have scanned a food product and extracted the following text. 
             Please extract ONLY the nutrition facts data from this text:
 
@@ -190,73 +203,119 @@ class FoodLabelOCR:
               "cholesterol": 0
             }}
             """
-            
-            # Get response from Gemini with or without image
-            if image_parts:
-                response = self.gemini_model.generate_content(
-                    [prompt] + image_parts
-                )
-            else:
-                response = self.gemini_model.generate_content(prompt)
+        
+        # Identical image bytes and OCR text get the cached answer
+        cache_key = make_cache_key(self.GEMINI_PROMPT_VERSION, label.data if label else None, extracted_text)
+        contents = [prompt] + image_parts if image_parts else prompt
+        return contents, cache_key
+
+    def _nutrition_from_response(self, gemini_text, extracted_text, cache_key, from_cache):
+        """Parse Gemini's answer, caching it if usable; regex extraction otherwise"""
+        # Find JSON pattern in the response
+        json_match = re.search(r'\{.*\}', gemini_text, re.DOTALL)
+        if json_match:
+            try:
+                nutrition_data = json.loads(json_match.group(0))
+                
+                # Convert keys to match our expected format
+                result = {}
+                key_mapping = {
+                    'calories': 'calories',
+                    'protein': 'protein',
+                    'fats': 'fats', 
+                    'total_fat': 'fats',
+                    'carbohydrates': 'carbohydrates',
+                    'carbs': 'carbohydrates',
+                    'sugar': 'sugar',
+                    'sugars': 'sugar',
+                    'sodium': 'sodium',
+                    'saturated_fat': 'saturated_fat_100g',
+                    'trans_fat': 'trans_fat_100g',
+                    'cholesterol': 'cholesterol_100g'
+                }
+                
+                # Map the returned keys to our expected keys
+                for key, value in nutrition_data.items():
+                    normalized_key = key.lower().replace(' ', '_')
+                    if normalized_key in key_mapping:
+                        result[key_mapping[normalized_key]] = float(value)
                 
-            gemini_text = response.text.strip()
+                # Ensure we have values for all our expected fields
+                for target_key in ['calories', 'protein', 'fats', 'carbohydrates', 'sugar', 
+                                  'sodium', 'saturated_fat_100g', 'trans_fat_100g', 'cholesterol_100g']:
+                    if target_key not in result:
+                        result[target_key] = 0.0
+                
+                logger.info(f"Successfully extracted nutrition data with Gemini: {len(result)} fields")
+                if not from_cache:
+                    gemini_cache.set(cache_key, gemini_text)
+                return result
+                
+            except (json.JSONDecodeError, ValueError) as e:
+                logger.warning(f"Could not parse Gemini nutrition response: {str(e)}")
+        else:
+            logger.warning(f"No JSON found in Gemini nutrition response")
+        
+        # Fall back to regex extraction if Gemini fails
+        return self.extract_nutrition_info(extracted_text)
+
+    def extract_nutrition_with_gemini(self, extracted_text, image=None):
+        """Use Gemini AI to directly extract nutrition information from text and image"""
+        if not gemini_client.available:
+            logger.warning("Gemini AI not available for extraction")
+            return self.extract_nutrition_info(extracted_text)  # Fallback to regex
             
-            # Extract JSON from response
-            import json
+        try:
+            contents, cache_key = self._gemini_request(extracted_text, image)
+            gemini_text = gemini_cache.get(cache_key)
+            from_cache = gemini_text is not None
             
-            # Find JSON pattern in the response
-            json_match = re.search(r'\{.*\}', gemini_text, re.DOTALL)
-            if json_match:
-                try:
-                    nutrition_data = json.loads(json_match.group(0))
-                    
-                    # Convert keys to match our expected format
-                    result = {}
-                    key_mapping = {
-                        'calories': 'calories',
-                        'protein': 'protein',
-                        'fats': 'fats', 
-                        'total_fat': 'fats',
-                        'carbohydrates': 'carbohydrates',
-                        'carbs': 'carbohydrates',
-                        'sugar': 'sugar',
-                        'sugars': 'sugar',
-                        'sodium': 'sodium',
-                        'saturated_fat': 'saturated_fat_100g',
-                        'trans_fat': 'trans_fat_100g',
-                        'cholesterol': 'cholesterol_100g'
-                    }
-                    
-                    # Map the returned keys to our expected keys
-                    for key, value in nutrition_data.items():
-                        normalized_key = key.lower().replace(' ', '_')
-                        if normalized_key in key_mapping:
-                            result[key_mapping[normalized_key]] = float(value)
-                    
-                    # Ensure we have values for all our expected fields
-                    for target_key in ['calories', 'protein', 'fats', 'carbohydrates', 'sugar', 
-                                      'sodium', 'saturated_fat_100g', 'trans_fat_100g', 'cholesterol_100g']:
-                        if target_key not in result:
-                            result[target_key] = 0.0
-                    
-                    logger.info(f"Successfully extracted nutrition data with Gemini: {len(result)} fields")
-                    return result
-                    
-                except (json.JSONDecodeError, ValueError) as e:
-                    logger.warning(f"Could not parse Gemini nutrition response: {str(e)}")
+            if from_cache:
+                logger.info("Using cached Gemini nutrition response")
             else:
-                logger.warning(f"No JSON found in Gemini nutrition response")
+                # Get response from Gemini with or without image
+                gemini_text = gemini_client.generate(contents)
             
-            # Fall back to regex extraction if Gemini fails
+            return self._nutrition_from_response(gemini_text, extracted_text, cache_key, from_cache)
+        
+        except GeminiUnavailable as e:
+            logger.warning(f"Skipping Gemini nutrition extraction: {str(e)}")
+            return self.extract_nutrition_info(extracted_text)
+        except Exception as e:
+            logger.error(f"Error extracting nutrition with Gemini: {str(e)}")
             return self.extract_nutrition_info(extracted_text)
+    
+    async def extract_nutrition_with_gemini_async(self, extracted_text, image=None):
+        """extract_nutrition_with_gemini on the async Gemini client, for async views"""
+        if not gemini_client.available:
+            logger.warning("Gemini AI not available for extraction")
+            return self.extract_nutrition_info(extracted_text)
+            
+        try:
+            contents, cache_key = self._gemini_request(extracted_text, image)
+            # The cache is SQLite: its reads and writes run off the event loop
+            gemini_text = await sync_to_async(gemini_cache.get, thread_sensitive=False)(cache_key)
+            from_cache = gemini_text is not None
+            
+            if from_cache:
+                logger.info("Using cached Gemini nutrition response")
+            else:
+                gemini_text = await gemini_client.generate_async(contents)
             
+            return await sync_to_async(self._nutrition_from_response, thread_sensitive=False)(
+                gemini_text, extracted_text, cache_key, from_cache
+            )
+        
+        except GeminiUnavailable as e:
+            logger.warning(f"Skipping Gemini nutrition extraction: {str(e)}")
+            return self.extract_nutrition_info(extracted_text)
         except Exception as e:
             logger.error(f"Error extracting nutrition with Gemini: {str(e)}")
             return self.extract_nutrition_info(extracted_text)
     
-    def validate_with_gemini(self, extracted_text, nutrition_info, image_path=None):
+    def validate_with_gemini(self, extracted_text, nutrition_info, image=None):
         """Use Gemini AI to validate and fix nutrition information, optionally with image"""
-        if not self.gemini_model:
+        if not gemini_client.available:
             logger.warning("Gemini AI not available for validation")
             return nutrition_info
             
@@ -267,28 +326,15 @@ class FoodLabelOCR:
                 if field not in nutrition_info or nutrition_info[field] == 0:
                     missing_fields.append(field)
             
-            if not missing_fields and not image_path:
+            if not missing_fields and not image:
                 logger.info("No missing fields to validate with Gemini")
                 return nutrition_info
 
             logger.info(f"Validating with Gemini: {missing_fields}")
             
             # Prepare the image if available
-            image_parts = []
-            if image_path and os.path.isfile(image_path):
-                try:
-                    with open(image_path, "rb") as img_file:
-                        image_data = img_file.read()
-                        encoded_image = base64.b64encode(image_data).decode('utf-8')
-                        image_parts = [
-                            {
-                                "mime_type": "image/jpeg",
-                                "data": encoded_image
-                            }
-                        ]
-                        logger.info("Successfully encoded image for Gemini")
-                except Exception as img_error:
-                    logger.error(f"Error encoding image: {str(img_error)}")
+            label = as_label_image(image)
+            image_parts = [label.gemini_part()] if label else []
             
             prompt = f"""
             I have a food nutrition label with the following extracted text:
@@ -306,14 +352,7 @@ class FoodLabelOCR:
             """
             
             # Get response from Gemini with or without image
-            if image_parts:
-                response = self.gemini_model.generate_content(
-                    [prompt] + image_parts
-                )
-            else:
-                response = self.gemini_model.generate_content(prompt)
-                
-            gemini_text = response.text.strip()
+            gemini_text = gemini_client.generate([prompt] + image_parts if image_parts else prompt)
             
             # Extract JSON from response
             import re
@@ -338,56 +377,61 @@ class FoodLabelOCR:
                 logger.warning(f"No JSON found in Gemini response: {gemini_text}")
             
             return nutrition_info
-            
+        
+        except GeminiUnavailable as e:
+            logger.warning(f"Skipping Gemini validation: {str(e)}")
+            return nutrition_info
         except Exception as e:
             logger.error(f"Error validating with Gemini: {str(e)}")
             return nutrition_info
     
-    def process_image(self, image_path, save_to_db=True):
+    def read_label(self, image, profile=None):
+        """
+        OCR text of a label image (LabelImage or file path): the CPU-bound half of process_image.
+
+        Returns:
+            str or None if the image cannot be read
+        """
+        label = as_label_image(image)
+        decoded = label.decode() if label else None
+        if decoded is None:
+            logger.error(f"Failed to read image from {label.name if label else image}")
+            return None
+        image = decoded
+            
+        # Downsample oversized photos before denoising/thresholding
+        image, normalization = normalize_resolution(image)
+        
+        # OCR the label (single pass unless configured otherwise), dropping duplicate lines
+        started = time.perf_counter()
+        text, _ = self.ocr_text(image, profile=profile)
+        normalization_stats.record('nutrition', normalization, (time.perf_counter() - started) * 1000)
+        return text
+    
+    def process_image(self, image, save_to_db=True, profile=None):
         """
         Process an image and extract nutritional information
         
         Args:
-            image_path: Path to the image file
+            image: LabelImage or path to the image file; a file is read once
             save_to_db: Whether to save results to database
+            profile: Preprocessing profile, see preprocess_image
             
         Returns:
             tuple: (nutrition_result_object or dict, extracted_text)
         """
         try:
-            image = cv2.imread(image_path)
-            if image is None:
-                logger.error(f"Failed to read image from {image_path}")
+            label = as_label_image(image)
+            text = self.read_label(label, profile)
+            if text is None:
                 return None, "Failed to read image"
-                
-            # Get image dimensions
-            height, width = image.shape[:2]
-            
-            # Process full image and potentially cropped sections
-            results = []
-            
-            # Process full image
-            processed_full = self.preprocess_image(image)
-            full_result = self.ocr.ocr(processed_full)
-            if full_result:
-                results.extend([line[1][0] for line in full_result[0] if line])
-            
-            # Process bottom half (nutrition facts often at bottom)
-            bottom_half = image[height//2:, :]
-            processed_bottom = self.preprocess_image(bottom_half)
-            bottom_result = self.ocr.ocr(processed_bottom)
-            if bottom_result:
-                results.extend([line[1][0] for line in bottom_result[0] if line])
-            
-            # Combine and clean text
-            text = " ".join(results)
             
             # Try direct Gemini extraction first (with image)
-            nutrition_info = self.extract_nutrition_with_gemini(text, image_path)
+            nutrition_info = self.extract_nutrition_with_gemini(text, label)
             
             # Save to database if requested
             if save_to_db and nutrition_info:
-                return self.save_to_database(image_path, text, nutrition_info), text
+                return self.save_to_database(label, text, nutrition_info), text
             
             return nutrition_info, text
                 
@@ -396,13 +440,23 @@ class FoodLabelOCR:
             logger.error(error_msg)
             return None, error_msg
     
-    def save_to_database(self, image_path, text, nutrition_info):
-        """Save extracted nutrition information to database"""
+    def save_to_database(self, image, text, nutrition_info):
+        """
+        Save extracted nutrition information to database
+
+        Args:
+            image: LabelImage (its path is only set if it was written to disk) or file path
+        """
         try:
+            if isinstance(image, LabelImage):
+                image_path, image_name = image.path, image.name
+            else:
+                image_path, image_name = image, os.path.basename(image)
+
             # Create a new NutritionResult object
             result = NutritionResult(
                 image_path=image_path,
-                image_name=os.path.basename(image_path),
+                image_name=image_name,
                 processed_at=timezone.now()
             )
             
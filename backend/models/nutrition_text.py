@@ -0,0 +1,150 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Nutrient -> (keyword alternatives, unit alternatives). Every nutrient pattern is
+# "keyword, optional spaces/colons, number, optional spaces, unit or end of text".
+NUTRIENT_SPECS = {
+    # Updated calories pattern with more variations and flexibility
+    'calories': (r'calories|energy|cal\.?|calorie content|kcal|nutritional value', r'kcal|cal|kj|calories|$'),
+    'protein': (r'protein|proteins|prot\.?|proteines?', r'g|grams?|gr|$'),
+    'fats': (r'total fat|fats?|lipids|fat content|total lipids?', r'g|grams?|gr|$'),
+    'carbohydrates': (r'carbohydrates?|carbs?|total carbs?|glucides|total carbohydrates?', r'g|grams?|gr|$'),
+    'sugar': (r'sugars?|total sugars?|of which sugars?', r'g|grams?|gr|$'),
+    'sodium': (r'sodium|salt|na|salt content', r'mg|g|milligrams?|grams?|$'),
+    'saturated_fat_100g': (r'saturated fat|saturates|sat\.?\s*fat|saturated', r'g|grams?|gr|$'),
+    'trans_fat_100g': (r'trans\s*fat|trans-fat|trans\s*fatty acids?', r'g|grams?|gr|$'),
+    'cholesterol_100g': (r'cholesterol|chol\.?', r'mg|milligrams?|g|$'),
+}
+
+VALUE_PATTERN = r'[\s:]*(\d+[\.,]?\d*)\s*'
+
+NUTRITION_PATTERNS = {
+    nutrient: f'(?:{keywords}){VALUE_PATTERN}(?:{units})'
+    for nutrient, (keywords, units) in NUTRIENT_SPECS.items()
+}
+
+# Used for calories only when the calories pattern finds nothing
+CALORIES_FALLBACK_PATTERN = r'(\d+)\s*(?:kcal|calories|cal)'
+
+
+class NutritionTextExtractor:
+    """
+    Regex extraction of nutrition values from OCR text, compiled once.
+
+    Returns exactly what running ``re.finditer`` with every NUTRITION_PATTERNS
+    entry over the normalized text and taking the median of the in-range
+    values returns, but reads the text once:
+
+    * normalization is ``lower()`` plus a single regex substitution; the old
+      whitespace, special character and parenthesis passes collapse into one
+      (parentheses were already blanked out before they were stripped);
+    * one combined pattern finds, in a single finditer pass, every position
+      where some nutrient keyword is followed by a number. Only there, and
+      only for the nutrients with a keyword starting with the character
+      found, is the nutrient's own pattern tried. A per-nutrient cursor skips
+      positions inside that nutrient's previous match, reproducing
+      finditer's non-overlapping matches.
+
+    The combined pattern branches on the keywords' first character so the
+    regex engine can still skip ahead on it; a plain union of the nine nested
+    patterns loses that and scans slower than the nine patterns separately.
+    """
+
+    # Whitespace runs become one space and every other non-word character except
+    # . and : a space; single spaces are left alone since replacing them is a no-op
+    NORMALIZE_RE = re.compile(r'\s\s+|[^\w .:]')
+
+    def __init__(self, specs=None, fallback_pattern=CALORIES_FALLBACK_PATTERN):
+        specs = specs or NUTRIENT_SPECS
+        self.compiled = []
+        self.by_first_char = {}
+        keyword_tails = {}
+        for nutrient, (keywords, units) in specs.items():
+            pattern = re.compile(f'(?:{keywords}){VALUE_PATTERN}(?:{units})')
+            self.compiled.append((nutrient, pattern))
+            for keyword in keywords.split('|'):
+                first_char = keyword[0]
+                keyword_tails.setdefault(first_char, []).append(keyword[1:])
+                dispatch = self.by_first_char.setdefault(first_char, [])
+                if (nutrient, pattern) not in dispatch:
+                    dispatch.append((nutrient, pattern))
+
+        # One branch per first character, e.g. "s(?=(?:ugars?|odium|...)[\s:]*\d)". Each
+        # candidate consumes a single character, so finditer still reports
+        # candidates that overlap (e.g. "saturated fat 3g" and "fat 3g").
+        self.candidates = re.compile('|'.join(
+            f"{re.escape(first_char)}(?=(?:{'|'.join(tails)})[\\s:]*\\d)"
+            for first_char, tails in keyword_tails.items()
+        ))
+        self.fallback = re.compile(fallback_pattern)
+
+    def normalize(self, text):
+        """Lowercase, collapse whitespace, ',' -> '.', and blank out special characters"""
+        return self.NORMALIZE_RE.sub(' ', text.lower().replace(',', '.'))
+
+    def find_matches(self, text):
+        """
+        Scan normalized text once.
+
+        Returns:
+            dict: nutrient -> list of match objects, as finditer would return them
+        """
+        matches = {nutrient: [] for nutrient, _ in self.compiled}
+        next_allowed = dict.fromkeys(matches, 0)
+        by_first_char = self.by_first_char
+        for candidate in self.candidates.finditer(text):
+            start = candidate.start()
+            for nutrient, pattern in by_first_char[candidate.group()]:
+                if start < next_allowed[nutrient]:
+                    continue
+                match = pattern.match(text, start)
+                if match is not None:
+                    matches[nutrient].append(match)
+                    next_allowed[nutrient] = match.end()
+        return matches
+
+    def extract(self, text):
+        """
+        Extract nutrition values from raw OCR text.
+
+        Returns:
+            dict: nutrient -> median of the plausible (0-1000) values found
+        """
+        nutrition_data = {}
+        text = self.normalize(text)
+        matches = self.find_matches(text)
+
+        calories_matches = matches.get('calories')
+        if calories_matches:
+            logger.info(f"Found {len(calories_matches)} potential calories matches")
+            for idx, match in enumerate(calories_matches):
+                logger.debug(f"Calories match {idx+1}: {match.group(0)} -> value: {match.group(1)}")
+        else:
+            logger.warning(f"No calories detected in text. Sample text: {text[:200]}...")
+            fallback_match = self.fallback.search(text)
+            if fallback_match:
+                logger.info(f"Found calories using fallback pattern: {fallback_match.group(0)}")
+                try:
+                    nutrition_data['calories'] = float(fallback_match.group(1))
+                except (ValueError, IndexError):
+                    pass
+
+        for nutrient, nutrient_matches in matches.items():
+            values = []
+            for match in nutrient_matches:
+                try:
+                    value = float(match.group(1))
+                except (ValueError, IndexError):
+                    continue
+                if 0 <= value <= 1000:  # Sanity check for realistic values
+                    values.append(value)
+            if values:
+                # Median of multiple matches to avoid outliers
+                nutrition_data[nutrient] = round(sorted(values)[len(values)//2], 2)
+
+        return nutrition_data
+
+
+nutrition_text_extractor = NutritionTextExtractor()
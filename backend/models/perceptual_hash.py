@@ -0,0 +1,173 @@
+import threading
+
+import cv2
+import numpy as np
+
+HASH_BITS = 64
+HASH_METHODS = ('phash', 'dhash')
+
+# Pending (unsorted) entries are merged into the sorted blocks once there are
+# more than this many, or more than 1/PENDING_FRACTION of the merged entries
+MIN_PENDING = 4096
+PENDING_FRACTION = 8
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(values):
+        return np.bitwise_count(values)
+else:
+    _BYTE_BITS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _BYTE_BITS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+def _grayscale(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def phash(image):
+    """
+    64-bit DCT hash: the sign of the 8x8 lowest frequencies of a 32x32
+    grayscale thumbnail against their median. Robust to rescaling, JPEG
+    recompression and small brightness or contrast changes.
+    """
+    small = cv2.resize(_grayscale(image), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # The DC term is the mean brightness, left out of the median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def dhash(image):
+    """64-bit gradient hash: whether each pixel of a 9x8 thumbnail is brighter than its right neighbour"""
+    small = cv2.resize(_grayscale(image), (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def image_hash(image, method='phash'):
+    """
+    Perceptual hash of a BGR or grayscale image array.
+
+    Raises:
+        ValueError: for an unknown method
+    """
+    if method == 'phash':
+        return phash(image)
+    if method == 'dhash':
+        return dhash(image)
+    raise ValueError(f"Unknown perceptual hash method '{method}', expected one of {', '.join(HASH_METHODS)}")
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit hashes: each hash is cut into
+    ``max_distance + 1`` blocks, and by the pigeonhole principle any hash
+    within ``max_distance`` bits of a query matches it exactly on at least one
+    block. Each block is kept as a sorted column, so a lookup is a binary
+    search per block followed by a vectorized distance check of the
+    candidates, instead of a scan over every stored hash.
+
+    New entries go to a small pending list that is searched by brute force
+    and merged into the sorted columns in batches. Safe to share between threads.
+    """
+
+    def __init__(self, max_distance):
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError(f"max_distance must be between 0 and {HASH_BITS - 1}")
+        self.max_distance = max_distance
+
+        blocks = max_distance + 1
+        self._blocks = []
+        shift = HASH_BITS
+        for block in range(blocks):
+            width = HASH_BITS // blocks + (1 if block < HASH_BITS % blocks else 0)
+            shift -= width
+            self._blocks.append((np.uint64(shift), np.uint64((1 << width) - 1)))
+
+        self._lock = threading.Lock()
+        self._keys = np.empty(0, dtype=np.int64)
+        self._values = np.empty(0, dtype=np.uint64)
+        self._columns = [(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)) for _ in self._blocks]
+        # Pending entries live in the first _pending_count slots of growable buffers
+        self._pending_keys = np.empty(MIN_PENDING, dtype=np.int64)
+        self._pending_values = np.empty(MIN_PENDING, dtype=np.uint64)
+        self._pending_count = 0
+
+    def __len__(self):
+        return len(self._keys) + self._pending_count
+
+    def add(self, key, value):
+        self.extend([key], [value])
+
+    def extend(self, keys, values):
+        """Add many entries at once, e.g. when loading the index"""
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values, dtype=np.uint64)
+        with self._lock:
+            count = self._pending_count + len(keys)
+            if count > len(self._pending_keys):
+                capacity = max(count, 2 * len(self._pending_keys))
+                self._pending_keys = np.resize(self._pending_keys, capacity)
+                self._pending_values = np.resize(self._pending_values, capacity)
+            self._pending_keys[self._pending_count:count] = keys
+            self._pending_values[self._pending_count:count] = values
+            self._pending_count = count
+            if count > max(MIN_PENDING, len(self._keys) // PENDING_FRACTION):
+                self._merge()
+
+    def _merge(self):
+        keys = np.concatenate([self._keys, self._pending_keys[:self._pending_count]])
+        values = np.concatenate([self._values, self._pending_values[:self._pending_count]])
+        columns = []
+        for shift, mask in self._blocks:
+            column = (values >> shift) & mask
+            order = np.argsort(column, kind='stable')
+            columns.append((column[order], order))
+        self._keys, self._values, self._columns = keys, values, columns
+        self._pending_count = 0
+
+    def search(self, value, max_distance=None):
+        """
+        Stored entries within ``max_distance`` bits of ``value`` (at most the
+        index's own max_distance), nearest first.
+
+        Returns:
+            list: (distance, key) tuples
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        elif max_distance > self.max_distance:
+            raise ValueError(f"This index answers distances up to {self.max_distance}")
+        query = np.uint64(value)
+
+        with self._lock:
+            candidates = []
+            for (shift, mask), (column, order) in zip(self._blocks, self._columns):
+                part = (query >> shift) & mask
+                start = np.searchsorted(column, part, side='left')
+                end = np.searchsorted(column, part, side='right')
+                if end > start:
+                    candidates.append(order[start:end])
+            # A hash matching on several blocks is a candidate several times; duplicates are dropped below
+            positions = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int64)
+            keys = self._keys[positions]
+            distances = _popcount(self._values[positions] ^ query)
+
+            if self._pending_count:
+                keys = np.concatenate([keys, self._pending_keys[:self._pending_count]])
+                pending = self._pending_values[:self._pending_count]
+                distances = np.concatenate([distances, _popcount(pending ^ query)])
+
+        within = distances <= max_distance
+        return sorted(set(zip(distances[within].tolist(), keys[within].tolist())))
+
+    def nbytes(self):
+        """Approximate memory held by the merged part of the index"""
+        return self._keys.nbytes + self._values.nbytes + sum(
+            column.nbytes + order.nbytes for column, order in self._columns
+        )
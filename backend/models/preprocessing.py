@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Stages import cv2 when they run, so the profiles and stats can be read without it
+
+
+def grayscale(image):
+    if image.ndim == 2:
+        return image
+    import cv2
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def denoise(image, h=3):
+    """Non-local means denoising; by far the most expensive stage"""
+    import cv2
+    return cv2.fastNlMeansDenoising(image, h=h)
+
+
+def median_blur(image, ksize=3):
+    """Cheap alternative to denoise for salt-and-pepper noise"""
+    import cv2
+    return cv2.medianBlur(image, ksize)
+
+
+def clahe(image, clip_limit=2.0, tile_grid_size=8):
+    import cv2
+    return cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile_grid_size, tile_grid_size)).apply(image)
+
+
+def threshold(image, method='combined', block_size=11, c=2):
+    """
+    Binarize a grayscale image.
+
+    Args:
+        method: "otsu", "adaptive" or "combined" (the AND of both)
+    """
+    import cv2
+    if method in ('otsu', 'combined'):
+        _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if method == 'otsu':
+            return binary
+    adaptive = cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                     cv2.THRESH_BINARY, block_size, c)
+    if method == 'adaptive':
+        return adaptive
+    return cv2.bitwise_and(binary, adaptive)
+
+
+def morph_clean(image, kernel_size=2):
+    """Dilate then erode to close small gaps in the glyphs"""
+    import cv2
+    import numpy as np
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    dilated = cv2.dilate(image, kernel, iterations=1)
+    return cv2.erode(dilated, kernel, iterations=1)
+
+
+# Stage name -> function(image, **options) -> image
+STAGES = {
+    'grayscale': grayscale,
+    'denoise': denoise,
+    'median_blur': median_blur,
+    'clahe': clahe,
+    'threshold': threshold,
+    'morph_clean': morph_clean,
+}
+
+# Profile name -> list of (stage name, options)
+DEFAULT_PROFILES = {
+    # The original FoodLabelOCR.preprocess_image chain
+    'quality': [
+        ('grayscale', {}),
+        ('denoise', {}),
+        ('clahe', {}),
+        ('threshold', {'method': 'combined'}),
+        ('morph_clean', {}),
+    ],
+    # No NL-means and a single global threshold
+    'fast': [
+        ('grayscale', {}),
+        ('clahe', {}),
+        ('threshold', {'method': 'otsu'}),
+    ],
+}
+
+
+class PreprocessingPipeline:
+    """An ordered list of named preprocessing stages"""
+
+    def __init__(self, name, stages):
+        unknown = [stage for stage, _ in stages if stage not in STAGES]
+        if unknown:
+            raise ValueError(f"Unknown preprocessing stage(s) in profile '{name}': {', '.join(unknown)}")
+        self.name = name
+        self.stages = [(stage, dict(options)) for stage, options in stages]
+
+    def run(self, image):
+        """
+        Run every stage in order.
+
+        Returns:
+            tuple: (processed image, {stage name: milliseconds})
+        """
+        timings = {}
+        for stage, options in self.stages:
+            started = time.perf_counter()
+            image = STAGES[stage](image, **options)
+            timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+        preprocessing_stats.record(self.name, timings)
+        return image, timings
+
+    def describe(self):
+        return [{'stage': stage, 'options': options} for stage, options in self.stages]
+
+
+def available_profiles():
+    profiles = dict(DEFAULT_PROFILES)
+    profiles.update(getattr(settings, 'PREPROCESSING_PROFILES', {}))
+    return profiles
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_pipeline(profile=None):
+    """
+    Return the pipeline for a profile, building it on first use.
+
+    Args:
+        profile: Profile name; defaults to settings.PREPROCESSING_PROFILE
+
+    Raises:
+        ValueError: if the profile or one of its stages is unknown
+    """
+    profile = profile or getattr(settings, 'PREPROCESSING_PROFILE', 'quality')
+    pipeline = _pipelines.get(profile)
+    if pipeline is None:
+        profiles = available_profiles()
+        if profile not in profiles:
+            raise ValueError(f"Unknown preprocessing profile '{profile}' (available: {', '.join(sorted(profiles))})")
+        with _pipelines_lock:
+            pipeline = _pipelines.setdefault(profile, PreprocessingPipeline(profile, profiles[profile]))
+    return pipeline
+
+
+class PreprocessingStats:
+    """Per-process run counts and average stage latencies for each profile"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = {}
+        self.stage_ms = {}
+
+    def record(self, profile, timings):
+        with self._lock:
+            self.runs[profile] = self.runs.get(profile, 0) + 1
+            totals = self.stage_ms.setdefault(profile, {})
+            for stage, elapsed_ms in timings.items():
+                totals[stage] = totals.get(stage, 0.0) + elapsed_ms
+
+    def stats(self):
+        with self._lock:
+            return {
+                profile: {
+                    'runs': runs,
+                    'avg_total_ms': round(sum(self.stage_ms[profile].values()) / runs, 2),
+                    'avg_stage_ms': {
+                        stage: round(total / runs, 2) for stage, total in self.stage_ms[profile].items()
+                    },
+                }
+                for profile, runs in self.runs.items()
+            }
+
+
+preprocessing_stats = PreprocessingStats()
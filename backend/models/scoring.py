@@ -0,0 +1,180 @@
+import math
+
+from django.conf import settings
+
+from models.model_store import model_store
+
+# Column order the nutrition model (chirag_patil.pkl) was trained on
+NUTRITION_FEATURES = [
+    "Calories",
+    "Protein (g)",
+    "Fats (g)",
+    "Carbohydrates (g)",
+    "Sugars (g)",
+    "Sodium (mg)",
+    "Saturated Fat (g)",
+    "Trans Fat (g)",
+    "Cholesterol (mg)",
+]
+
+# manual-entry / History.nutrition_data keys, in NUTRITION_FEATURES order
+NUTRITION_INPUT_KEYS = [
+    "calories",
+    "protein",
+    "fats",
+    "carbohydrates",
+    "sugar",
+    "sodium",
+    "saturated_fat",
+    "trans_fat",
+    "cholesterol",
+]
+
+
+def nutrition_features_from_input(nutrition_input):
+    """
+    Model features from manual-entry style nutrition data (missing values count as 0).
+
+    Raises:
+        TypeError, ValueError: if a value is not a finite number ("nan" and
+        "inf" parse as floats, but the models cannot score them)
+    """
+    features = {
+        feature: float(nutrition_input.get(key, 0))
+        for feature, key in zip(NUTRITION_FEATURES, NUTRITION_INPUT_KEYS)
+    }
+    for feature, value in features.items():
+        if not math.isfinite(value):
+            raise ValueError(f"{feature} is not a finite number")
+    return features
+
+
+def nutrition_features_from_result(nutrition_result):
+    """Model features from a NutritionResult (None counts as 0)"""
+    return {
+        "Calories": float(nutrition_result.calories or 0),
+        "Protein (g)": float(nutrition_result.protein or 0),
+        "Fats (g)": float(nutrition_result.fats or 0),
+        "Carbohydrates (g)": float(nutrition_result.carbohydrates or 0),
+        "Sugars (g)": float(nutrition_result.sugar or 0),
+        "Sodium (mg)": float(nutrition_result.sodium or 0),
+        "Saturated Fat (g)": float(nutrition_result.saturated_fat_100g or 0),
+        "Trans Fat (g)": float(nutrition_result.trans_fat_100g or 0),
+        "Cholesterol (mg)": float(nutrition_result.cholesterol_100g or 0),
+    }
+
+
+def nutrition_features_from_history(nutrition_data):
+    """Model features from a stored History.nutrition_data dict (None or missing counts as 0)"""
+    return {
+        feature: float(nutrition_data.get(key) or 0)
+        for feature, key in zip(NUTRITION_FEATURES, NUTRITION_INPUT_KEYS)
+    }
+
+
+def ingredients_text_from_history(ingredients_data):
+    """The text the ingredients model scores, rebuilt from History.ingredients_data['raw_data']"""
+    raw_data = ingredients_data.get('raw_data') if isinstance(ingredients_data, dict) else None
+    if isinstance(raw_data, list):
+        return " ".join(str(ingredient) for ingredient in raw_data)
+    return str(raw_data or "")
+
+
+def combined_score(ingredients_score, nutrition_score):
+    """Total product score from the ingredients and nutrition scores"""
+    return ingredients_score + nutrition_score / 2  # Adjust weight as needed
+
+
+class ScoringEngine:
+    """
+    Scores products with one model bundle, any number at a time.
+
+    All ingredient texts go through a single sparse ``vectorizer.transform``
+    and a single forest ``predict``, and all nutrition rows through a single
+    matrix and ``predict``, so scoring N products costs one call per model
+    instead of N. Scores are identical to scoring the products one by one.
+
+    Batches of up to ML_FLAT_FOREST_MAX_ROWS rows are scored on the bundle's
+    flattened forests, which give the same scores without sklearn's per-call
+    validation and joblib dispatch; pandas is only used for larger batches.
+    """
+
+    def __init__(self, bundle=None):
+        self.bundle = bundle or model_store.get()
+
+    @property
+    def version(self):
+        return self.bundle.version
+
+    @staticmethod
+    def _flat_forest(forest, rows):
+        """The flattened forest if there is one and the batch is small enough for it to be faster"""
+        if forest is not None and rows <= getattr(settings, 'ML_FLAT_FOREST_MAX_ROWS', 32):
+            return forest
+        return None
+
+    def score_ingredients(self, ingredients_texts):
+        """
+        Args:
+            ingredients_texts: list of ingredient strings, one per product
+
+        Returns:
+            np.ndarray: ingredients scores (model output x 10)
+        """
+        import numpy as np
+        if not len(ingredients_texts):
+            return np.zeros(0)
+        vectors = self.bundle.vectorizer.transform(list(ingredients_texts))
+        forest = self._flat_forest(self.bundle.ingredients_forest, vectors.shape[0])
+        model = forest if forest is not None else self.bundle.ingredients_model
+        return np.asarray(model.predict(vectors), dtype=float) * 10
+
+    def score_nutrition(self, nutrition_rows):
+        """
+        Args:
+            nutrition_rows: list of {feature name: value} dicts, see NUTRITION_FEATURES
+
+        Returns:
+            np.ndarray: nutrition scores
+        """
+        import numpy as np
+        if not len(nutrition_rows):
+            return np.zeros(0)
+        # Missing features are NaN, as in a DataFrame built from the dicts
+        rows = np.array(
+            [[row.get(feature, np.nan) for feature in NUTRITION_FEATURES] for row in nutrition_rows], dtype=float,
+        )
+        forest = self._flat_forest(self.bundle.nutrition_forest, len(rows))
+        if forest is not None:
+            prediction = forest.predict(rows)
+        else:
+            import pandas as pd
+            prediction = np.asarray(self.bundle.nutrition_model.predict(pd.DataFrame(rows, columns=NUTRITION_FEATURES)))
+
+        if prediction.size == 0:
+            return np.zeros(len(rows))
+        if prediction.ndim == 2:
+            # Either [health_class, nutrition_score] per row or just the score
+            column = 1 if prediction.shape[1] > 1 else 0
+            return prediction[:, column].astype(float)
+        return prediction.astype(float)
+
+    def score(self, ingredients_texts, nutrition_rows):
+        """
+        Score a batch of products.
+
+        Returns:
+            list: one {'ingredients_score', 'nutrition_score', 'total_score'} dict per product
+        """
+        if len(ingredients_texts) != len(nutrition_rows):
+            raise ValueError("ingredients_texts and nutrition_rows must have the same length")
+        ingredients_scores = self.score_ingredients(ingredients_texts)
+        nutrition_scores = self.score_nutrition(nutrition_rows)
+        return [
+            {
+                'ingredients_score': float(ingredients_score),
+                'nutrition_score': float(nutrition_score),
+                'total_score': combined_score(float(ingredients_score), float(nutrition_score)),
+            }
+            for ingredients_score, nutrition_score in zip(ingredients_scores, nutrition_scores)
+        ]
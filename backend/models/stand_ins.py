@@ -0,0 +1,100 @@
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from models.ingrediants_ocr import IngredientExtractor
+from models.nutrition_fact_ocr import FoodLabelOCR
+
+# Local stand-ins for Gemini and the OCR engines, for offline load tests: everything
+# after OCR (Gemini answer parsing, scoring, the database) is the real code
+
+DEFAULT_ANSWERS = {
+    'ingredients': '["wheat flour", "sugar", "palm oil", "salt", "yeast"]',
+    'nutrition': (
+        '{"calories": 450, "protein": 7, "fats": 18, "carbohydrates": 64, "sugar": 22, '
+        '"sodium": 380, "saturated_fat": 8, "trans_fat": 0, "cholesterol": 5}'
+    ),
+    'summary': 'This product is high in sugar and saturated fat; enjoy it occasionally.',
+}
+
+INGREDIENTS_LABEL_TEXT = 'INGREDIENTS: wheat flour, sugar, palm oil, salt, yeast.'
+NUTRITION_LABEL_TEXT = (
+    'Nutrition Facts per 100g\nEnergy 450 kcal\nProtein 7 g\nTotal Fat 18 g\n'
+    'Saturated Fat 8 g\nCarbohydrates 64 g\nSugars 22 g\nSodium 380 mg\nCholesterol 5 mg'
+)
+
+
+class SimulatedGeminiError(Exception):
+    pass
+
+
+class SimulatedGeminiModel:
+    """
+    Stands in for genai.GenerativeModel: canned answers after a fixed latency.
+
+    Args:
+        latency: Seconds each call takes
+        error_rate: Fraction of calls that raise SimulatedGeminiError instead
+        answers: Overrides of DEFAULT_ANSWERS ('ingredients', 'nutrition', 'summary')
+        seed: Seed of the error draws
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, answers=None, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.answers = dict(DEFAULT_ANSWERS, **(answers or {}))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _answer(self, contents):
+        prompt = contents if isinstance(contents, str) else ' '.join(
+            part for part in contents if isinstance(part, str)
+        )
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+        if failed:
+            raise SimulatedGeminiError('Simulated Gemini error')
+
+        if 'nutrition fact expert' in prompt:
+            return SimpleNamespace(text=self.answers['nutrition'])
+        if 'JSON array' in prompt:
+            return SimpleNamespace(text=self.answers['ingredients'])
+        return SimpleNamespace(text=self.answers['summary'])
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.latency)
+        return self._answer(contents)
+
+    async def generate_content_async(self, contents, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._answer(contents)
+
+
+class StubIngredientExtractor(IngredientExtractor):
+    """IngredientExtractor whose OCR returns ``text`` after ``latency`` seconds; no EasyOCR reader is built"""
+
+    def __init__(self, latency=0.0, text=INGREDIENTS_LABEL_TEXT):
+        self.latency = latency
+        self.text = text
+
+    def extract_from_image(self, image):
+        time.sleep(self.latency)
+        return self.text
+
+
+class StubFoodLabelOCR(FoodLabelOCR):
+    """FoodLabelOCR whose label OCR returns ``text`` after ``latency`` seconds; PaddleOCR is not loaded"""
+
+    def __init__(self, latency=0.0, text=NUTRITION_LABEL_TEXT):
+        self.latency = latency
+        self.text = text
+
+    def read_label(self, image, profile=None):
+        time.sleep(self.latency)
+        return self.text
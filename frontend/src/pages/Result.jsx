@@ -11,6 +11,7 @@ export default function Result() {
   const location = useLocation();
   const analysisData = location.state?.analysisData;
   const [bannerOpacity, setBannerOpacity] = useState(1);
+  const [analysisSummary, setAnalysisSummary] = useState(analysisData?.analysis_summary);
 
   // Add banner animation effect
   useEffect(() => {
@@ -21,6 +22,39 @@ export default function Result() {
     return () => clearInterval(interval);
   }, []);
 
+  // The summary is generated after the scores are returned; long-poll for it
+  useEffect(() => {
+    if (!analysisData?.history_id || analysisData.summary_status !== 'pending') {
+      return;
+    }
+    let cancelled = false;
+
+    const fetchSummary = async (attempt) => {
+      try {
+        const response = await fetch(
+          `http://localhost:8000/history/${analysisData.history_id}/summary/?wait=20`,
+          {
+            headers: {
+              'Authorization': `Bearer ${localStorage.getItem('accessToken')}`,
+            },
+          }
+        );
+        const data = await response.json();
+        if (cancelled) return;
+        if (data.success && data.summary_status !== 'pending') {
+          setAnalysisSummary(data.analysis_summary);
+        } else if (attempt < 5) {
+          fetchSummary(attempt + 1);
+        }
+      } catch (error) {
+        console.error('Summary fetch error:', error);
+      }
+    };
+
+    fetchSummary(0);
+    return () => { cancelled = true; };
+  }, [analysisData]);
+
   // Redirect if no data is present
   if (!analysisData) {
     return <Navigate to="/scan" replace />;
@@ -185,7 +219,7 @@ export default function Result() {
               text-transparent bg-clip-text mb-4">
               Analysis Summary
             </h2>
-            <p className="text-gray-600">{analysisData.analysis_summary}</p>
+            <p className="text-gray-600">{analysisSummary || 'Generating analysis...'}</p>
           </div>
 
           {/* Ingredients Analysis */}
@@ -21,6 +21,7 @@ const Scan = () => {
     nutrition: ''
   });
   const [isProcessing, setIsProcessing] = useState(false);
+  const [progressMessage, setProgressMessage] = useState('Analyzing nutritional data...');
   const navigate = useNavigate();
 
   const handleImageUpload = (file, type) => {
@@ -129,6 +130,7 @@ const Scan = () => {
     }
 
     setIsProcessing(true);
+    setProgressMessage('Reading your labels...');
 
     try {
       // Create form data
@@ -136,7 +138,8 @@ const Scan = () => {
       formData.append('nutrition_image', nutritionImage.file);
       formData.append('ingredients_image', ingredientsImage.file);
 
-      const response = await fetch('http://localhost:8000/result_api/', {
+      // Server-Sent Events: each stage is reported as soon as it is done
+      const response = await fetch('http://localhost:8000/result_api/stream/', {
         method: 'POST',
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('accessToken')}`,
@@ -144,14 +147,64 @@ const Scan = () => {
         body: formData
       });
 
-      const data = await response.json();
-
       if (!response.ok) {
+        const data = await response.json();
         throw new Error(data.error || 'Failed to analyze images');
       }
 
-      // Navigate to results page with the data
-      navigate('/result', { state: { analysisData: data } });
+      const progressMessages = {
+        ingredients: 'Ingredients extracted, scoring them...',
+        nutrition: 'Nutrition facts extracted, scoring them...',
+        ingredients_score: 'Ingredients scored...',
+        nutrition_score: 'Nutrition scored...',
+      };
+      const analysisData = { success: true, ingredients: {}, nutrition: {} };
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+          throw new Error('The analysis stream ended early');
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+        for (const frame of frames) {
+          const event = frame.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(frame.match(/^data: (.*)$/m)?.[1] || '{}');
+
+          if (event === 'error') {
+            throw new Error(data.error || 'Failed to analyze images');
+          } else if (event === 'ingredients') {
+            analysisData.ingredients.raw_data = data.raw_data;
+          } else if (event === 'ingredients_score') {
+            analysisData.ingredients.score = data.score;
+          } else if (event === 'nutrition') {
+            analysisData.nutrition.data = data.data;
+          } else if (event === 'nutrition_score') {
+            analysisData.nutrition.score = data.score;
+          } else if (event === 'total_score' && data.history_id) {
+            // Everything the result page shows up front; it fetches the summary itself
+            analysisData.total_score = data.score;
+            analysisData.history_id = data.history_id;
+            analysisData.analysis_summary = null;
+            analysisData.summary_status = 'pending';
+            reader.cancel();
+            navigate('/result', { state: { analysisData } });
+            return;
+          } else if (event === 'result') {
+            // Unsaved scans carry their summary in the final result instead
+            navigate('/result', { state: { analysisData: data } });
+            return;
+          }
+          if (progressMessages[event]) {
+            setProgressMessage(progressMessages[event]);
+          }
+        }
+      }
     } catch (error) {
       console.error('Analysis error:', error);
       alert('Failed to analyze images. Please try again.');
@@ -177,7 +230,7 @@ const Scan = () => {
             <div className="h-full w-1/2 bg-[#FF4081] rounded-full 
               animate-[progressBar_1.5s_ease-in-out_infinite]" />
           </div>
-          <div className="text-sm text-gray-500">Analyzing nutritional data...</div>
+          <div className="text-sm text-gray-500">{progressMessage}</div>
         </div>
       </div>
     );